@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import csv
+import ipaddress
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+from pathlib import Path
+from typing import NamedTuple
+
+from app._typing import IPAddress
+
+
+class IPLocation(NamedTuple):
+    country: str  # iso 3166-1 alpha-2, lowercase
+    latitude: float
+    longitude: float
+
+
+def _parse_ip(value: str) -> int:
+    """Parse an ip address from either its integer or string form."""
+    if value.isdigit():
+        return int(value)
+
+    return int(ipaddress.ip_address(value))
+
+
+class CSVLayout(NamedTuple):
+    """The columns of a csv's rows holding each part of a location."""
+
+    country: int
+    latitude: int | None = None
+    longitude: int | None = None
+
+
+# `start,end,country[,latitude,longitude]`
+GENERIC_LAYOUT = CSVLayout(country=2, latitude=3, longitude=4)
+# `start,end,country`
+DBIP_COUNTRY_LAYOUT = CSVLayout(country=2)
+# `start,end,continent,country,stateprov,city,latitude,longitude`
+DBIP_CITY_LAYOUT = CSVLayout(country=3, latitude=6, longitude=7)
+# `start,end,country,country_name[,region,city]` (DB1 & DB3)
+IP2LOCATION_COUNTRY_LAYOUT = CSVLayout(country=2)
+# `start,end,country,country_name,region,city,latitude,longitude[,...]` (DB5+)
+IP2LOCATION_CITY_LAYOUT = CSVLayout(country=2, latitude=6, longitude=7)
+
+
+def _is_country_code(value: str) -> bool:
+    return len(value) == 2 and value.isalpha()
+
+
+def detect_layout(row: Sequence[str]) -> CSVLayout:
+    """Detect a csv's layout from one of its (non-header) rows."""
+    if len(row) == 3:
+        # db-ip's country lite database
+        return DBIP_COUNTRY_LAYOUT
+
+    if len(row) == 5:
+        return GENERIC_LAYOUT
+
+    if len(row) == 8 and _is_country_code(row[2]) and _is_country_code(row[3]):
+        # db-ip's city lite database; the continent's code precedes the country's
+        return DBIP_CITY_LAYOUT
+
+    if len(row) >= 4 and not _is_country_code(row[3]):
+        # ip2location's lite databases; the country's name follows its code
+        if len(row) >= 8:
+            return IP2LOCATION_CITY_LAYOUT
+        return IP2LOCATION_COUNTRY_LAYOUT
+
+    raise ValueError(f"Unrecognized ip range csv row: {','.join(row)!r}")
+
+
+class IPRangeDatabase:
+    """\
+    An offline ip geolocation database, loaded from a csv of ip ranges.
+
+    Each row starts with `start,end`, which are inclusive, and are either
+    ip addresses or their integer representations. The columns following
+    them are detected from the first row (see `detect_layout`); the lite
+    csvs of db-ip (country & city) and ip2location (DB1, DB3, DB5 & up)
+    are supported, as is `start,end,country[,latitude,longitude]`. Rows
+    whose country isn't a 2 letter code (such as unallocated ranges
+    marked "-") are skipped.
+
+    The ranges are kept as sorted arrays of their bounds, so a lookup
+    is a binary search; ipv4 bounds are packed into 32-bit arrays.
+    """
+
+    def __init__(self) -> None:
+        self._v4_starts = array("I")
+        self._v4_ends = array("I")
+        self._v4_locations: list[IPLocation] = []
+
+        # ipv6 addresses don't fit any array typecode.
+        self._v6_starts: list[int] = []
+        self._v6_ends: list[int] = []
+        self._v6_locations: list[IPLocation] = []
+
+    def __len__(self) -> int:
+        return len(self._v4_locations) + len(self._v6_locations)
+
+    @classmethod
+    def from_csv(cls, path: Path) -> IPRangeDatabase:
+        """\
+        Load the database from the csv file at `path`.
+
+        Raises `ValueError` if the file's layout isn't recognized, or
+        any of its rows can't be parsed.
+        """
+        v4_ranges: list[tuple[int, int, IPLocation]] = []
+        v6_ranges: list[tuple[int, int, IPLocation]] = []
+
+        # many ranges share a location; keep one copy of each.
+        locations: dict[IPLocation, IPLocation] = {}
+
+        layout: CSVLayout | None = None
+
+        with path.open(newline="") as file:
+            reader = csv.reader(file)
+            for row in reader:
+                if layout is None:
+                    if len(row) < 3:
+                        continue
+
+                    try:
+                        _parse_ip(row[0])
+                    except ValueError:
+                        continue  # header
+
+                    layout = detect_layout(row)
+
+                try:
+                    country = row[layout.country]
+                    if not _is_country_code(country):
+                        continue  # unallocated range
+
+                    location = IPLocation(
+                        country=country.lower(),
+                        latitude=(
+                            float(row[layout.latitude])
+                            if layout.latitude is not None
+                            else 0.0
+                        ),
+                        longitude=(
+                            float(row[layout.longitude])
+                            if layout.longitude is not None
+                            else 0.0
+                        ),
+                    )
+                    start, end = _parse_ip(row[0]), _parse_ip(row[1])
+                except (IndexError, ValueError) as exc:
+                    raise ValueError(
+                        f"{path}:{reader.line_num}: invalid ip range ({exc})",
+                    ) from exc
+
+                location = locations.setdefault(location, location)
+                if ":" in row[0] or end > 0xFFFFFFFF:
+                    v6_ranges.append((start, end, location))
+                else:
+                    v4_ranges.append((start, end, location))
+
+        v4_ranges.sort(key=lambda ip_range: ip_range[0])
+        v6_ranges.sort(key=lambda ip_range: ip_range[0])
+
+        database = cls()
+        for start, end, location in v4_ranges:
+            database._v4_starts.append(start)
+            database._v4_ends.append(end)
+            database._v4_locations.append(location)
+
+        for start, end, location in v6_ranges:
+            database._v6_starts.append(start)
+            database._v6_ends.append(end)
+            database._v6_locations.append(location)
+
+        return database
+
+    def lookup(self, ip: IPAddress) -> IPLocation | None:
+        """Find the location of `ip`, if it's within a known range."""
+        starts: Sequence[int]
+        ends: Sequence[int]
+        if ip.version == 4:
+            starts, ends = self._v4_starts, self._v4_ends
+            locations = self._v4_locations
+        else:
+            starts, ends = self._v6_starts, self._v6_ends
+            locations = self._v6_locations
+
+        value = int(ip)
+        index = bisect_right(starts, value) - 1
+        if index < 0 or value > ends[index]:
+            return None
+
+        return locations[index]
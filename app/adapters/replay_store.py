@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import hashlib
+import lzma
+import os
+import struct
+import sys
+import threading
+from collections.abc import Generator
+from enum import IntEnum
+from pathlib import Path
+from typing import IO
+from typing import Any
+from typing import NamedTuple
+from typing import Protocol
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+# the size of the chunks in which replays are streamed.
+CHUNK_SIZE = 64 * 1024
+
+# score id, segment, offset, stored length, raw length, codec, digest
+_INDEX_RECORD = struct.Struct("<qIQIIB32s")
+
+_INDEX_FILENAME = "index.bin"
+_LOCK_FILENAME = "lock"
+
+
+class Codec(IntEnum):
+    NONE = 0
+    LZMA = 1
+    ZSTD = 2
+
+
+class ReplayLocation(NamedTuple):
+    segment: int
+    offset: int
+    stored_length: int
+    raw_length: int
+    codec: Codec
+    digest: bytes
+
+
+def _lock_exclusive(file: IO[Any]) -> bool:
+    """Lock an open file for this process, if it isn't already locked."""
+    try:
+        if sys.platform == "win32":
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+
+    return True
+
+
+class _Decompressor(Protocol):
+    def decompress(self, data: bytes) -> bytes: ...
+
+
+def _zstandard() -> Any:
+    """Import the (optional) zstandard package."""
+    try:
+        import zstandard
+    except ModuleNotFoundError:
+        raise RuntimeError(
+            "zstd replay compression requires the `zstandard` package",
+        ) from None
+
+    return zstandard
+
+
+def _compress(codec: Codec, data: bytes) -> bytes:
+    if codec is Codec.LZMA:
+        return lzma.compress(data, preset=6)
+    elif codec is Codec.ZSTD:
+        return _zstandard().ZstdCompressor(level=10).compress(data)  # type: ignore[no-any-return]
+    else:
+        return data
+
+
+def _decompressor(codec: Codec) -> _Decompressor | None:
+    if codec is Codec.LZMA:
+        return lzma.LZMADecompressor()
+    elif codec is Codec.ZSTD:
+        return _zstandard().ZstdDecompressor().decompressobj()  # type: ignore[no-any-return]
+    else:
+        return None
+
+
+class ReplayStore:
+    """\
+    An append-only store of replays, packed into segment files.
+
+    Rather than a file per score, replays are appended to the current
+    segment file (a new one is started once it reaches `segment_max_bytes`),
+    and their locations are appended to an index file of fixed size records,
+    which is read into memory when the store is opened. Identical replays
+    are only stored once, and may be recompressed (with lzma or zstd) when
+    doing so makes them smaller.
+
+    Writes are serialized by a lock; reads use positional reads (where
+    supported), so any number of threads may read from the store
+    concurrently. Only a single
+    process may have the store open at a time; opening a store which is
+    open elsewhere raises `RuntimeError`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        compression: Codec = Codec.NONE,
+        segment_max_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        if compression is Codec.ZSTD:
+            _zstandard()  # fail early, rather than on the first write
+
+        self.path = path
+        self.compression = compression
+        self.segment_max_bytes = segment_max_bytes
+
+        self._locations: dict[int, ReplayLocation] = {}
+        self._digests: dict[bytes, ReplayLocation] = {}
+
+        self._write_lock = threading.Lock()
+        self._fds_lock = threading.Lock()
+        self._read_fds: dict[int, int] = {}
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock_file = (self.path / _LOCK_FILENAME).open("a+b")
+        if not _lock_exclusive(self._lock_file):
+            self._lock_file.close()
+            raise RuntimeError(
+                f"The replay store at {self.path} is in use by another process",
+            ) from None
+
+        self._load_index()
+
+        self._segment = max(
+            (int(p.stem) for p in self.path.glob("*.seg") if p.stem.isdigit()),
+            default=0,
+        )
+        self._segment_file = self._segment_path(self._segment).open("ab")
+        self._index_file = (self.path / _INDEX_FILENAME).open("ab")
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path / f"{segment:08d}.seg"
+
+    def _load_index(self) -> None:
+        index_path = self.path / _INDEX_FILENAME
+        if not index_path.exists():
+            return
+
+        data = index_path.read_bytes()
+        segment_sizes: dict[int, int] = {}
+
+        valid_length = len(data) - len(data) % _INDEX_RECORD.size
+        for (
+            score_id,
+            segment,
+            offset,
+            stored_length,
+            raw_length,
+            codec,
+            digest,
+        ) in _INDEX_RECORD.iter_unpack(data[:valid_length]):
+            if segment not in segment_sizes:
+                segment_path = self._segment_path(segment)
+                segment_sizes[segment] = (
+                    segment_path.stat().st_size if segment_path.exists() else 0
+                )
+
+            # the replay's data was lost (e.g. an unclean shutdown)
+            if offset + stored_length > segment_sizes[segment]:
+                continue
+
+            location = ReplayLocation(
+                segment,
+                offset,
+                stored_length,
+                raw_length,
+                Codec(codec),
+                digest,
+            )
+            self._locations[score_id] = location
+            self._digests[digest] = location
+
+        if valid_length != len(data):
+            # a record was partially written; drop it
+            with index_path.open("r+b") as f:
+                f.truncate(valid_length)
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __contains__(self, score_id: int) -> bool:
+        return score_id in self._locations
+
+    def locate(self, score_id: int) -> ReplayLocation | None:
+        return self._locations.get(score_id)
+
+    def put(self, score_id: int, data: bytes) -> ReplayLocation:
+        """Store the replay of a score, replacing any previous one."""
+        digest = hashlib.blake2b(data, digest_size=32).digest()
+
+        with self._write_lock:
+            location = self._digests.get(digest)
+
+            if location is None:
+                stored = data
+                codec = Codec.NONE
+                if self.compression is not Codec.NONE:
+                    compressed = _compress(self.compression, data)
+                    if len(compressed) < len(data):
+                        stored = compressed
+                        codec = self.compression
+
+                offset = self._segment_file.tell()
+                if offset and offset + len(stored) > self.segment_max_bytes:
+                    self._segment_file.close()
+                    self._segment += 1
+                    self._segment_file = self._segment_path(self._segment).open("ab")
+                    offset = 0
+
+                # the data is written before its index record, so a record
+                # is never read back without the data it refers to.
+                self._segment_file.write(stored)
+                self._segment_file.flush()
+
+                location = ReplayLocation(
+                    self._segment,
+                    offset,
+                    len(stored),
+                    len(data),
+                    codec,
+                    digest,
+                )
+                self._digests[digest] = location
+
+            self._index_file.write(_INDEX_RECORD.pack(score_id, *location))
+            self._index_file.flush()
+            self._locations[score_id] = location
+
+        return location
+
+    def _read_fd(self, segment: int) -> int:
+        with self._fds_lock:
+            fd = self._read_fds.get(segment)
+            if fd is None:
+                fd = os.open(
+                    self._segment_path(segment),
+                    os.O_RDONLY | getattr(os, "O_BINARY", 0),
+                )
+                self._read_fds[segment] = fd
+            return fd
+
+    def _pread(self, location: ReplayLocation, size: int, offset: int) -> bytes:
+        fd = self._read_fd(location.segment)
+        if sys.platform == "win32":
+            # no positional reads; seek & read under the lock instead
+            with self._fds_lock:
+                os.lseek(fd, location.offset + offset, os.SEEK_SET)
+                return os.read(fd, size)
+
+        return os.pread(fd, size, location.offset + offset)
+
+    def get(self, score_id: int) -> bytes | None:
+        """Read the whole replay of a score."""
+        location = self._locations.get(score_id)
+        if location is None:
+            return None
+
+        return b"".join(self.iter_chunks(location))
+
+    def iter_chunks(
+        self,
+        location: ReplayLocation,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> Generator[bytes, None, None]:
+        """Read a replay in chunks, decompressing them as they're read."""
+        decompressor = _decompressor(location.codec)
+
+        for offset in range(0, location.stored_length, chunk_size):
+            size = min(chunk_size, location.stored_length - offset)
+            chunk = self._pread(location, size, offset)
+
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            if chunk:
+                yield chunk
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._segment_file.close()
+            self._index_file.close()
+
+        with self._fds_lock:
+            for fd in self._read_fds.values():
+                os.close(fd)
+            self._read_fds.clear()
+
+        # closing the file releases its lock
+        self._lock_file.close()
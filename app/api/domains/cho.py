@@ -7,6 +7,7 @@ import hashlib
 import re
 import struct
 import time
+from collections.abc import Awaitable
 from collections.abc import Callable
 from collections.abc import Mapping
 from datetime import date
@@ -14,10 +15,10 @@ from datetime import datetime
 from pathlib import Path
 from typing import Literal
 from typing import TypedDict
+from typing import TypeVar
 from zoneinfo import ZoneInfo
 
 from app.bg_loops import OSU_CLIENT_MIN_PING_INTERVAL
-import bcrypt
 from fastapi import APIRouter
 from fastapi import Response
 from fastapi.param_functions import Header
@@ -27,6 +28,7 @@ from fastapi.responses import HTMLResponse
 import app.packets
 import app.settings
 import app.state
+import app.usecases.password_hashing
 import app.usecases.performance
 import app.utils
 from app import commands
@@ -67,11 +69,10 @@ from app.repositories import ingame_logins as logins_repo
 from app.repositories import mail as mail_repo
 from app.repositories import scores_suspicion
 from app.repositories import users as users_repo
-from app.state import services
 from app.usecases import anticheat
 from app.usecases.performance import ScoreParams
 
-OSU_API_V2_CHANGELOG_URL = "https://osu.ppy.sh/api/v2/changelog"
+T = TypeVar("T")
 
 BEATMAPS_PATH = Path.cwd() / ".data/osu"
 DISK_CHAT_LOG_FILE = ".data/logs/chat.log"
@@ -277,13 +278,28 @@ async def bancho_handler(
     # allowing logic to be implemented around the actual handler.
     # NOTE: any unhandled packets will be ignored internally.
 
+    packet_stats = app.state.packet_stats
+    packet_count = 0
+
     with memoryview(await request.body()) as body_view:
-        for packet in BanchoPacketReader(body_view, packet_map):
+        reader = BanchoPacketReader(body_view, packet_map, packet_stats)
+        for packet in reader:
+            start_time = time.perf_counter_ns()
             await packet.handle(player)
+            packet_stats.record_handle_time(
+                reader.current_type,
+                time.perf_counter_ns() - start_time,
+            )
+            packet_count += 1
 
     player.last_recv_time = time.time()
+    app.state.sessions.timeouts.schedule(
+        player,
+        player.last_recv_time + OSU_CLIENT_MIN_PING_INTERVAL,
+    )
 
     response_data = player.dequeue()
+    packet_stats.record_request(packet_count, len(response_data or b""))
 
     # ppy.sb feature
     resp = Response(content=response_data)
@@ -349,10 +365,10 @@ class ChangeAction(BasePacket):
         player.status.mods = Mods(self.mods)
         player.status.mode = GameMode(self.mode)
         player.status.map_id = self.map_id
+        player.bump_presence_version()
 
         # broadcast it to all online players.
-        if not player.restricted:
-            app.state.sessions.players.enqueue(app.packets.user_stats(player))
+        app.state.sessions.stats_broadcaster.schedule(player)
 
 
 IGNORED_CHANNELS: list[str] = ["#highlight", "#userlog"]
@@ -615,47 +631,6 @@ def parse_osu_version_string(osu_version_string: str) -> OsuVersion | None:
     return osu_version
 
 
-async def get_allowed_client_versions(osu_stream: OsuStream) -> set[date] | None:
-    """
-    Return a list of acceptable client versions for the given stream.
-
-    This is used to determine whether a client is too old to connect to the server.
-
-    Returns None if the connection to the osu! api fails.
-    """
-    osu_stream_strs = []
-    allowed_client_versions: set[date] = set()
-
-    if osu_stream == OsuStream.STABLE:
-        osu_stream_strs.append(osu_stream.value + "40")  # i wonder why this exists
-    elif osu_stream == OsuStream.TOURNEY:
-        # osu!tourney clients are allowed to connect with any version
-        osu_stream_strs.append("stable40")
-        osu_stream_strs.append("cuttingedge")
-
-    for osu_stream_str in osu_stream_strs:
-        response = await services.http_client.get(
-            OSU_API_V2_CHANGELOG_URL,
-            params={"stream": osu_stream_str},
-        )
-        if not response.is_success:
-            return None
-
-        for build in response.json()["builds"]:
-            version = date(
-                int(build["version"][0:4]),
-                int(build["version"][4:6]),
-                int(build["version"][6:8]),
-            )
-            allowed_client_versions.add(version)
-            if any(entry["major"] for entry in build["changelog_entries"]):
-                # this build is a major iteration to the client
-                # don't allow anything older than this
-                break
-
-    return allowed_client_versions
-
-
 def parse_adapters_string(adapters_string: str) -> tuple[list[str], bool]:
     running_under_wine = adapters_string == "runningunderwine"
     adapters = adapters_string[:-1].split(".")
@@ -692,8 +667,11 @@ async def authenticate(
     if trusted_hashword in app.state.cache.bcrypt:  # ~0.01 ms
         if untrusted_password != app.state.cache.bcrypt[trusted_hashword]:
             return None
-    else:  # ~200ms
-        if not bcrypt.checkpw(untrusted_password, trusted_hashword):
+    else:  # ~200ms, off of the event loop
+        if not await app.usecases.password_hashing.checkpw(
+            untrusted_password,
+            trusted_hashword,
+        ):
             return None
 
         app.state.cache.bcrypt[trusted_hashword] = untrusted_password
@@ -701,6 +679,23 @@ async def authenticate(
     return user_info
 
 
+async def _timed_login_stage(stage: str, awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, recording its wall time as a stage of login."""
+    start_time = time.perf_counter_ns()
+    try:
+        return await awaitable
+    finally:
+        elapsed_us = (time.perf_counter_ns() - start_time) // 1000
+        app.state.login_stage_times[stage].record(elapsed_us)
+
+        if app.state.services.datadog:
+            app.state.services.datadog.histogram(f"bancho.login_stage.{stage}", elapsed_us / 1000)  # type: ignore[no-untyped-call]
+
+
+async def _noop_stage(value: T) -> T:
+    return value
+
+
 async def handle_osu_login_request(
     headers: Mapping[str, str],
     body: bytes,
@@ -762,31 +757,24 @@ async def handle_osu_login_request(
 
     # bypassed client should not be figured of old clients
     if not bypass and app.settings.DISALLOW_OLD_CLIENTS:
-        osu_client_stream = osu_version.stream.value
-        if osu_client_stream in ("stable", "beta"):
-            osu_client_stream += "40"  # TODO: why?
-
-        allowed_client_versions = set()
-
-        # TODO: put this behind a layer of abstraction
-        #       for better handling of the error cases
-        response = await services.http_client.get(
-            OSU_API_V2_CHANGELOG_URL,
-            params={"stream": osu_client_stream},
+        # these are refreshed in the background (see `app.bg_loops`);
+        # until they've first been fetched, logins can't be verified.
+        allowed_client_versions = app.state.cache.allowed_client_versions.get(
+            osu_version.stream,
         )
-        response.raise_for_status()
-        for build in response.json()["builds"]:
-            version = date(
-                int(build["version"][0:4]),
-                int(build["version"][4:6]),
-                int(build["version"][6:8]),
-            )
-            allowed_client_versions.add(version)
 
-            if any(entry["major"] for entry in build["changelog_entries"]):
-                # this build is a major iteration to the client
-                # don't allow anything older than this
-                break
+        if allowed_client_versions is None:
+            log(
+                f"Rejected {login_data['username']}'s login; the allowed "
+                f"{osu_version.stream} client versions haven't been fetched.",
+                Ansi.LRED,
+            )
+            return {
+                "osu_token": "invalid-request",
+                "response_body": app.packets.notification(
+                    "Your osu! client's version couldn't be verified. Please try again later."
+                ),
+            }
 
         if osu_version.date not in allowed_client_versions:
             return {
@@ -846,7 +834,10 @@ async def handle_osu_login_request(
             player.logout()
             del player
 
-    user_info = await authenticate(login_data["username"], login_data["password_md5"])
+    user_info = await _timed_login_stage(
+        "authenticate",
+        authenticate(login_data["username"], login_data["password_md5"]),
+    )
     if user_info is None:
         return {
             "osu_token": "incorrect-credentials",
@@ -869,19 +860,25 @@ async def handle_osu_login_request(
 
     """ login credentials verified """
 
-    await logins_repo.create(
-        user_id=user_info["id"],
-        ip=str(ip),
-        osu_ver=osu_version.date,
-        osu_stream=osu_version.stream,
+    # audit logs; nothing below depends on these, so they're written
+    # in the background (the hardware match query excludes the user).
+    app.state.loop.create_task(  # type: ignore[unused-awaitable]
+        logins_repo.create(
+            user_id=user_info["id"],
+            ip=str(ip),
+            osu_ver=osu_version.date,
+            osu_stream=osu_version.stream,
+        ),
     )
 
-    await client_hashes_repo.create(
-        userid=user_info["id"],
-        osupath=login_data["osu_path_md5"],
-        adapters=login_data["adapters_md5"],
-        uninstall_id=login_data["uninstall_md5"],
-        disk_serial=login_data["disk_signature_md5"],
+    app.state.loop.create_task(  # type: ignore[unused-awaitable]
+        client_hashes_repo.create(
+            userid=user_info["id"],
+            osupath=login_data["osu_path_md5"],
+            adapters=login_data["adapters_md5"],
+            uninstall_id=login_data["uninstall_md5"],
+            disk_serial=login_data["disk_signature_md5"],
+        ),
     )
 
     # TODO: store adapters individually
@@ -898,12 +895,87 @@ async def handle_osu_login_request(
     else:
         disk_signature_md5 = None
 
-    hw_matches = await client_hashes_repo.fetch_any_hardware_matches_for_user(
-        userid=user_info["id"],
-        running_under_wine=running_under_wine,
-        adapters=login_data["adapters_md5"],
-        uninstall_id=login_data["uninstall_md5"],
-        disk_serial=disk_signature_md5,
+    # get clan & clan priv if we're in a clan
+    clan_id: int | None = None
+    clan_priv: ClanPrivileges | None = None
+    if user_info["clan_id"] != 0:
+        clan_id = user_info["clan_id"]
+        clan_priv = ClanPrivileges(user_info["clan_priv"])
+
+    client_details = ClientDetails(
+        osu_version=osu_version,
+        osu_path_md5=login_data["osu_path_md5"],
+        adapters_md5=login_data["adapters_md5"],
+        uninstall_md5=login_data["uninstall_md5"],
+        disk_signature_md5=login_data["disk_signature_md5"],
+        adapters=adapters,
+        ip=ip,
+    )
+
+    # NOTE: the player's geolocation is filled in below;
+    # they're not visible to anyone else until they're
+    # added to the global player list.
+    player = Player(
+        id=user_info["id"],
+        name=user_info["name"],
+        priv=Privileges(user_info["priv"]),
+        pw_bcrypt=user_info["pw_bcrypt"].encode(),
+        token=Player.generate_token(),
+        clan_id=clan_id,
+        clan_priv=clan_priv,
+        utc_offset=login_data["utc_offset"],
+        pm_private=login_data["pm_private"],
+        silence_end=user_info["silence_end"],
+        donor_end=user_info["donor_end"],
+        client_details=client_details,
+        login_time=login_time,
+        is_tourney_client=osu_version.stream == "tourney",
+        api_key=user_info["api_key"],
+    )
+
+    # the remaining lookups are independent of one another, so run
+    # them all concurrently; the checks on their results are made
+    # afterwards, in the same order as they'd be made sequentially.
+    (
+        hw_matches,
+        geoloc,
+        _,
+        _,
+        mail_rows,
+        is_frozen,
+    ) = await asyncio.gather(
+        _timed_login_stage(
+            "hardware_matches",
+            client_hashes_repo.fetch_any_hardware_matches_for_user(
+                userid=user_info["id"],
+                running_under_wine=running_under_wine,
+                adapters=login_data["adapters_md5"],
+                uninstall_id=login_data["uninstall_md5"],
+                disk_serial=disk_signature_md5,
+            ),
+        ),
+        _timed_login_stage(
+            "geolocation",
+            app.state.services.fetch_geoloc(ip, headers),
+        ),
+        _timed_login_stage("stats", player.stats_from_sql_full()),
+        _timed_login_stage("relationships", player.relationships_from_sql()),
+        _timed_login_stage(
+            "unread_mail",
+            (
+                mail_repo.fetch_all_mail_to_user(user_id=player.id, read=False)
+                if not player.restricted
+                else _noop_stage([])
+            ),
+        ),
+        _timed_login_stage(
+            "suspicion",
+            (
+                scores_suspicion.has_suspicion(player.id)
+                if player.restricted
+                else _noop_stage(False)
+            ),
+        ),
     )
 
     if hw_matches:
@@ -935,17 +1007,8 @@ async def handle_osu_login_request(
 
     """ All checks passed, player is safe to login """
 
-    # get clan & clan priv if we're in a clan
-    clan_id: int | None = None
-    clan_priv: ClanPrivileges | None = None
-    if user_info["clan_id"] != 0:
-        clan_id = user_info["clan_id"]
-        clan_priv = ClanPrivileges(user_info["clan_priv"])
-
     db_country = user_info["country"]
 
-    geoloc = await app.state.services.fetch_geoloc(ip, headers)
-
     if geoloc is None:
         return {
             "osu_token": "login-failed",
@@ -967,34 +1030,8 @@ async def handle_osu_login_request(
             country=geoloc["country"]["acronym"],
         )
 
-    client_details = ClientDetails(
-        osu_version=osu_version,
-        osu_path_md5=login_data["osu_path_md5"],
-        adapters_md5=login_data["adapters_md5"],
-        uninstall_md5=login_data["uninstall_md5"],
-        disk_signature_md5=login_data["disk_signature_md5"],
-        adapters=adapters,
-        ip=ip,
-    )
-
-    player = Player(
-        id=user_info["id"],
-        name=user_info["name"],
-        priv=Privileges(user_info["priv"]),
-        pw_bcrypt=user_info["pw_bcrypt"].encode(),
-        token=Player.generate_token(),
-        clan_id=clan_id,
-        clan_priv=clan_priv,
-        geoloc=geoloc,
-        utc_offset=login_data["utc_offset"],
-        pm_private=login_data["pm_private"],
-        silence_end=user_info["silence_end"],
-        donor_end=user_info["donor_end"],
-        client_details=client_details,
-        login_time=login_time,
-        is_tourney_client=osu_version.stream == "tourney",
-        api_key=user_info["api_key"],
-    )
+    player.geoloc = geoloc
+    player.bump_presence_version()  # their presence includes their location
 
     data = bytearray(app.packets.protocol_version(19))
     data += app.packets.login_reply(player.id)
@@ -1039,11 +1076,6 @@ async def handle_osu_login_request(
     # tells osu! to reorder channels based on config.
     data += app.packets.channel_info_end()
 
-    # fetch some of the player's
-    # information from sql to be cached.
-    await player.stats_from_sql_full()
-    await player.relationships_from_sql()
-
     # TODO: fetch player.recent_scores from sql
 
     data += app.packets.main_menu_icon(
@@ -1064,24 +1096,11 @@ async def handle_osu_login_request(
             # enqueue us to them
             o.enqueue(user_data)
 
-            # enqueue them to us.
-            if not o.restricted:
-                if o is app.state.sessions.bot:
-                    # optimization for bot since it's
-                    # the most frequently requested user
-                    data += app.packets.bot_presence(o)
-                    data += app.packets.bot_stats(o)
-                else:
-                    data += app.packets.user_presence(o)
-                    data += app.packets.user_stats(o)
+        # enqueue them to us.
+        data += app.state.sessions.roster.serialize()
 
         # the player may have been sent mail while offline,
         # enqueue any messages from their respective authors.
-        mail_rows = await mail_repo.fetch_all_mail_to_user(
-            user_id=player.id,
-            read=False,
-        )
-
         for msg in mail_rows:
             msg_time = datetime.fromtimestamp(msg["time"])
             data += app.packets.send_message(
@@ -1116,19 +1135,9 @@ async def handle_osu_login_request(
             )
 
     else:
-        is_frozen = await scores_suspicion.has_suspicion(player.id)
-
         # player is restricted, one way data
-        for o in app.state.sessions.players.unrestricted:
-            # enqueue them to us.
-            if o is app.state.sessions.bot:
-                # optimization for bot since it's
-                # the most frequently requested user
-                data += app.packets.bot_presence(o)
-                data += app.packets.bot_stats(o)
-            else:
-                data += app.packets.user_presence(o)
-                data += app.packets.user_stats(o)
+        # enqueue them to us.
+        data += app.state.sessions.roster.serialize()
 
         data += app.packets.account_restricted()
         data += app.packets.send_message(
@@ -1149,12 +1158,18 @@ async def handle_osu_login_request(
     # add `p` to the global player list,
     # making them officially logged in.
     app.state.sessions.players.append(player)
+    app.state.sessions.timeouts.schedule(
+        player,
+        player.last_recv_time + OSU_CLIENT_MIN_PING_INTERVAL,
+    )
+
+    time_taken = time.time() - login_time
+    app.state.login_stage_times["total"].record(int(time_taken * 1_000_000))
 
     if app.state.services.datadog:
         if not player.restricted:
             app.state.services.datadog.increment("bancho.online_players")  # type: ignore[no-untyped-call]
 
-        time_taken = time.time() - login_time
         app.state.services.datadog.histogram("bancho.login_time", time_taken)  # type: ignore[no-untyped-call]
 
     user_os = "unix (wine)" if running_under_wine else "win32"
@@ -2252,14 +2267,14 @@ class StatsRequest(BasePacket):
         self.user_ids = reader.read_i32_list_i16l()
 
     async def handle(self, player: Player) -> None:
-        unrestrcted_ids = [p.id for p in app.state.sessions.players.unrestricted]
+        unrestricted = app.state.sessions.players.unrestricted
 
-        def is_online(o: int) -> bool:
-            return o in unrestrcted_ids and o != player.id
+        for online in self.user_ids:
+            if online == player.id:
+                continue
 
-        for online in filter(is_online, self.user_ids):
             target = app.state.sessions.players.get(id=online)
-            if target:
+            if target is not None and target in unrestricted:
                 if target is app.state.sessions.bot:
                     # optimization for bot since it's
                     # the most frequently requested user
@@ -2348,8 +2363,8 @@ class UserPresenceRequestAll(BasePacket):
 
         buffer = bytearray()
 
-        for player in app.state.sessions.players.unrestricted:
-            buffer += app.packets.user_presence(player)
+        for target in app.state.sessions.players.unrestricted:
+            buffer += app.packets.user_presence(target)
 
         player.enqueue(bytes(buffer))
 
@@ -20,7 +20,6 @@ from typing import Literal
 from urllib.parse import unquote
 from urllib.parse import unquote_plus
 
-import bcrypt
 from fastapi import status
 from fastapi.datastructures import FormData
 from fastapi.datastructures import UploadFile
@@ -36,6 +35,7 @@ from fastapi.responses import FileResponse
 from fastapi.responses import ORJSONResponse
 from fastapi.responses import RedirectResponse
 from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRouter
 from starlette.datastructures import UploadFile as StarletteUploadFile
 
@@ -43,6 +43,9 @@ import app.packets
 import app.settings
 import app.state
 from app.usecases.sb.osu_submit_modular_context import OsuSubmitModularContext, OsuSubmitModularRaw
+import app.usecases.password_hashing
+import app.usecases.replays
+import app.usecases.user_stats
 import app.utils
 from app import encryption
 from app._typing import UNSET
@@ -57,13 +60,17 @@ from app.objects import models
 from app.objects.beatmap import Beatmap
 from app.objects.beatmap import RankedStatus
 from app.objects.beatmap import ensure_osu_file_is_available
+from app.objects.leaderboard import Leaderboard
+from app.objects.leaderboard import LeaderboardKey
+from app.objects.leaderboard import LeaderboardScore
+from app.objects.leaderboard import LeaderboardView
+from app.objects.leaderboard import RenderedScores
 from app.objects.player import OsuStream
 from app.objects.player import Player
 from app.objects.player import Privileges
 from app.objects.score import Grade
 from app.objects.score import Score
 from app.objects.score import SubmissionStatus
-from app.repositories import clans as clans_repo
 from app.repositories import comments as comments_repo
 from app.repositories import favourites as favourites_repo
 from app.repositories import mail as mail_repo
@@ -75,13 +82,13 @@ from app.repositories import users as users_repo
 from app.repositories.achievements import Achievement
 from app.usecases import achievements as achievements_usecases
 from app.usecases import anticheat
+from app.usecases import leaderboards as leaderboards_usecases
 from app.usecases import user_achievements as user_achievements_usecases
 from app.usecases.sb import sb_patcher as sb_patcher_usecases
 from app.utils import escape_enum
 from app.utils import pymysql_encode
 
 BEATMAPS_PATH = SystemPath.cwd() / ".data/osu"
-REPLAYS_PATH = SystemPath.cwd() / ".data/osr"
 SCREENSHOTS_PATH = SystemPath.cwd() / ".data/ss"
 
 
@@ -188,6 +195,49 @@ def bancho_to_osuapi_status(bancho_status: int) -> int:
     }[bancho_status]
 
 
+# the number of values per `IN` clause in batched queries.
+BEATMAP_INFO_CHUNK_SIZE = 1000
+
+
+async def fetch_best_grades(
+    player: Player,
+    mode: int,
+    map_md5s: list[str],
+) -> dict[str, str]:
+    """\
+    Fetch the grades of a player's best scores on `map_md5s` in `mode`.
+
+    With PLAYER_GRADE_CACHE_ENABLED, `map_md5s` is ignored; the grades
+    of all of the player's best scores in `mode` are returned (& cached).
+    """
+    if app.settings.PLAYER_GRADE_CACHE_ENABLED:
+        best_grades = player.best_grades.get(mode)
+        if best_grades is None:
+            # fetch all of their best grades once, kept up to date on submission
+            best_grades = player.best_grades[mode] = {
+                score["map_md5"]: score["grade"]
+                for score in await scores_repo.fetch_many(
+                    user_id=player.id,
+                    mode=mode,
+                    status=SubmissionStatus.BEST,
+                )
+            }
+
+        return best_grades
+
+    best_grades = {}
+    for i in range(0, len(map_md5s), BEATMAP_INFO_CHUNK_SIZE):
+        for score in await scores_repo.fetch_many(
+            map_md5s=map_md5s[i : i + BEATMAP_INFO_CHUNK_SIZE],
+            user_id=player.id,
+            mode=mode,
+            status=SubmissionStatus.BEST,
+        ):
+            best_grades[score["map_md5"]] = score["grade"]
+
+    return best_grades
+
+
 @router.post("/web/osu-getbeatmapinfo.php")
 async def osuGetBeatmapInfo(
     form_data: models.OsuBeatmapRequestForm,
@@ -196,29 +246,34 @@ async def osuGetBeatmapInfo(
     num_requests = len(form_data.Filenames) + len(form_data.Ids)
     log(f"{player} requested info for {num_requests} maps.", Ansi.LCYAN)
 
+    # fetch all of the maps from sql, in batches
+    beatmaps: dict[str, maps_repo.Map] = {}
+    for i in range(0, len(form_data.Filenames), BEATMAP_INFO_CHUNK_SIZE):
+        for map_row in await maps_repo.fetch_many(
+            filenames=form_data.Filenames[i : i + BEATMAP_INFO_CHUNK_SIZE],
+        ):
+            beatmaps.setdefault(map_row["filename"], map_row)
+
+    # try to get the user's grades on the maps
+    # NOTE: osu! only allows us to send back one per gamemode,
+    #       so we've decided to send back *vanilla* grades.
+    #       (in theory we could make this user-customizable)
+    mode = player.status.mode.as_vanilla
+    best_grades = await fetch_best_grades(
+        player,
+        mode,
+        map_md5s=[beatmap["md5"] for beatmap in beatmaps.values()],
+    )
+
     response_lines: list[str] = []
 
     for idx, map_filename in enumerate(form_data.Filenames):
-        # try getting the map from sql
-
-        beatmap = await maps_repo.fetch_one(filename=map_filename)
-
+        beatmap = beatmaps.get(map_filename)
         if not beatmap:
             continue
 
-        # try to get the user's grades on the map
-        # NOTE: osu! only allows us to send back one per gamemode,
-        #       so we've decided to send back *vanilla* grades.
-        #       (in theory we could make this user-customizable)
         grades = ["N", "N", "N", "N"]
-
-        for score in await scores_repo.fetch_many(
-            map_md5=beatmap["md5"],
-            user_id=player.id,
-            mode=player.status.mode.as_vanilla,
-            status=SubmissionStatus.BEST,
-        ):
-            grades[score["mode"]] = score["grade"]
+        grades[mode] = best_grades.get(beatmap["md5"], "N")
 
         response_lines.append(
             "{i}|{id}|{set_id}|{md5}|{status}|{grades}".format(
@@ -570,13 +625,23 @@ async def osuSubmitModularSelector(
     # extract the score data and replay file from the score data
     score_data_b64, replay_file = score_parameters
 
-    # decrypt the score data (aes)
-    score_data, client_hash_decoded = encryption.decrypt_score_aes_data(
-        score_data_b64,
-        client_hash_b64,
-        iv_b64,
-        osu_version,
-    )
+    # decrypt the score data (aes); large payloads are
+    # decrypted in a thread to avoid blocking the event loop
+    if len(score_data_b64) + len(client_hash_b64) >= encryption.OFFLOAD_MIN_BYTES:
+        score_data, client_hash_decoded = await asyncio.to_thread(
+            encryption.decrypt_score_aes_data,
+            score_data_b64,
+            client_hash_b64,
+            iv_b64,
+            osu_version,
+        )
+    else:
+        score_data, client_hash_decoded = encryption.decrypt_score_aes_data(
+            score_data_b64,
+            client_hash_b64,
+            iv_b64,
+            osu_version,
+        )
 
     # ppy.sb feature
     context = OsuSubmitModularContext(
@@ -653,9 +718,9 @@ async def osuSubmitModularSelector(
     if score.mode != score.player.status.mode:
         score.player.status.mods = score.mods
         score.player.status.mode = score.mode
+        score.player.bump_presence_version()
 
-        if not score.player.restricted:
-            app.state.sessions.players.enqueue(app.packets.user_stats(score.player))
+        app.state.sessions.stats_broadcaster.schedule(score.player)
 
     # hold a lock around (check if submitted, submission) to ensure no duplicates
     # are submitted to the database, and potentially award duplicate score/pp/etc.
@@ -693,6 +758,15 @@ async def osuSubmitModularSelector(
 
         """ Score submission checks completed; submit the score. """
 
+        # fetch the player's stats before the score (& its previous best's
+        # status) is written, so the incremental update counts it only once.
+        user_stats = None
+        if app.settings.INCREMENTAL_STATS_ENABLED:
+            user_stats = await app.usecases.user_stats.fetch(
+                score.player.id,
+                score.mode.value,
+            )
+
         if app.state.services.datadog:
             app.state.services.datadog.increment("bancho.submitted_scores")  # type: ignore[no-untyped-call]
 
@@ -728,27 +802,25 @@ async def osuSubmitModularSelector(
                     if score.mods:
                         ann.insert(1, f"+{score.mods!r}")
 
-                    scoring_metric = (
+                    scoring_metric: Literal["pp", "score"] = (
                         "pp" if score.mode >= GameMode.RELAX_OSU else "score"
                     )
 
                     # If there was previously a score on the map, add old #1.
-                    prev_n1 = await app.state.services.database.fetch_one(
-                        "SELECT u.id, name FROM users u "
-                        "INNER JOIN scores s ON u.id = s.userid "
-                        "WHERE s.map_md5 = :map_md5 AND s.mode = :mode "
-                        "AND s.status = 2 AND u.priv & 1 "
-                        f"ORDER BY s.{scoring_metric} DESC LIMIT 1",
-                        {"map_md5": score.bmap.md5, "mode": score.mode},
+                    leaderboard = await leaderboards_usecases.fetch(
+                        score.bmap.md5,
+                        score.mode,
+                        scoring_metric,
                     )
+                    prev_n1 = next(iter(leaderboard.top(1, score.player.id)), None)
 
                     if prev_n1:
-                        if score.player.id != prev_n1["id"]:
+                        if score.player.id != prev_n1.userid:
                             ann.append(
                                 f"(Previous #1: [https://{app.settings.DOMAIN}/u/"
                                 "{id} {name}])".format(
-                                    id=prev_n1["id"],
-                                    name=prev_n1["name"],
+                                    id=prev_n1.userid,
+                                    name=prev_n1.name,
                                 ),
                             )
 
@@ -803,6 +875,13 @@ async def osuSubmitModularSelector(
             },
         )
 
+        if score.status == SubmissionStatus.BEST:
+            await leaderboards_usecases.add_best_score(score)
+
+            best_grades = score.player.best_grades.get(score.mode)
+            if best_grades is not None:
+                best_grades[score.bmap.md5] = score.grade.name
+
     # ppy.sb feature
     if not (context.is_post_submit(context)):  # this will always be true we set all data before
         return Response(b"")
@@ -816,8 +895,7 @@ async def osuSubmitModularSelector(
         MIN_REPLAY_SIZE = 24
 
         if len(replay_data) >= MIN_REPLAY_SIZE:
-            replay_disk_file = REPLAYS_PATH / f"{score.id}.osr"
-            replay_disk_file.write_bytes(replay_data)
+            await app.usecases.replays.storage.save(score.id, replay_data)
         else:
             log(f"{score.player} submitted a score without a replay!", Ansi.LRED)
 
@@ -843,15 +921,18 @@ async def osuSubmitModularSelector(
     stats = score.player.stats[score.mode]
     prev_stats = copy.copy(stats)
 
-    # recalculate stats
-    stats = await score.player.recalc_stats_sql(score.mode)
+    # update stats with the new score, or recalculate them
+    if user_stats is not None:
+        stats = await score.player.update_stats(score, user_stats)
+    else:
+        stats = await score.player.recalc_stats_sql(score.mode)
 
     # update global & country ranking
     stats.rank = await score.player.update_rank(score.mode)
 
     if not score.player.restricted:
         # enqueue new stats info to all other users
-        app.state.sessions.players.enqueue(app.packets.user_stats(score.player))
+        app.state.sessions.stats_broadcaster.schedule(score.player)
 
         plays_incr = 1
         passes_incr = 0
@@ -983,15 +1064,19 @@ async def getReplay(
     if not score:
         return Response(b"", status_code=404)
 
-    file = REPLAYS_PATH / f"{score_id}.osr"
-    if not file.exists():
+    replay = await app.usecases.replays.storage.open(score_id)
+    if replay is None:
         return Response(b"", status_code=404)
 
     # increment replay views for this score
     if score.player is not None and player.id != score.player.id:
         app.state.loop.create_task(score.increment_replay_views())  # type: ignore[unused-awaitable]
 
-    return FileResponse(file)
+    return StreamingResponse(
+        replay,
+        media_type="application/octet-stream",
+        headers={"Content-Length": str(replay.size)},
+    )
 
 
 @router.get("/web/osu-rate.php")
@@ -1026,6 +1111,7 @@ async def osuRate(
     else:
         # the client is submitting a rating for the map.
         await ratings_repo.create(userid=player.id, map_md5=map_md5, rating=rating)
+        app.state.cache.leaderboards.invalidate_rating(map_md5)
 
     # send back the average rating
     avg = await ratings_repo.get_map_rating(map_md5=map_md5)
@@ -1042,102 +1128,85 @@ class LeaderboardType(IntEnum):
     Country = 4
 
 
-async def get_leaderboard_scores(
+SCORE_LISTING_FMTSTR = (
+    "{id}|{name}|{score}|{max_combo}|"
+    "{n50}|{n100}|{n300}|{nmiss}|{nkatu}|{ngeki}|"
+    "{perfect}|{mods}|{userid}|{rank}|{time}|{has_replay}"
+)
+
+
+def get_leaderboard_scores(
+    leaderboard: Leaderboard,
+    leaderboard_key: LeaderboardKey,
     leaderboard_type: LeaderboardType | int,
-    map_md5: str,
-    mode: int,
     mods: Mods,
     player: Player,
-    scoring_metric: Literal["pp", "score"],
-) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
-    query = [
-        f"SELECT s.id, s.{scoring_metric} AS _score, "
-        "s.max_combo, s.n50, s.n100, s.n300, "
-        "s.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, "
-        "UNIX_TIMESTAMP(s.play_time) time, u.id userid, "
-        "COALESCE(CONCAT('[', c.tag, '] ', u.name), u.name) AS name "
-        "FROM scores s "
-        "INNER JOIN users u ON u.id = s.userid "
-        "LEFT JOIN clans c ON c.id = u.clan_id "
-        "WHERE s.map_md5 = :map_md5 AND s.status = 2 "  # 2: =best score
-        "AND (u.priv & 1 OR u.id = :user_id) AND mode = :mode",
-    ]
-
-    params: dict[str, Any] = {
-        "map_md5": map_md5,
-        "user_id": player.id,
-        "mode": mode,
-    }
-
+) -> tuple[RenderedScores, dict[str, Any] | None]:
+    view: LeaderboardView | None
+    predicate: Callable[[LeaderboardScore], bool] | None = None
     if leaderboard_type == LeaderboardType.Mods:
-        query.append("AND s.mods = :mods")
-        params["mods"] = mods
+        view = ("mods", int(mods))
+        predicate = lambda score: score.mods == mods
     elif leaderboard_type == LeaderboardType.Friends:
-        query.append("AND s.userid IN :friends")
-        params["friends"] = player.friends | {player.id}
+        view = None  # unique to the player
+        friends = player.friends | {player.id}
+        predicate = lambda score: score.userid in friends
     elif leaderboard_type == LeaderboardType.Country:
-        query.append("AND u.country = :country")
-        params["country"] = player.geoloc["country"]["acronym"]
+        country = player.geoloc["country"]["acronym"]
+        view = ("country", country)
+        predicate = lambda score: score.country == country
+    else:
+        view = ("top", None)
 
-    # TODO: customizability of the number of scores
-    query.append("ORDER BY _score DESC LIMIT 50")
+    # restricted players may see their own scores, & streamers see
+    # anonymized scores, so neither can share rendered leaderboards.
+    is_streaming = app.state.sessions.streaming_players.get(player.id, False)
+    if player.restricted or is_streaming:
+        view = None
+
+    rendered = leaderboard.rendered(view) if view is not None else None
+    if rendered is None:
+        score_lines = []
+
+        # TODO: customizability of the number of scores
+        for rank, score in enumerate(leaderboard.top(50, player.id, predicate), 1):
+            row = score.as_row()
+            if is_streaming:
+                # we replaced the username with that user's userid, also, return a fake userid to hide avatar.
+                row["name"] = f"Player{str(row['userid'])}"
+                row["userid"] = -1
+
+            score_lines.append(
+                SCORE_LISTING_FMTSTR.format(
+                    **row,
+                    score=int(round(score.score)),
+                    has_replay="1",
+                    rank=rank,
+                ),
+            )
 
-    score_rows = await app.state.services.database.fetch_all(
-        " ".join(query),
-        params,
-    )
+        rendered = RenderedScores(len(score_lines), "\n".join(score_lines).encode())
+        if view is not None:
+            app.state.cache.leaderboards.store_rendered(
+                leaderboard_key,
+                leaderboard,
+                view,
+                rendered,
+            )
 
-    if score_rows:  # None or []
+    personal_best_score_row = None
+    if rendered.score_count:
         # fetch player's personal best score
-        personal_best_score_row = await app.state.services.database.fetch_one(
-            f"SELECT id, {scoring_metric} AS _score, "
-            "max_combo, n50, n100, n300, "
-            "nmiss, nkatu, ngeki, perfect, mods, "
-            "UNIX_TIMESTAMP(play_time) time "
-            "FROM scores "
-            "WHERE map_md5 = :map_md5 AND mode = :mode "
-            "AND userid = :user_id AND status = 2 "
-            "ORDER BY _score DESC LIMIT 1",
-            {"map_md5": map_md5, "mode": mode, "user_id": player.id},
-        )
-
-        if personal_best_score_row is not None:
-            # calculate the rank of the score.
-            p_best_rank = 1 + await app.state.services.database.fetch_val(
-                "SELECT COUNT(*) FROM scores s "
-                "INNER JOIN users u ON u.id = s.userid "
-                "WHERE s.map_md5 = :map_md5 AND s.mode = :mode "
-                "AND s.status = 2 AND u.priv & 1 "
-                f"AND s.{scoring_metric} > :score",
-                {
-                    "map_md5": map_md5,
-                    "mode": mode,
-                    "score": personal_best_score_row["_score"],
-                },
-                column=0,  # COUNT(*)
-            )
+        personal_best = leaderboard.personal_best(player.id)
+        if personal_best is not None:
+            personal_best_score_row = personal_best.as_row()
 
             # attach rank to personal best row
-            personal_best_score_row["rank"] = p_best_rank
-    else:
-        score_rows = []
-        personal_best_score_row = None
-
-    is_streaming = app.state.sessions.streaming_players.get(player.id, False)
-    if is_streaming:
-        for score in score_rows:
-            # we replaced the username with that user's userid, also, return a fake userid to hide avatar.
-            score["name"] = f"Player{str(score['userid'])}"
-            score["userid"] = -1
+            personal_best_score_row["rank"] = leaderboard.placement(
+                personal_best.score,
+            )
 
-    return score_rows, personal_best_score_row
-
-
-SCORE_LISTING_FMTSTR = (
-    "{id}|{name}|{score}|{max_combo}|"
-    "{n50}|{n100}|{n300}|{nmiss}|{nkatu}|{ngeki}|"
-    "{perfect}|{mods}|{userid}|{rank}|{time}|{has_replay}"
-)
+    return rendered, personal_best_score_row
 
 
 @router.get("/web/osu-osz2-getscores.php")
@@ -1184,9 +1253,9 @@ async def getScores(
     if mode != player.status.mode:
         player.status.mods = mods
         player.status.mode = mode
+        player.bump_presence_version()
 
-        if not player.restricted:
-            app.state.sessions.players.enqueue(app.packets.user_stats(player))
+        app.state.sessions.stats_broadcaster.schedule(player)
 
     scoring_metric: Literal["pp", "score"] = (
         "pp" if mode >= GameMode.RELAX_OSU else "score"
@@ -1251,23 +1320,26 @@ async def getScores(
 
     ### ppysb feature end
 
-    # fetch scores & personal best
-    # TODO: create a leaderboard cache
+    # fetch scores, personal best & beatmap rating
     if not requesting_from_editor_song_select:
-        score_rows, personal_best_score_row = await get_leaderboard_scores(
+        leaderboard_key: LeaderboardKey = (bmap.md5, mode, scoring_metric)
+        leaderboard = await leaderboards_usecases.fetch(*leaderboard_key)
+
+        rendered_scores, personal_best_score_row = get_leaderboard_scores(
+            leaderboard,
+            leaderboard_key,
             leaderboard_type,
-            bmap.md5,
-            mode,
             mods,
             player,
-            scoring_metric,
+        )
+        map_avg_rating = await leaderboards_usecases.fetch_rating(
+            leaderboard,
+            map_md5=bmap.md5,
         )
     else:
-        score_rows = []
+        rendered_scores = RenderedScores(score_count=0, body=b"")
         personal_best_score_row = None
-
-    # fetch beatmap rating
-    map_avg_rating = await ratings_repo.get_map_rating(map_md5=map_md5)
+        map_avg_rating = await ratings_repo.get_map_rating(map_md5=map_md5)
 
     ## construct response for osu! client
 
@@ -1280,7 +1352,7 @@ async def getScores(
     response_lines: list[str] = [
         # NOTE: fa stands for featured artist (for the ones that may not know)
         # {ranked_status}|{serv_has_osz2}|{bid}|{bsid}|{len(scores)}|{fa_track_id}|{fa_license_text}
-        f"{int(response_status)}|false|{bmap.id}|{bmap.set_id}|{len(score_rows)}|0|",
+        f"{int(response_status)}|false|{bmap.id}|{bmap.set_id}|{rendered_scores.score_count}|0|",
         # {offset}\n{beatmap_name}\n{rating}
         # TODO: server side beatmap offsets
         f"0\n{bmap.full_name}\n{map_avg_rating}",
@@ -1288,26 +1360,14 @@ async def getScores(
 
     ### ppysb feature end
 
-    if not score_rows:
+    if not rendered_scores.score_count:
         response_lines.extend(("", ""))  # no scores, no personal best
         return Response("\n".join(response_lines).encode())
 
     if personal_best_score_row is not None:
-        user_clan = (
-            await clans_repo.fetch_one(id=player.clan_id)
-            if player.clan_id is not None
-            else None
-        )
-        display_name = (
-            f"[{user_clan['tag']}] {player.name}"
-            if user_clan is not None
-            else player.name
-        )
         response_lines.append(
             SCORE_LISTING_FMTSTR.format(
                 **personal_best_score_row,
-                name=display_name,
-                userid=player.id,
                 score=int(round(personal_best_score_row["_score"])),
                 has_replay="1",
             ),
@@ -1315,20 +1375,11 @@ async def getScores(
     else:
         response_lines.append("")
 
-    response_lines.extend(
-        [
-            SCORE_LISTING_FMTSTR.format(
-                **s,
-                score=int(round(s["_score"])),
-                has_replay="1",
-                rank=idx + 1,
-            )
-            for idx, s in enumerate(score_rows)
-        ],
+    # the score listings are pre-rendered, & shared between requests
+    return Response(
+        "\n".join(response_lines).encode() + b"\n" + rendered_scores.body,
     )
 
-    return Response("\n".join(response_lines).encode())
-
 
 @router.post("/web/osu-comment.php")
 async def osuComment(
@@ -1671,7 +1722,7 @@ async def register_account(
         # they want to register the account now.
         # make the md5 & bcrypt the md5 for sql.
         pw_md5 = hashlib.md5(pw_plaintext.encode()).hexdigest().encode()
-        pw_bcrypt = bcrypt.hashpw(pw_md5, bcrypt.gensalt())
+        pw_bcrypt = await app.usecases.password_hashing.hashpw(pw_md5)
         app.state.cache.bcrypt[pw_bcrypt] = pw_md5  # cache result for login
 
         ip = app.state.services.ip_resolver.get_ip(request.headers)
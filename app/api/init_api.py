@@ -25,8 +25,13 @@ from app import sb
 import app.bg_loops
 import app.settings
 import app.state
+import app.usecases.anticheat
+import app.usecases.password_hashing
 import app.usecases.performance
+import app.usecases.ranks
+import app.usecases.replays
 import app.utils
+from app.adapters.replay_store import Codec
 from app.api import api_router  # type: ignore[attr-defined]
 from app.api import domains
 from app.api import middlewares
@@ -82,6 +87,18 @@ async def lifespan(asgi_app: BanchoAPI) -> AsyncIterator[None]:
         cache_size=app.settings.PERFORMANCE_BMAP_CACHE_SIZE,
         cache_ttl=app.settings.PERFORMANCE_BMAP_CACHE_TTL,
     )
+    app.usecases.password_hashing.pool.start(workers=app.settings.BCRYPT_WORKERS)
+    app.usecases.anticheat.process_pool.start(
+        workers=app.settings.ANTICHEAT_WORKERS,
+        queue_size=app.settings.ANTICHEAT_QUEUE_SIZE,
+        timeout=app.settings.ANTICHEAT_TIMEOUT,
+    )
+    app.usecases.replays.storage.start(
+        path=app.utils.DATA_PATH / "replays",
+        workers=app.settings.REPLAY_STORE_WORKERS,
+        compression=Codec[app.settings.REPLAY_STORE_COMPRESSION.upper()],
+        segment_max_bytes=app.settings.REPLAY_STORE_SEGMENT_MAX_BYTES,
+    )
 
     if app.utils.is_running_as_admin():
         log(
@@ -100,11 +117,16 @@ async def lifespan(asgi_app: BanchoAPI) -> AsyncIterator[None]:
         app.state.services.datadog.gauge("bancho.online_players", 0)  # type: ignore[no-untyped-call]
 
     app.state.services.ip_resolver = app.state.services.IPResolver()
+    await asyncio.to_thread(app.state.services.load_geolocation_db)
 
     await app.state.services.run_sql_migrations()
 
     await collections.initialize_ram_caches()
 
+    if app.settings.RANK_INDEX_ENABLED:
+        rank_index = await app.usecases.ranks.load_index()
+        log(f"Loaded {len(rank_index)} leaderboards into the rank index.", Ansi.LCYAN)
+
     await app.bg_loops.initialize_housekeeping_tasks()
 
     log("Startup process complete.", Ansi.LGREEN)
@@ -119,6 +141,9 @@ async def lifespan(asgi_app: BanchoAPI) -> AsyncIterator[None]:
     # and shut down any of the housekeeping tasks running in the background.
     await app.state.sessions.cancel_housekeeping_tasks()
     await app.usecases.performance.process_pool.stop()
+    await app.usecases.password_hashing.pool.stop()
+    await app.usecases.anticheat.process_pool.stop()
+    await app.usecases.replays.storage.stop()
 
     # shutdown services
 
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import hashlib
 import struct
+from collections.abc import AsyncIterator
 from pathlib import Path as SystemPath
 from typing import Literal
 from urllib.parse import quote
@@ -14,15 +15,19 @@ from fastapi import status
 from fastapi.param_functions import Query
 from fastapi.responses import ORJSONResponse
 from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials as HTTPCredentials
 from fastapi.security import HTTPBearer
 
 import app.packets
 import app.state
 import app.usecases.performance
+import app.usecases.ranks
+import app.usecases.replays
 from app.constants import regexes
 from app.constants.gamemodes import GameMode
 from app.constants.mods import Mods
+from app.constants.privileges import Privileges
 from app.objects.beatmap import Beatmap
 from app.objects.beatmap import ensure_osu_file_is_available
 from app.repositories import clans as clans_repo
@@ -35,7 +40,6 @@ from app.usecases.performance import ScoreParams
 
 AVATARS_PATH = SystemPath.cwd() / ".data/avatars"
 BEATMAPS_PATH = SystemPath.cwd() / ".data/osu"
-REPLAYS_PATH = SystemPath.cwd() / ".data/osr"
 SCREENSHOTS_PATH = SystemPath.cwd() / ".data/ss"
 
 
@@ -61,6 +65,7 @@ http_bearer_scheme = HTTPBearer(auto_error=False)
 
 # Authorized (requires valid api key, passed as 'Authorization' header)
 # GET /calculate_pp: calculate & return pp for a given beatmap.
+# GET /get_packet_stats: return bancho packet traffic & handler timings (staff only).
 
 DATETIME_OFFSET = 0x89F7FF5F7B58000
 
@@ -147,6 +152,67 @@ async def api_calculate_pp(
     )
 
 
+@router.get("/get_packet_stats")
+async def api_get_packet_stats(
+    token: HTTPCredentials | None = Depends(http_bearer_scheme),
+) -> Response:
+    """Return per-packet traffic & handler timings for bancho connections."""
+    if token is None or app.state.sessions.api_keys.get(token.credentials) is None:
+        return ORJSONResponse(
+            {"status": "Invalid API key."},
+            status_code=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    player = await app.state.sessions.players.from_cache_or_sql(
+        id=app.state.sessions.api_keys[token.credentials],
+    )
+    if player is None or not player.priv & Privileges.STAFF:
+        return ORJSONResponse(
+            {"status": "Insufficient privileges."},
+            status_code=status.HTTP_403_FORBIDDEN,
+        )
+
+    packet_stats = app.state.packet_stats
+
+    return ORJSONResponse(
+        {
+            "status": "success",
+            "packets": {
+                app.packets.ClientPackets(packet_id).name: {
+                    "count": stats.count,
+                    "bytes": stats.bytes,
+                    "handle_time_ns": stats.handle_time_ns.summary(),
+                }
+                for packet_id, stats in sorted(packet_stats.packets.items())
+            },
+            "packets_per_request": packet_stats.packets_per_request.summary(),
+            "response_bytes": packet_stats.response_bytes.summary(),
+            "login_stage_times_us": {
+                stage: histogram.summary()
+                for stage, histogram in app.state.login_stage_times.items()
+            },
+            "timed_out_sessions": {
+                "count": app.state.sessions.timeouts.expired_count,
+                "expiry_delay_ms": app.state.sessions.timeouts.expiry_delay_ms.summary(),
+            },
+            "redis": {
+                operation: {
+                    "round_trips": round_trips,
+                    "commands": app.state.redis_stats.commands[operation],
+                }
+                for operation, round_trips in app.state.redis_stats.round_trips.items()
+            },
+            "leaderboard_cache": {
+                "leaderboards": len(app.state.cache.leaderboards),
+                "bytes": app.state.cache.leaderboards.size_bytes,
+                "hits": app.state.cache.leaderboards.hits,
+                "misses": app.state.cache.leaderboards.misses,
+                "evictions": app.state.cache.leaderboards.evictions,
+            },
+        },
+    )
+
+
 @router.get("/search_players")
 async def api_search_players(
     search: str | None = Query(None, alias="q", min=2, max=32),
@@ -235,16 +301,14 @@ async def api_get_player_info(
 
         # get all stats
         all_stats = await stats_repo.fetch_many(player_id=resolved_user_id)
+        all_ranks = await app.usecases.ranks.fetch_many(
+            resolved_user_id,
+            modes=[mode_stats["mode"] for mode_stats in all_stats],
+            country=resolved_country,
+        )
 
         for mode_stats in all_stats:
-            rank = await app.state.services.redis.zrevrank(
-                f"bancho:leaderboard:{mode_stats['mode']}",
-                str(resolved_user_id),
-            )
-            country_rank = await app.state.services.redis.zrevrank(
-                f"bancho:leaderboard:{mode_stats['mode']}:{resolved_country}",
-                str(resolved_user_id),
-            )
+            ranks = all_ranks[mode_stats["mode"]]
 
             # NOTE: this dict-like return is intentional.
             #       but quite cursed.
@@ -267,8 +331,8 @@ async def api_get_player_info(
                 "s_count": mode_stats["s_count"],
                 "a_count": mode_stats["a_count"],
                 # extra fields are added to the api response
-                "rank": rank + 1 if rank is not None else 0,
-                "country_rank": country_rank + 1 if country_rank is not None else 0,
+                "rank": ranks.global_rank,
+                "country_rank": ranks.country_rank,
             }
 
     return ORJSONResponse({"status": "success", "player": api_data})
@@ -750,20 +814,20 @@ async def api_get_replay(
     Note that this endpoint does not increment
     the player's total replay views.
     """
-    # fetch replay file & make sure it exists
-    replay_file = REPLAYS_PATH / f"{score_id}.osr"
-    if not replay_file.exists():
+    # fetch replay & make sure it exists
+    replay = await app.usecases.replays.storage.open(score_id)
+    if replay is None:
         return ORJSONResponse(
             {"status": "Replay not found."},
             status_code=status.HTTP_404_NOT_FOUND,
         )
-    # read replay frames from file
-    raw_replay_data = replay_file.read_bytes()
+    # the replay frames are streamed from storage
     if not include_headers:
-        return Response(
-            bytes(raw_replay_data),
+        return StreamingResponse(
+            replay,
             media_type="application/octet-stream",
             headers={
+                "Content-Length": str(replay.size),
                 "Content-Description": "File Transfer",
                 # TODO: should we include a Content-Disposition?
             },
@@ -833,19 +897,27 @@ async def api_get_replay(
     replay_data += b"\x00"  # TODO: hp graph
     timestamp = int(row["play_time"].timestamp() * 1e7)
     replay_data += struct.pack("<q", timestamp + DATETIME_OFFSET)
-    # pack the raw replay data into the buffer
-    replay_data += struct.pack("<i", len(raw_replay_data))
-    replay_data += raw_replay_data
-    # pack additional info buffer.
-    replay_data += struct.pack("<q", score_id)
+    # pack the raw replay data's length into the buffer
+    replay_data += struct.pack("<i", replay.size)
+    # pack additional info buffer, sent after the raw replay data.
+    replay_data_footer = struct.pack("<q", score_id)
     # NOTE: target practice sends extra mods, but
     # can't submit scores so should not be a problem.
 
+    async def stream_replay() -> AsyncIterator[bytes]:
+        yield bytes(replay_data)
+        async for chunk in replay:
+            yield chunk
+        yield replay_data_footer
+
     # stream data back to the client
-    return Response(
-        bytes(replay_data),
+    return StreamingResponse(
+        stream_replay(),
         media_type="application/octet-stream",
         headers={
+            "Content-Length": str(
+                len(replay_data) + replay.size + len(replay_data_footer),
+            ),
             "Content-Description": "File Transfer",
             "Content-Disposition": f"""attachment; filename="{
                     ("{uid} - {artist} - {title} [{version}] ({play_time:%Y-%m-%d}).osr").format(**row)
@@ -2,21 +2,32 @@ from __future__ import annotations
 
 import asyncio
 import time
+from datetime import date
 
 import app.packets
 import app.settings
 import app.state
+import app.usecases.anticheat
+import app.usecases.ranks
+import app.usecases.user_stats
 from app.constants.privileges import Privileges
 from app.logging import Ansi
 from app.logging import log
+from app.metrics import PacketTypeStats
+from app.objects.player import OsuStream
 
 OSU_CLIENT_MIN_PING_INTERVAL = 300000 // 1000  # defined by osu!
+OSU_API_V2_CHANGELOG_URL = "https://osu.ppy.sh/api/v2/changelog"
 
 
 async def initialize_housekeeping_tasks() -> None:
     """Create tasks for each housekeeping tasks."""
     log("Initializing housekeeping tasks.", Ansi.LCYAN)
 
+    if app.settings.DISALLOW_OLD_CLIENTS:
+        # before accepting logins; they're rejected until this succeeds
+        await _update_allowed_client_versions()
+
     loop = asyncio.get_running_loop()
 
     app.state.sessions.housekeeping_tasks.update(
@@ -25,7 +36,13 @@ async def initialize_housekeeping_tasks() -> None:
             for task in (
                 _remove_expired_donation_privileges(interval=30 * 60),
                 _update_bot_status(interval=5 * 60),
-                _disconnect_ghosts(interval=OSU_CLIENT_MIN_PING_INTERVAL // 3),
+                _disconnect_ghosts(interval=1),
+                _push_packet_stats(interval=60),
+                _broadcast_stats(interval=0.25),
+                _refresh_allowed_client_versions(interval=10 * 60),
+                _check_rank_index(interval=30 * 60),
+                _reconcile_user_stats(interval=5 * 60),
+                _resume_deferred_anticheat(interval=30),
             )
         },
     )
@@ -76,10 +93,133 @@ async def _disconnect_ghosts(interval: int) -> None:
         await asyncio.sleep(interval)
         current_time = time.time()
 
-        for player in app.state.sessions.players:
-            if current_time - player.last_recv_time > OSU_CLIENT_MIN_PING_INTERVAL:
-                log(f"Auto-dced {player}.", Ansi.LMAGENTA)
-                player.logout()
+        for player in app.state.sessions.timeouts.expire(current_time):
+            log(f"Auto-dced {player}.", Ansi.LMAGENTA)
+            player.logout()
+
+            if app.state.services.datadog:
+                # how long past the threshold the player was disconnected
+                delay = (
+                    current_time - player.last_recv_time - OSU_CLIENT_MIN_PING_INTERVAL
+                )
+                app.state.services.datadog.increment("bancho.ghosts_reaped")  # type: ignore[no-untyped-call]
+                app.state.services.datadog.histogram("bancho.ghost_reap_delay", delay)  # type: ignore[no-untyped-call]
+
+
+async def _push_packet_stats(interval: int) -> None:
+    """Push the bancho packet stats of the last `interval` to datadog."""
+    if app.state.services.datadog is None:
+        return
+
+    datadog = app.state.services.datadog
+    previous = app.state.packet_stats.copy()
+
+    while True:
+        await asyncio.sleep(interval)
+        current = app.state.packet_stats.copy()
+
+        for packet_id, stats in current.packets.items():
+            tags = [f"packet:{app.packets.ClientPackets(packet_id).name.lower()}"]
+            earlier = previous.packets.get(packet_id) or PacketTypeStats()
+
+            datadog.increment("bancho.packets.count", stats.count - earlier.count, tags=tags)  # type: ignore[no-untyped-call]
+            datadog.increment("bancho.packets.bytes", stats.bytes - earlier.bytes, tags=tags)  # type: ignore[no-untyped-call]
+
+            handle_time_ns = stats.handle_time_ns.since(earlier.handle_time_ns)
+            if handle_time_ns.count:
+                for name, value in (
+                    ("p50", handle_time_ns.percentile(50)),
+                    ("p99", handle_time_ns.percentile(99)),
+                    ("max", handle_time_ns.max),
+                ):
+                    datadog.gauge(f"bancho.packets.handle_time_us.{name}", value / 1000, tags=tags)  # type: ignore[no-untyped-call]
+
+        for metric, histogram, earlier_histogram in (
+            (
+                "bancho.packets_per_request",
+                current.packets_per_request,
+                previous.packets_per_request,
+            ),
+            (
+                "bancho.response_bytes",
+                current.response_bytes,
+                previous.response_bytes,
+            ),
+        ):
+            interval_histogram = histogram.since(earlier_histogram)
+            if interval_histogram.count:
+                datadog.gauge(f"{metric}.mean", interval_histogram.mean)  # type: ignore[no-untyped-call]
+                datadog.gauge(f"{metric}.p99", interval_histogram.percentile(99))  # type: ignore[no-untyped-call]
+
+        previous = current
+
+
+async def _broadcast_stats(interval: float) -> None:
+    """Broadcast players' scheduled stats changes, every `interval`."""
+    while True:
+        await asyncio.sleep(interval)
+        app.state.sessions.stats_broadcaster.flush()
+
+
+async def _fetch_allowed_client_versions(osu_stream: OsuStream) -> set[date]:
+    """Fetch the client versions allowed to connect on `osu_stream`."""
+    osu_stream_str = osu_stream.value
+    if osu_stream in (OsuStream.STABLE, OsuStream.BETA):
+        osu_stream_str += "40"  # TODO: why?
+
+    response = await app.state.services.http_client.get(
+        OSU_API_V2_CHANGELOG_URL,
+        params={"stream": osu_stream_str},
+    )
+    response.raise_for_status()
+
+    allowed_client_versions: set[date] = set()
+    for build in response.json()["builds"]:
+        version = date(
+            int(build["version"][0:4]),
+            int(build["version"][4:6]),
+            int(build["version"][6:8]),
+        )
+        allowed_client_versions.add(version)
+
+        if any(entry["major"] for entry in build["changelog_entries"]):
+            # this build is a major iteration to the client
+            # don't allow anything older than this
+            break
+
+    return allowed_client_versions
+
+
+async def _update_allowed_client_versions() -> None:
+    """Fetch the client versions allowed to connect on each stream."""
+    for osu_stream in OsuStream:
+        if osu_stream is OsuStream.PPYSB:
+            continue
+
+        try:
+            allowed_client_versions = await _fetch_allowed_client_versions(
+                osu_stream,
+            )
+        except Exception as exc:
+            # keep using the last versions we fetched successfully
+            log(
+                f"Failed to refresh allowed {osu_stream} client versions: {exc}",
+                Ansi.LYELLOW,
+            )
+            continue
+
+        app.state.cache.allowed_client_versions[osu_stream] = allowed_client_versions
+
+
+async def _refresh_allowed_client_versions(interval: int) -> None:
+    """Refresh the client versions allowed to connect, every `interval`."""
+    if not app.settings.DISALLOW_OLD_CLIENTS:
+        return
+
+    # NOTE: first fetched on startup (see `initialize_housekeeping_tasks`)
+    while True:
+        await asyncio.sleep(interval)
+        await _update_allowed_client_versions()
 
 
 async def _update_bot_status(interval: int) -> None:
@@ -87,3 +227,65 @@ async def _update_bot_status(interval: int) -> None:
     while True:
         await asyncio.sleep(interval)
         app.packets.bot_stats.cache_clear()
+        app.state.sessions.bot.bump_presence_version()
+
+
+async def _check_rank_index(interval: int) -> None:
+    """Check the in-process rank index against the leaderboards in redis."""
+    if not app.settings.RANK_INDEX_ENABLED:
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+
+        rank_index = app.usecases.ranks.index
+        if rank_index is None:
+            continue
+
+        mismatches = await app.usecases.ranks.check_index_consistency(rank_index)
+
+        if mismatches:
+            log(
+                f"The rank index differs from redis for {len(mismatches)} entries "
+                f"(e.g. {mismatches[0]}).",
+                Ansi.LRED,
+            )
+        elif app.settings.DEBUG:
+            log("The rank index is consistent with redis.", Ansi.LMAGENTA)
+
+        if app.state.services.datadog:
+            app.state.services.datadog.gauge("bancho.rank_index.mismatches", len(mismatches))  # type: ignore[no-untyped-call]
+
+
+async def _reconcile_user_stats(interval: int) -> None:
+    """Recalculate incrementally updated stats which are due for reconciliation."""
+    if not app.settings.INCREMENTAL_STATS_ENABLED:
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+
+        mismatches = await app.usecases.user_stats.reconcile(
+            max_age=app.settings.USER_STATS_RECONCILE_INTERVAL,
+        )
+
+        if mismatches:
+            log(
+                f"Incrementally updated stats differed from sql for {len(mismatches)} "
+                f"players (e.g. {mismatches[0]}).",
+                Ansi.LRED,
+            )
+
+        if app.state.services.datadog:
+            app.state.services.datadog.gauge("bancho.user_stats.mismatches", len(mismatches))  # type: ignore[no-untyped-call]
+
+
+async def _resume_deferred_anticheat(interval: int) -> None:
+    """Analyze replays deferred while the anticheat pool was busy."""
+    while True:
+        await asyncio.sleep(interval)
+
+        resumed = await app.usecases.anticheat.resume_deferred()
+
+        if resumed and app.settings.DEBUG:
+            log(f"Analyzed {resumed} deferred replays.", Ansi.LMAGENTA)
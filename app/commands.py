@@ -39,6 +39,7 @@ import app.packets
 import app.settings
 import app.state
 import app.usecases.performance
+import app.usecases.user_stats
 import app.utils
 from app.constants import regexes
 from app.constants.gamemodes import GAMEMODE_REPR_LIST
@@ -336,6 +337,7 @@ async def changename(ctx: Context) -> str | None:
 
     # all checks passed, update their name
     await users_repo.partial_update(ctx.player.id, name=name)
+    app.state.cache.leaderboards.set_name(ctx.player.id, name)
 
     ctx.player.enqueue(
         app.packets.notification(f"Your username has been changed to {name}!"),
@@ -742,6 +744,9 @@ async def _map(ctx: Context) -> str | None:
         # deactivate rank requests for all ids
         await map_requests_repo.mark_batch_as_inactive(map_ids=modified_beatmap_ids)
 
+    # whether the maps' scores award pp has changed
+    await app.usecases.user_stats.invalidate_all()
+
     return f"{bmap.embed} updated to {new_status!s}."
 
 
@@ -1235,6 +1240,13 @@ async def wipemap(ctx: Context) -> str | None:
         "DELETE FROM scores WHERE map_md5 = :map_md5",
         {"map_md5": map_md5},
     )
+    app.state.cache.leaderboards.invalidate(map_md5)
+
+    for player in app.state.sessions.players:
+        for best_grades in player.best_grades.values():
+            best_grades.pop(map_md5, None)
+
+    await app.usecases.user_stats.invalidate_all()
 
     return "Scores wiped."
 
@@ -2390,6 +2402,7 @@ async def clan_create(ctx: Context) -> str | None:
         clan_id=new_clan["id"],
         clan_priv=ClanPrivileges.Owner,
     )
+    app.state.cache.leaderboards.set_clan_tag(ctx.player.id, new_clan["tag"])
 
     # announce clan creation
     announce_chan = app.state.sessions.channels.get_by_name("#announce")
@@ -2430,6 +2443,8 @@ async def clan_disband(ctx: Context) -> str | None:
         update(users_repo.UsersTable).where(users_repo.UsersTable.clan_id == clan["id"]).values(clan_id=0, clan_priv=0)
     )
     for member_id in clan_member_ids:
+        app.state.cache.leaderboards.set_clan_tag(member_id, None)
+
         member = app.state.sessions.players.get(id=member_id)
         if member:
             member.clan_id = None
@@ -2482,6 +2497,7 @@ async def clan_leave(ctx: Context) -> str | None:
     clan_members = await users_repo.fetch_many(clan_id=clan["id"])
 
     await users_repo.partial_update(ctx.player.id, clan_id=0, clan_priv=0)
+    app.state.cache.leaderboards.set_clan_tag(ctx.player.id, None)
     ctx.player.clan_id = None
     ctx.player.clan_priv = None
 
@@ -1,11 +1,261 @@
 from __future__ import annotations
 
+import struct
 from base64 import b64decode
 from base64 import b64encode
+from functools import lru_cache
+from typing import NamedTuple
 
 from py3rijndael import Pkcs7Padding
 from py3rijndael import RijndaelCbc
 
+# score data is encrypted with rijndael in cbc mode, using 256-bit blocks
+# (so it isn't aes) & pkcs7 padding, which no common library supports.
+#
+# the blocks of a cbc ciphertext can be decrypted independently, so rather
+# than decrypting block by block in python, each step of a round is applied
+# to the whole ciphertext at once, as a single integer: the byte substitution
+# (& inverse mixcolumns multiplications) are byte translations through tables
+# precomputed below, and the row shifts & column rotations are masked shifts.
+BLOCK_SIZE = 32
+
+# the size (in base64) of payloads which are decrypted off the event loop.
+OFFLOAD_MIN_BYTES = 8192
+
+# the number of columns by which each row of the state is shifted.
+_ROW_SHIFTS = (0, 1, 3, 4)
+
+# [key size]: number of rounds, for 256-bit blocks.
+_NUM_ROUNDS = {16: 14, 24: 14, 32: 14}
+
+
+def _gf_mul(a: int, b: int) -> int:
+    """Multiply two elements of rijndael's finite field, GF(2^8)."""
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        a <<= 1
+        if a & 0x100:
+            a ^= 0x11B
+        b >>= 1
+    return result
+
+
+def _build_sboxes() -> tuple[bytes, bytes]:
+    """Build the s-box & its inverse."""
+    # powers of 3 generate the field, which makes finding inverses cheap.
+    exp = [0] * 255
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x = _gf_mul(x, 3)
+
+    sbox = bytearray(256)
+    inv_sbox = bytearray(256)
+    for x in range(256):
+        b = exp[(255 - log[x]) % 255] if x else 0
+
+        # the affine transformation
+        s = b
+        for shift in range(1, 5):
+            s ^= ((b << shift) | (b >> (8 - shift))) & 0xFF
+        s ^= 0x63
+
+        sbox[x] = s
+        inv_sbox[s] = x
+
+    return bytes(sbox), bytes(inv_sbox)
+
+
+_SBOX, _INV_SBOX = _build_sboxes()
+
+# the round constants of the key schedule.
+_RCON = [1]
+for _ in range(29):
+    _RCON.append(_gf_mul(_RCON[-1], 2))
+
+# the inverse byte substitution, followed by a multiplication by each
+# of the inverse mixcolumns coefficients.
+_INV_SUB_MUL = tuple(
+    bytes(_gf_mul(s, coefficient) for s in _INV_SBOX) for coefficient in (14, 11, 13, 9)
+)
+
+
+def _inv_mix_column(word: int) -> int:
+    a0, a1, a2, a3 = word.to_bytes(4, "big")
+    return int.from_bytes(
+        (
+            _gf_mul(a0, 14) ^ _gf_mul(a1, 11) ^ _gf_mul(a2, 13) ^ _gf_mul(a3, 9),
+            _gf_mul(a0, 9) ^ _gf_mul(a1, 14) ^ _gf_mul(a2, 11) ^ _gf_mul(a3, 13),
+            _gf_mul(a0, 13) ^ _gf_mul(a1, 9) ^ _gf_mul(a2, 14) ^ _gf_mul(a3, 11),
+            _gf_mul(a0, 11) ^ _gf_mul(a1, 13) ^ _gf_mul(a2, 9) ^ _gf_mul(a3, 14),
+        ),
+        "big",
+    )
+
+
+class KeySchedule:
+    """The round keys of a key, for decrypting 256-bit blocks."""
+
+    __slots__ = ("decrypt_keys",)
+
+    def __init__(self, key: bytes) -> None:
+        if len(key) not in _NUM_ROUNDS:
+            raise ValueError(f"Invalid key size: {len(key)}")
+
+        rounds = _NUM_ROUNDS[len(key)]
+        key_words = len(key) // 4
+        block_words = BLOCK_SIZE // 4
+
+        words = list(struct.unpack(f">{key_words}I", key))
+        while len(words) < (rounds + 1) * block_words:
+            word = words[-1]
+            i = len(words) % key_words
+            if i == 0:
+                # rotate the word, substitute each byte & add the round constant
+                rotated = word.to_bytes(4, "big")[1:] + bytes((word >> 24,))
+                word = int.from_bytes(rotated.translate(_SBOX), "big")
+                word ^= _RCON[len(words) // key_words - 1] << 24
+            elif key_words == 8 and i == 4:
+                word = int.from_bytes(word.to_bytes(4, "big").translate(_SBOX), "big")
+            words.append(words[-key_words] ^ word)
+
+        round_keys = [
+            words[r * block_words : (r + 1) * block_words] for r in range(rounds + 1)
+        ]
+
+        # the equivalent inverse cipher applies the keys in reverse order,
+        # with inverse mixcolumns applied to those of the inner rounds.
+        decrypt_keys = [round_keys[rounds]]
+        for round_key in reversed(round_keys[1:rounds]):
+            decrypt_keys.append([_inv_mix_column(word) for word in round_key])
+        decrypt_keys.append(round_keys[0])
+
+        self.decrypt_keys = [
+            struct.pack(f">{block_words}I", *round_key) for round_key in decrypt_keys
+        ]
+
+
+class _BlockMasks(NamedTuple):
+    # the bytes of the first row, which isn't shifted.
+    unshifted: int
+    # (mask, shift, wrap mask, wrap shift) for the inverse shift of rows 1-3.
+    row_shifts: tuple[tuple[int, int, int, int], ...]
+    # (mask, shift, wrap mask, wrap shift) rotating columns up by 1, 2 & 3 bytes.
+    column_rotations: tuple[tuple[int, int, int, int], ...]
+
+
+@lru_cache(maxsize=32)
+def _block_masks(block_count: int) -> _BlockMasks:
+    """Build the masks used to permute the bytes of `block_count` blocks."""
+
+    def mask(positions: list[int]) -> int:
+        block = bytearray(BLOCK_SIZE)
+        for position in positions:
+            block[position] = 0xFF
+        return int.from_bytes(bytes(block) * block_count, "big")
+
+    row_shifts = []
+    for row, shift in enumerate(_ROW_SHIFTS[1:], start=1):
+        # columns move right by `shift`, wrapping around to the start.
+        row_shifts.append(
+            (
+                mask([column * 4 + row for column in range(8 - shift)]),
+                shift * 32,
+                mask([column * 4 + row for column in range(8 - shift, 8)]),
+                (8 - shift) * 32,
+            ),
+        )
+
+    column_rotations = []
+    for rotation in (1, 2, 3):
+        # bytes move up by `rotation`, wrapping around to the bottom.
+        column_rotations.append(
+            (
+                mask([w * 4 + i for w in range(8) for i in range(4 - rotation)]),
+                rotation * 8,
+                mask([w * 4 + i for w in range(8) for i in range(4 - rotation, 4)]),
+                (4 - rotation) * 8,
+            ),
+        )
+
+    return _BlockMasks(
+        unshifted=mask(list(range(0, BLOCK_SIZE, 4))),
+        row_shifts=tuple(row_shifts),
+        column_rotations=tuple(column_rotations),
+    )
+
+
+def _inv_shift_rows(state: int, masks: _BlockMasks) -> int:
+    state_out = state & masks.unshifted
+    for right_mask, right_shift, left_mask, left_shift in masks.row_shifts:
+        state_out |= (state & right_mask) >> right_shift
+        state_out |= (state & left_mask) << left_shift
+    return state_out
+
+
+def _rotate_columns(state: int, rotation: tuple[int, int, int, int]) -> int:
+    mask, shift, wrap_mask, wrap_shift = rotation
+    return (state << shift) & mask | (state >> wrap_shift) & wrap_mask
+
+
+def cbc_decrypt(key_schedule: KeySchedule, iv: bytes, data: bytes) -> bytes:
+    """Decrypt & strip the pkcs7 padding of `data` with rijndael-256 in cbc mode."""
+    if len(iv) != BLOCK_SIZE:
+        raise ValueError(f"Invalid iv size: {len(iv)}")
+    if not data or len(data) % BLOCK_SIZE:
+        raise ValueError(f"Invalid data size: {len(data)}")
+
+    size = len(data)
+    block_count = size // BLOCK_SIZE
+    masks = _block_masks(block_count)
+    rotate_1, rotate_2, rotate_3 = masks.column_rotations
+    mul_14, mul_11, mul_13, mul_9 = _INV_SUB_MUL
+
+    first_key, *round_keys, last_key = (
+        int.from_bytes(round_key * block_count, "big")
+        for round_key in key_schedule.decrypt_keys
+    )
+
+    state = int.from_bytes(data, "big") ^ first_key
+
+    for round_key in round_keys:
+        state_bytes = _inv_shift_rows(state, masks).to_bytes(size, "big")
+
+        # inverse mixcolumns; each byte of a column becomes the sum of
+        # the products of the column's bytes & rotated coefficients.
+        by_14 = int.from_bytes(state_bytes.translate(mul_14), "big")
+        by_11 = int.from_bytes(state_bytes.translate(mul_11), "big")
+        by_13 = int.from_bytes(state_bytes.translate(mul_13), "big")
+        by_9 = int.from_bytes(state_bytes.translate(mul_9), "big")
+        state = (
+            by_14
+            ^ _rotate_columns(by_11, rotate_1)
+            ^ _rotate_columns(by_13, rotate_2)
+            ^ _rotate_columns(by_9, rotate_3)
+            ^ round_key
+        )
+
+    state_bytes = _inv_shift_rows(state, masks).to_bytes(size, "big")
+    state = int.from_bytes(state_bytes.translate(_INV_SBOX), "big") ^ last_key
+
+    # undo the chaining; each block was xored with the previous ciphertext
+    state ^= int.from_bytes(iv + data[:-BLOCK_SIZE], "big")
+    plaintext = state.to_bytes(size, "big")
+
+    # NOTE: the padding isn't validated, matching the osu! client's
+    #       implementation (and py3rijndael's, which we used before).
+    return plaintext[: -plaintext[-1]]
+
+
+@lru_cache(maxsize=16)
+def score_key_schedule(osu_version: str) -> KeySchedule:
+    """Get the (cached) key schedule for the score data of an osu! version."""
+    return KeySchedule(f"osu!-scoreburgr---------{osu_version}".encode())
+
 
 def encrypt_score_aes_data(
     # to encode
@@ -45,15 +295,11 @@ def decrypt_score_aes_data(
     # TODO: perhaps this should return TypedDict?
 
     # attempt to decrypt score data
-    aes = RijndaelCbc(
-        key=f"osu!-scoreburgr---------{osu_version}".encode(),
-        iv=b64decode(iv_b64),
-        padding=Pkcs7Padding(32),
-        block_size=32,
-    )
+    key_schedule = score_key_schedule(osu_version)
+    iv = b64decode(iv_b64)
 
-    score_data = aes.decrypt(b64decode(score_data_b64)).decode().split(":")
-    client_hash_decoded = aes.decrypt(b64decode(client_hash_b64)).decode()
+    score_data = cbc_decrypt(key_schedule, iv, b64decode(score_data_b64))
+    client_hash_decoded = cbc_decrypt(key_schedule, iv, b64decode(client_hash_b64))
 
     # score data is delimited by colons (:).
-    return score_data, client_hash_decoded
+    return score_data.decode().split(":"), client_hash_decoded.decode()
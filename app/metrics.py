@@ -0,0 +1,202 @@
+"""metrics: low-overhead, in-process server metrics"""
+
+from __future__ import annotations
+
+from typing import Any
+
+# values are bucketed by their power of two, with each power of two
+# split into `SUB_BUCKET_COUNT` linear sub-buckets; this bounds the
+# relative error of any reported value to 1 / SUB_BUCKET_COUNT (~6%).
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+# enough buckets to represent any 63-bit value.
+BUCKET_COUNT = (64 - SUB_BUCKET_BITS) * SUB_BUCKET_COUNT
+
+
+def _bucket_index(value: int) -> int:
+    """Return the index of the bucket `value` is counted in."""
+    if value < SUB_BUCKET_COUNT:
+        return max(value, 0)
+
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return min(
+        (shift + 1) * SUB_BUCKET_COUNT + (value >> shift) - SUB_BUCKET_COUNT,
+        BUCKET_COUNT - 1,
+    )
+
+
+def _bucket_highest_value(index: int) -> int:
+    """Return the highest value counted in the bucket at `index`."""
+    if index < SUB_BUCKET_COUNT:
+        return index
+
+    shift = index // SUB_BUCKET_COUNT - 1
+    lowest = (index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT) << shift
+    return lowest + (1 << shift) - 1
+
+
+class Histogram:
+    """\
+    A log-bucketed histogram of non-negative integers, in the style of
+    HdrHistogram; recording a value is a couple of integer operations
+    and a list increment, so it's cheap enough to leave on everywhere.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        """Record a single occurrence of `value`."""
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percentile: float) -> int:
+        """Return the (approximate) value at `percentile` (0-100)."""
+        if not self.count:
+            return 0
+
+        target = max(1, round(self.count * percentile / 100))
+
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_bucket_highest_value(index), self.max)
+
+        return self.max  # unreachable
+
+    def copy(self) -> Histogram:
+        histogram = Histogram()
+        histogram.counts = self.counts.copy()
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.max = self.max
+        return histogram
+
+    def since(self, earlier: Histogram) -> Histogram:
+        """\
+        Return the values recorded since `earlier`, a copy of `self`.
+
+        The maximum can't be recovered for an interval, so it is
+        estimated from the highest bucket recorded in the interval.
+        """
+        histogram = Histogram()
+        histogram.counts = [a - b for a, b in zip(self.counts, earlier.counts)]
+        histogram.count = self.count - earlier.count
+        histogram.total = self.total - earlier.total
+
+        for index in range(BUCKET_COUNT - 1, -1, -1):
+            if histogram.counts[index]:
+                histogram.max = min(_bucket_highest_value(index), self.max)
+                break
+
+        return histogram
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 2),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class PacketTypeStats:
+    """The traffic & handler latency of a single client packet type."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.bytes = 0
+        self.handle_time_ns = Histogram()
+
+    def copy(self) -> PacketTypeStats:
+        stats = PacketTypeStats()
+        stats.count = self.count
+        stats.bytes = self.bytes
+        stats.handle_time_ns = self.handle_time_ns.copy()
+        return stats
+
+
+class PacketStats:
+    """\
+    Per-packet-type counts, bytes & handler wall time for the bancho
+    connections, along with per-request totals.
+
+    Packets are counted by the reader as their headers are read (so
+    unhandled packets are included), while handler times are recorded
+    by the caller around `BasePacket.handle`.
+    """
+
+    def __init__(self) -> None:
+        # keyed by packet id (`app.packets.ClientPackets`)
+        self.packets: dict[int, PacketTypeStats] = {}
+
+        self.packets_per_request = Histogram()
+        self.response_bytes = Histogram()
+
+    def record_packet(self, packet_id: int, length: int) -> None:
+        """Record a packet of `length` bytes read from a request."""
+        stats = self.packets.get(packet_id)
+        if stats is None:
+            stats = self.packets[packet_id] = PacketTypeStats()
+
+        stats.count += 1
+        stats.bytes += length
+
+    def record_handle_time(self, packet_id: int, elapsed_ns: int) -> None:
+        """Record the wall time taken to handle a packet."""
+        stats = self.packets.get(packet_id)
+        if stats is None:
+            stats = self.packets[packet_id] = PacketTypeStats()
+
+        stats.handle_time_ns.record(elapsed_ns)
+
+    def record_request(self, packet_count: int, response_length: int) -> None:
+        """Record the totals for a single bancho request."""
+        self.packets_per_request.record(packet_count)
+        self.response_bytes.record(response_length)
+
+    def copy(self) -> PacketStats:
+        stats = PacketStats()
+        stats.packets = {
+            packet_id: packet_stats.copy()
+            for packet_id, packet_stats in self.packets.items()
+        }
+        stats.packets_per_request = self.packets_per_request.copy()
+        stats.response_bytes = self.response_bytes.copy()
+        return stats
+
+
+class RedisStats:
+    """\
+    The number of round trips made to redis, & the commands sent in
+    them, keyed by the operation which made them (e.g. "update_rank").
+    """
+
+    def __init__(self) -> None:
+        self.round_trips: dict[str, int] = {}
+        self.commands: dict[str, int] = {}
+
+    def record_round_trip(self, operation: str, command_count: int) -> None:
+        """Record a single round trip of `command_count` commands."""
+        self.round_trips[operation] = self.round_trips.get(operation, 0) + 1
+        self.commands[operation] = self.commands.get(operation, 0) + command_count
+
+    def copy(self) -> RedisStats:
+        stats = RedisStats()
+        stats.round_trips = self.round_trips.copy()
+        stats.commands = self.commands.copy()
+        return stats
@@ -791,6 +791,8 @@ class BeatmapSet:
                     "DELETE FROM scores WHERE map_md5 IN :map_md5s",
                     {"map_md5s": map_md5s_to_delete},
                 )
+                for map_md5 in map_md5s_to_delete:
+                    app.state.cache.leaderboards.invalidate(map_md5)
 
             # update last_osuapi_check
             await app.state.services.database.execute(
@@ -827,6 +829,8 @@ class BeatmapSet:
                     "DELETE FROM scores WHERE map_md5 IN :map_md5s",
                     {"map_md5s": map_md5s_to_delete},
                 )
+                for map_md5 in map_md5s_to_delete:
+                    app.state.cache.leaderboards.invalidate(map_md5)
 
             # delete set
             await app.state.services.database.execute(
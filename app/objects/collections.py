@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+import time
 from collections.abc import Iterable
 from collections.abc import Iterator
+from collections.abc import KeysView
 from collections.abc import Sequence
-from typing import Any
 
 import databases.core
 
+import app.packets
 import app.settings
 import app.state
 import app.utils
@@ -14,6 +16,7 @@ from app.constants.privileges import ClanPrivileges
 from app.constants.privileges import Privileges
 from app.logging import Ansi
 from app.logging import log
+from app.metrics import Histogram
 from app.objects.channel import Channel
 from app.objects.match import Match
 from app.objects.player import Player
@@ -120,10 +123,37 @@ class Matches(list[Match | None]):
 
 
 class Players(list[Player]):
-    """The currently active players on the server."""
+    """\
+    The currently active players on the server.
 
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        super().__init__(*args, **kwargs)
+    Players are indexed by token, id and safe name for constant-time
+    lookups; the indexes are maintained by `append` & `remove`, and
+    `reindex` must be called after changing an online player's token
+    or name. Since a user may be online with multiple (tourney) clients,
+    lookups by id or name return the earliest session still online.
+
+    The staff, restricted & unrestricted partitions are likewise kept
+    up to date, and `repartition` must be called after changing an
+    online player's privileges (see `Player.update_privs`).
+    """
+
+    def __init__(self, players: Iterable[Player] = ()) -> None:
+        super().__init__()
+
+        self._by_token: dict[str, Player] = {}
+        self._by_id: dict[int, list[Player]] = {}
+        self._by_safe_name: dict[str, list[Player]] = {}
+
+        # the keys each player is currently indexed under
+        self._index_keys: dict[Player, tuple[str, int, str]] = {}
+
+        # privilege partitions; dicts are used as insertion-ordered sets
+        self._staff: dict[Player, None] = {}
+        self._restricted: dict[Player, None] = {}
+        self._unrestricted: dict[Player, None] = {}
+
+        for player in players:
+            self.append(player)
 
     def __iter__(self) -> Iterator[Player]:
         return super().__iter__()
@@ -132,32 +162,83 @@ class Players(list[Player]):
         # allow us to either pass in the player
         # obj, or the player name as a string.
         if isinstance(player, str):
-            return player in (player.name for player in self)
+            return any(
+                p.name == player
+                for p in self._by_safe_name.get(make_safe_name(player), ())
+            )
         else:
-            return super().__contains__(player)
+            return player in self._index_keys
 
     def __repr__(self) -> str:
         return f'[{", ".join(map(repr, self))}]'
 
+    def _index(self, player: Player) -> None:
+        keys = (player.token, player.id, player.safe_name)
+        self._index_keys[player] = keys
+
+        self._by_token[keys[0]] = player
+        self._by_id.setdefault(keys[1], []).append(player)
+        self._by_safe_name.setdefault(keys[2], []).append(player)
+
+    def _unindex(self, player: Player) -> None:
+        token, id, safe_name = self._index_keys.pop(player)
+
+        if self._by_token.get(token) is player:
+            del self._by_token[token]
+
+        self._by_id[id].remove(player)
+        if not self._by_id[id]:
+            del self._by_id[id]
+
+        self._by_safe_name[safe_name].remove(player)
+        if not self._by_safe_name[safe_name]:
+            del self._by_safe_name[safe_name]
+
+    def reindex(self, player: Player) -> None:
+        """Update the indexes after a change to `player`'s token or name."""
+        if player in self._index_keys:
+            self._unindex(player)
+            self._index(player)
+
+    def repartition(self, player: Player) -> None:
+        """Update the partitions after a change to `player`'s privileges."""
+        if player not in self._index_keys:
+            return
+
+        for partition, is_member in (
+            (self._staff, bool(player.priv & Privileges.STAFF)),
+            (self._restricted, player.restricted),
+            (self._unrestricted, not player.restricted),
+        ):
+            if is_member:
+                partition.setdefault(player, None)
+            else:
+                partition.pop(player, None)
+
+        if player.restricted:
+            app.state.sessions.roster.remove(player)
+        elif player not in app.state.sessions.roster:
+            app.state.sessions.roster.add(player)
+
     @property
     def ids(self) -> set[int]:
         """Return a set of the current ids in the list."""
-        return {p.id for p in self}
+        return set(self._by_id)
 
     @property
-    def staff(self) -> set[Player]:
-        """Return a set of the current staff online."""
-        return {p for p in self if p.priv & Privileges.STAFF}
+    def staff(self) -> KeysView[Player]:
+        """Return a read-only view of the current staff online."""
+        return self._staff.keys()
 
     @property
-    def restricted(self) -> set[Player]:
-        """Return a set of the current restricted players."""
-        return {p for p in self if not p.priv & Privileges.UNRESTRICTED}
+    def restricted(self) -> KeysView[Player]:
+        """Return a read-only view of the current restricted players."""
+        return self._restricted.keys()
 
     @property
-    def unrestricted(self) -> set[Player]:
-        """Return a set of the current unrestricted players."""
-        return {p for p in self if p.priv & Privileges.UNRESTRICTED}
+    def unrestricted(self) -> KeysView[Player]:
+        """Return a read-only view of the current unrestricted players."""
+        return self._unrestricted.keys()
 
     def enqueue(self, data: bytes, immune: Sequence[Player] = []) -> None:
         """Enqueue `data` to all players, except for those in `immune`."""
@@ -172,18 +253,17 @@ class Players(list[Player]):
         name: str | None = None,
     ) -> Player | None:
         """Get a player by token, id, or name from cache."""
-        for player in self:
-            if token is not None:
-                if player.token == token:
-                    return player
-            elif id is not None:
-                if player.id == id:
-                    return player
-            elif name is not None:
-                if player.safe_name == make_safe_name(name):
-                    return player
+        if token is not None:
+            return self._by_token.get(token)
 
-        return None
+        if id is not None:
+            sessions = self._by_id.get(id)
+        elif name is not None:
+            sessions = self._by_safe_name.get(make_safe_name(name))
+        else:
+            return None
+
+        return sessions[0] if sessions else None
 
     async def get_sql(
         self,
@@ -273,6 +353,8 @@ class Players(list[Player]):
             return
 
         super().append(player)
+        self._index(player)
+        self.repartition(player)
 
     def remove(self, player: Player) -> None:
         """Remove `p` from the list."""
@@ -282,6 +364,199 @@ class Players(list[Player]):
             return
 
         super().remove(player)
+        self._unindex(player)
+        app.state.sessions.timeouts.cancel(player)
+
+        self._staff.pop(player, None)
+        self._restricted.pop(player, None)
+        self._unrestricted.pop(player, None)
+        app.state.sessions.roster.remove(player)
+
+
+class Roster:
+    """\
+    The presence & stats of the unrestricted players online,
+    as sent to each player when they log in.
+
+    Each player's presence & stats are kept as a pre-concatenated
+    segment, and the full roster is joined into a single buffer
+    which is reused until a player joins, leaves, or has their
+    presence or stats changed (see `Player.bump_presence_version`).
+    """
+
+    def __init__(self) -> None:
+        self._segments: dict[Player, bytes] = {}
+        self._stale: set[Player] = set()
+        self._data: bytes | None = None
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def __contains__(self, player: object) -> bool:
+        return player in self._segments
+
+    def add(self, player: Player) -> None:
+        """Add `player`'s presence & stats to the roster."""
+        self._segments[player] = b""
+        self._stale.add(player)
+        self._data = None
+
+    def remove(self, player: Player) -> None:
+        """Remove `player`'s presence & stats from the roster."""
+        if self._segments.pop(player, None) is not None:
+            self._stale.discard(player)
+            self._data = None
+
+    def invalidate(self, player: Player) -> None:
+        """Mark `player`'s presence & stats as changed."""
+        if player not in self._segments:
+            return
+
+        if player.restricted:
+            self.remove(player)
+            return
+
+        self._stale.add(player)
+        self._data = None
+
+    def serialize(self) -> bytes:
+        """Return the presence & stats of all players in the roster."""
+        if self._data is None:
+            for player in self._stale:
+                if player.is_bot_client:
+                    # optimization for bot since it's
+                    # the most frequently requested user
+                    self._segments[player] = app.packets.bot_presence(
+                        player,
+                    ) + app.packets.bot_stats(player)
+                else:
+                    self._segments[player] = app.packets.user_presence(
+                        player,
+                    ) + app.packets.user_stats(player)
+
+            self._stale.clear()
+            self._data = b"".join(self._segments.values())
+
+        return self._data
+
+
+class StatsBroadcaster:
+    """\
+    Coalesces the broadcasting of players' stats to everyone online.
+
+    Rather than sending each change as it happens, players are marked
+    as changed with `schedule`, and `flush` (called on a short interval
+    from the housekeeping tasks) sends each changed player's current
+    stats once, in a single buffer shared between all recipients.
+    """
+
+    def __init__(self) -> None:
+        # dicts are used as insertion-ordered sets
+        self._scheduled: dict[Player, None] = {}
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def __contains__(self, player: object) -> bool:
+        return player in self._scheduled
+
+    def schedule(self, player: Player) -> None:
+        """Schedule `player`'s stats to be broadcast on the next flush."""
+        if not player.restricted:
+            self._scheduled[player] = None
+
+    def flush(self) -> None:
+        """Broadcast the current stats of all scheduled players."""
+        if not self._scheduled:
+            return
+
+        players = app.state.sessions.players
+        data = b"".join(
+            [
+                app.packets.user_stats(player)
+                for player in self._scheduled
+                if player in players and not player.restricted
+            ],
+        )
+        self._scheduled.clear()
+
+        if data:
+            players.enqueue(data)
+
+
+class TimeoutWheel:
+    """\
+    A hashed timer wheel of players keyed by the time they time out.
+
+    Deadlines are hashed into one-second slots, so (re)scheduling a
+    player is O(1), and `expire` only visits the slots which have come
+    due since it was last called, rather than every player online.
+    Deadlines further away than the wheel's size simply stay in their
+    slot until it comes around again.
+    """
+
+    SLOT_COUNT = 512  # seconds
+
+    def __init__(self) -> None:
+        self._slots: list[set[Player]] = [set() for _ in range(self.SLOT_COUNT)]
+        self._deadlines: dict[Player, float] = {}
+        self._slot_indexes: dict[Player, int] = {}
+
+        # the next second to be expired.
+        self._cursor = int(time.time())
+
+        self.expired_count = 0
+        self.expiry_delay_ms = Histogram()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, player: object) -> bool:
+        return player in self._deadlines
+
+    def schedule(self, player: Player, deadline: float) -> None:
+        """Schedule `player` to time out at `deadline` (unix time)."""
+        # deadlines already passed go in the next slot to be expired.
+        index = max(int(deadline), self._cursor) % self.SLOT_COUNT
+        previous_index = self._slot_indexes.get(player)
+
+        self._deadlines[player] = deadline
+
+        if index != previous_index:
+            if previous_index is not None:
+                self._slots[previous_index].discard(player)
+
+            self._slots[index].add(player)
+            self._slot_indexes[player] = index
+
+    def cancel(self, player: Player) -> None:
+        """Remove `player` from the wheel."""
+        if player in self._deadlines:
+            del self._deadlines[player]
+            self._slots[self._slot_indexes.pop(player)].discard(player)
+
+    def expire(self, now: float) -> list[Player]:
+        """Remove & return the players who have timed out as of `now`."""
+        expired: list[Player] = []
+
+        # only visit each slot once, if we've fallen a full turn behind
+        self._cursor = max(self._cursor, int(now) - self.SLOT_COUNT)
+
+        while self._cursor < int(now):
+            slot = self._slots[self._cursor % self.SLOT_COUNT]
+
+            for player in [p for p in slot if self._deadlines[p] < self._cursor + 1]:
+                slot.remove(player)
+                del self._slot_indexes[player]
+                deadline = self._deadlines.pop(player)
+
+                expired.append(player)
+                self.expiry_delay_ms.record(int((now - deadline) * 1000))
+
+            self._cursor += 1
+
+        self.expired_count += len(expired)
+        return expired
 
 
 async def initialize_ram_caches() -> None:
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from bisect import insort
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+from typing import Literal
+from typing import NamedTuple
+
+# (map md5, mode, scoring metric)
+LeaderboardKey = tuple[str, int, Literal["pp", "score"]]
+
+# (leaderboard type, filter), e.g. ("mods", 72) or ("country", "ca")
+LeaderboardView = tuple[str, int | str | None]
+
+# the approximate memory used by each cached score, including its
+# entries in the leaderboard's sorted list & by-user dict.
+SCORE_SIZE_ESTIMATE = 640
+
+
+@dataclass(slots=True)
+class LeaderboardScore:
+    """A player's best score on a beatmap, as shown on its leaderboard."""
+
+    id: int
+    score: float  # the value of the leaderboard's scoring metric
+    max_combo: int
+    n50: int
+    n100: int
+    n300: int
+    nmiss: int
+    nkatu: int
+    ngeki: int
+    perfect: int
+    mods: int
+    time: int  # unix timestamp
+    userid: int
+    name: str
+    clan_tag: str | None
+    country: str
+
+    @property
+    def display_name(self) -> str:
+        if self.clan_tag is not None:
+            return f"[{self.clan_tag}] {self.name}"
+        return self.name
+
+    def as_row(self) -> dict[str, Any]:
+        """Return the score in the form of a leaderboard sql row."""
+        return {
+            "id": self.id,
+            "_score": self.score,
+            "max_combo": self.max_combo,
+            "n50": self.n50,
+            "n100": self.n100,
+            "n300": self.n300,
+            "nmiss": self.nmiss,
+            "nkatu": self.nkatu,
+            "ngeki": self.ngeki,
+            "perfect": self.perfect,
+            "mods": self.mods,
+            "time": self.time,
+            "userid": self.userid,
+            "name": self.display_name,
+        }
+
+
+class RenderedScores(NamedTuple):
+    """The score listings of a leaderboard view, as sent to the osu! client."""
+
+    score_count: int
+    body: bytes
+
+
+def _sort_key(score: LeaderboardScore) -> tuple[float, int]:
+    # highest first, with ties going to the earliest submission
+    return (-score.score, score.id)
+
+
+class Leaderboard:
+    """\
+    The best scores of every player on a beatmap in a single mode,
+    sorted by a scoring metric.
+
+    Scores of restricted players are kept, but only shown to their
+    owners; they don't count towards the placement of other scores.
+    """
+
+    def __init__(
+        self,
+        scores: Iterable[LeaderboardScore] = (),
+        restricted_user_ids: Iterable[int] = (),
+    ) -> None:
+        self.loaded_at = time.monotonic()
+
+        # the map's average rating, once fetched
+        self.rating: float | None = None
+
+        # responses for views shared by all players, cleared on any change
+        self._rendered: dict[LeaderboardView, RenderedScores] = {}
+
+        self._restricted = set(restricted_user_ids)
+        self._by_user: dict[int, LeaderboardScore] = {}
+        self._visible: list[LeaderboardScore] = []
+
+        for score in scores:
+            self._by_user[score.userid] = score
+            if score.userid not in self._restricted:
+                self._visible.append(score)
+
+        self._visible.sort(key=_sort_key)
+
+    def __len__(self) -> int:
+        return len(self._by_user)
+
+    @property
+    def size_bytes(self) -> int:
+        rendered_bytes = sum(len(rendered.body) for rendered in self._rendered.values())
+        return len(self._by_user) * SCORE_SIZE_ESTIMATE + rendered_bytes
+
+    def rendered(self, view: LeaderboardView) -> RenderedScores | None:
+        return self._rendered.get(view)
+
+    def set_rendered(self, view: LeaderboardView, rendered: RenderedScores) -> None:
+        self._rendered[view] = rendered
+
+    def personal_best(self, user_id: int) -> LeaderboardScore | None:
+        return self._by_user.get(user_id)
+
+    def placement(self, score: float) -> int:
+        """The placement a score of `score` would have (1-based)."""
+        # the number of visible scores strictly better than `score`
+        return bisect_left(self._visible, (-score, -1), key=_sort_key) + 1
+
+    def top(
+        self,
+        limit: int,
+        user_id: int,
+        predicate: Callable[[LeaderboardScore], bool] | None = None,
+    ) -> list[LeaderboardScore]:
+        """\
+        Return the best `limit` scores matching `predicate`, as seen by
+        the player with `user_id` (who may see their own restricted score).
+        """
+        if predicate is None:
+            scores = self._visible[:limit]
+        else:
+            scores = []
+            for score in self._visible:
+                if predicate(score):
+                    scores.append(score)
+                    if len(scores) == limit:
+                        break
+
+        if user_id in self._restricted:
+            own_score = self._by_user.get(user_id)
+            if own_score is not None and (predicate is None or predicate(own_score)):
+                insort(scores, own_score, key=_sort_key)
+                del scores[limit:]
+
+        return scores
+
+    def upsert(self, score: LeaderboardScore, restricted: bool) -> None:
+        """\
+        Set a player's best score, replacing any previous best; hidden
+        from other players if the player is `restricted`.
+        """
+        self.remove_user(score.userid)
+        self._rendered.clear()
+
+        # they may have been (un)restricted since the leaderboard was loaded
+        if restricted:
+            self._restricted.add(score.userid)
+        else:
+            self._restricted.discard(score.userid)
+
+        self._by_user[score.userid] = score
+        if score.userid not in self._restricted:
+            insort(self._visible, score, key=_sort_key)
+
+    def remove_user(self, user_id: int) -> None:
+        score = self._by_user.pop(user_id, None)
+        if score is not None and user_id not in self._restricted:
+            self._visible.pop(self._index_of(score))
+            self._rendered.clear()
+
+    def set_restricted(self, user_id: int, restricted: bool) -> None:
+        if restricted == (user_id in self._restricted):
+            return
+
+        score = self._by_user.get(user_id)
+        if score is not None:
+            self._rendered.clear()
+
+        if restricted:
+            self._restricted.add(user_id)
+            if score is not None:
+                self._visible.pop(self._index_of(score))
+        else:
+            self._restricted.discard(user_id)
+            if score is not None:
+                insort(self._visible, score, key=_sort_key)
+
+    def set_name(self, user_id: int, name: str) -> None:
+        score = self._by_user.get(user_id)
+        if score is not None and score.name != name:
+            score.name = name
+            self._rendered.clear()
+
+    def set_clan_tag(self, user_id: int, clan_tag: str | None) -> None:
+        score = self._by_user.get(user_id)
+        if score is not None and score.clan_tag != clan_tag:
+            score.clan_tag = clan_tag
+            self._rendered.clear()
+
+    def _index_of(self, score: LeaderboardScore) -> int:
+        return bisect_left(self._visible, _sort_key(score), key=_sort_key)
+
+
+class LeaderboardCache:
+    """\
+    An lru cache of beatmap leaderboards, bounded by (approximate) memory
+    use & age, which is kept up to date as scores are submitted & players
+    are restricted or renamed.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._leaderboards: OrderedDict[LeaderboardKey, Leaderboard] = OrderedDict()
+        self._bytes = 0
+
+        # keys of leaderboards being loaded, & whether they've been
+        # modified since the load began (and so may now be stale).
+        self._loading: dict[LeaderboardKey, bool] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._leaderboards)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: LeaderboardKey) -> Leaderboard | None:
+        leaderboard = self._leaderboards.get(key)
+        if leaderboard is None:
+            self.misses += 1
+            return None
+
+        if time.monotonic() - leaderboard.loaded_at >= self.ttl:
+            self._pop(key)
+            self.misses += 1
+            return None
+
+        self._leaderboards.move_to_end(key)
+        self.hits += 1
+        return leaderboard
+
+    def has_map(self, map_md5: str, mode: int) -> bool:
+        return bool(self._cached_for_map(map_md5, mode))
+
+    def begin_load(self, key: LeaderboardKey) -> None:
+        """Mark `key` as being loaded, so changes to it can be tracked."""
+        self._loading[key] = False
+
+    def cancel_load(self, key: LeaderboardKey) -> None:
+        self._loading.pop(key, None)
+
+    def finish_load(self, key: LeaderboardKey, leaderboard: Leaderboard) -> bool:
+        """\
+        Cache a leaderboard loaded since `begin_load`, unless it was
+        modified during the load. Returns whether it was cached.
+        """
+        modified = self._loading.pop(key, True)
+        if modified:
+            return False
+
+        self._pop(key)
+        self._leaderboards[key] = leaderboard
+        self._bytes += leaderboard.size_bytes
+        self._evict()
+        return True
+
+    def _pop(self, key: LeaderboardKey) -> None:
+        leaderboard = self._leaderboards.pop(key, None)
+        if leaderboard is not None:
+            self._bytes -= leaderboard.size_bytes
+
+    def _evict(self) -> None:
+        # always keep the most recently used leaderboard
+        while self._bytes > self.max_bytes and len(self._leaderboards) > 1:
+            _, leaderboard = self._leaderboards.popitem(last=False)
+            self._bytes -= leaderboard.size_bytes
+            self.evictions += 1
+
+    def mark_modified(self, map_md5: str | None = None) -> None:
+        """Mark loads in progress (of `map_md5`, or all maps) as stale."""
+        for key in self._loading:
+            if map_md5 is None or key[0] == map_md5:
+                self._loading[key] = True
+
+    def _cached_for_map(self, map_md5: str, mode: int) -> list[LeaderboardKey]:
+        keys: tuple[LeaderboardKey, ...] = (
+            (map_md5, mode, "pp"),
+            (map_md5, mode, "score"),
+        )
+        return [key for key in keys if key in self._leaderboards]
+
+    def upsert(
+        self,
+        map_md5: str,
+        mode: int,
+        scores: dict[Literal["pp", "score"], LeaderboardScore],
+        restricted: bool,
+    ) -> None:
+        """Set a player's best score on each cached leaderboard of a map."""
+        self.mark_modified(map_md5)
+
+        for key in self._cached_for_map(map_md5, mode):
+            self._update(
+                key,
+                lambda leaderboard: leaderboard.upsert(scores[key[2]], restricted),
+            )
+
+        self._evict()
+
+    def _update(
+        self,
+        key: LeaderboardKey,
+        update: Callable[[Leaderboard], None],
+    ) -> None:
+        """Update a cached leaderboard, accounting for its change in size."""
+        leaderboard = self._leaderboards[key]
+        self._bytes -= leaderboard.size_bytes
+        update(leaderboard)
+        self._bytes += leaderboard.size_bytes
+
+    def store_rendered(
+        self,
+        key: LeaderboardKey,
+        leaderboard: Leaderboard,
+        view: LeaderboardView,
+        rendered: RenderedScores,
+    ) -> None:
+        """Store a rendered view of `leaderboard`, cached under `key`."""
+        if self._leaderboards.get(key) is not leaderboard:
+            # no longer cached; it may have been evicted or reloaded
+            return
+
+        self._update(key, lambda leaderboard: leaderboard.set_rendered(view, rendered))
+        self._evict()
+
+    def invalidate_rating(self, map_md5: str) -> None:
+        for key, leaderboard in self._leaderboards.items():
+            if key[0] == map_md5:
+                leaderboard.rating = None
+
+    def invalidate(self, map_md5: str) -> None:
+        """Drop all cached leaderboards of a map."""
+        self.mark_modified(map_md5)
+
+        for key in [key for key in self._leaderboards if key[0] == map_md5]:
+            self._pop(key)
+
+    def set_restricted(self, user_id: int, restricted: bool) -> None:
+        self.mark_modified()
+
+        for key in self._leaderboards:
+            self._update(
+                key,
+                lambda leaderboard: leaderboard.set_restricted(user_id, restricted),
+            )
+
+    def set_name(self, user_id: int, name: str) -> None:
+        self.mark_modified()
+
+        for key in self._leaderboards:
+            self._update(key, lambda leaderboard: leaderboard.set_name(user_id, name))
+
+    def set_clan_tag(self, user_id: int, clan_tag: str | None) -> None:
+        self.mark_modified()
+
+        for key in self._leaderboards:
+            self._update(
+                key,
+                lambda leaderboard: leaderboard.set_clan_tag(user_id, clan_tag),
+            )
@@ -11,13 +11,14 @@ from enum import unique
 from functools import cached_property
 from typing import TYPE_CHECKING
 from typing import TypedDict
-from typing import cast
 
 import databases.core
 
 import app.packets
 import app.settings
 import app.state
+import app.usecases.ranks
+import app.usecases.user_stats
 from app._typing import IPAddress
 from app.constants.gamemodes import GameMode
 from app.constants.mods import Mods
@@ -34,6 +35,7 @@ from app.objects.match import Slot
 from app.objects.match import SlotStatus
 from app.objects.score import Grade
 from app.objects.score import Score
+from app.objects.user_stats import UserStats
 from app.repositories import clans as clans_repo
 from app.repositories import logs as logs_repo
 from app.repositories import stats as stats_repo
@@ -201,11 +203,19 @@ class Player:
     is_tourney_client: `bool`
         Whether this is a management/spectator tourney client.
 
-    _packet_queue: `bytearray`
+    presence_version: `int`
+        A counter bumped whenever the player's presence or stats
+        (status, stats, privileges, geolocation) change.
+        XXX: cls.packet_cache memoizes the player's serialized
+             presence & stats packets against this version.
+
+    _packet_queue: `list[bytes]`
         Bytes enqueued to the player which will be transmitted
         at the tail end of their next connection to the server.
         XXX: cls.enqueue() will add data to this queue, and
              cls.dequeue() will return the data, and remove it.
+        XXX: the data is kept as a list of (often shared) chunks,
+             which are only joined once, at dequeue time.
     """
 
     def __init__(
@@ -288,7 +298,19 @@ class Player:
         # store the last beatmap /np'ed by the user.
         self.last_np: LastNp | None = None
 
-        self._packet_queue = bytearray()
+        # the grades of the player's best scores in each vanilla
+        # mode, once fetched for a beatmap info request.
+        self.best_grades: dict[int, dict[str, str]] = {}  # {mode: {md5: grade}}
+
+        # the player's serialized presence & stats,
+        # memoized against their presence version.
+        self.presence_version = 0
+        self.packet_cache: dict[app.packets.ServerPackets, tuple[int, bytes]] = {}
+
+        self._packet_queue: list[bytes] = []
+        self._packet_queue_size = 0
+        self._packet_queue_limit = app.settings.PACKET_QUEUE_MAX_BYTES
+        self._packet_queue_overflowed = False
 
     def __repr__(self) -> str:
         return f"<{self.name} ({self.id})>"
@@ -371,6 +393,11 @@ class Player:
 
         return score
 
+    def bump_presence_version(self) -> None:
+        """Invalidate `self`'s memoized presence & stats packets."""
+        self.presence_version += 1
+        app.state.sessions.roster.invalidate(self)
+
     @staticmethod
     def generate_token() -> str:
         """Generate a random uuid as a token."""
@@ -413,6 +440,9 @@ class Player:
         if "bancho_priv" in vars(self):
             del self.bancho_priv  # wipe cached_property
 
+        app.state.sessions.players.repartition(self)
+        self.bump_presence_version()
+
         await users_repo.partial_update(
             id=self.id,
             priv=self.priv,
@@ -425,6 +455,9 @@ class Player:
         if "bancho_priv" in vars(self):
             del self.bancho_priv  # wipe cached_property
 
+        app.state.sessions.players.repartition(self)
+        self.bump_presence_version()
+
         await users_repo.partial_update(
             id=self.id,
             priv=self.priv,
@@ -442,6 +475,9 @@ class Player:
         if "bancho_priv" in vars(self):
             del self.bancho_priv  # wipe cached_property
 
+        app.state.sessions.players.repartition(self)
+        self.bump_presence_version()
+
         await users_repo.partial_update(
             id=self.id,
             priv=self.priv,
@@ -463,15 +499,8 @@ class Player:
             msg=reason,
         )
 
-        for mode in (0, 1, 2, 3, 4, 5, 6, 8):
-            await app.state.services.redis.zrem(
-                f"bancho:leaderboard:{mode}",
-                self.id,
-            )
-            await app.state.services.redis.zrem(
-                f'bancho:leaderboard:{mode}:{self.geoloc["country"]["acronym"]}',
-                self.id,
-            )
+        await app.usecases.ranks.remove(self.id, self.geoloc["country"]["acronym"])
+        app.state.cache.leaderboards.set_restricted(self.id, True)
 
         log_msg = f"{admin} restricted {self} for: {reason}."
 
@@ -500,15 +529,12 @@ class Player:
         if not self.is_online:
             await self.stats_from_sql_full()
 
-        for mode, stats in self.stats.items():
-            await app.state.services.redis.zadd(
-                f"bancho:leaderboard:{mode.value}",
-                {str(self.id): stats.pp},
-            )
-            await app.state.services.redis.zadd(
-                f"bancho:leaderboard:{mode.value}:{self.geoloc['country']['acronym']}",
-                {str(self.id): stats.pp},
-            )
+        await app.usecases.ranks.add(
+            self.id,
+            self.geoloc["country"]["acronym"],
+            {mode: stats.pp for mode, stats in self.stats.items()},
+        )
+        app.state.cache.leaderboards.set_restricted(self.id, False)
 
         log_msg = f"{admin} unrestricted {self} for: {reason}."
 
@@ -913,42 +939,36 @@ class Player:
         if self.restricted:
             return 0
 
-        rank = await app.state.services.redis.zrevrank(
-            f"bancho:leaderboard:{mode.value}",
-            str(self.id),
-        )
-        return cast(int, rank) + 1 if rank is not None else 0
+        ranks = await app.usecases.ranks.fetch_many(self.id, modes=[mode.value])
+        return ranks[mode.value].global_rank
 
     async def get_country_rank(self, mode: GameMode) -> int:
         if self.restricted:
             return 0
 
-        country = self.geoloc["country"]["acronym"]
-        rank = await app.state.services.redis.zrevrank(
-            f"bancho:leaderboard:{mode.value}:{country}",
-            str(self.id),
+        ranks = await app.usecases.ranks.fetch_many(
+            self.id,
+            modes=[mode.value],
+            country=self.geoloc["country"]["acronym"],
         )
-
-        return cast(int, rank) + 1 if rank is not None else 0
+        return ranks[mode.value].country_rank
 
     async def update_rank(self, mode: GameMode) -> int:
         country = self.geoloc["country"]["acronym"]
         stats = self.stats[mode]
 
         if not self.restricted:
-            # global rank
-            await app.state.services.redis.zadd(
-                f"bancho:leaderboard:{mode.value}",
-                {str(self.id): stats.pp},
-            )
-
-            # country rank
-            await app.state.services.redis.zadd(
-                f"bancho:leaderboard:{mode.value}:{country}",
-                {str(self.id): stats.pp},
+            stats.rank = await app.usecases.ranks.update(
+                self.id,
+                country,
+                mode,
+                stats.pp,
             )
+        else:
+            stats.rank = 0
 
-        return await self.get_global_rank(mode)
+        self.bump_presence_version()
+        return stats.rank
 
     async def recalc_stats_sql(self, mode: GameMode) -> ModeData:
         """Recalculate `self`'s stats from sql."""
@@ -977,12 +997,46 @@ class Player:
             Grade.S: row["s_count"],
             Grade.A: row["a_count"],
         }
+        self.bump_presence_version()
+        return md
+
+    async def update_stats(self, score: Score, user_stats: UserStats) -> ModeData:
+        """Update `self`'s stats (fetched before submission) with a new score."""
+        await app.usecases.user_stats.submit_score(score, user_stats)
+        md = self.stats[score.mode]
+
+        md.tscore = user_stats.tscore
+        md.rscore = user_stats.rscore
+        md.pp = user_stats.pp
+        md.acc = user_stats.acc
+        md.plays = user_stats.plays
+        md.playtime = user_stats.playtime
+        md.max_combo = user_stats.max_combo
+        md.total_hits = user_stats.total_hits
+        md.grades = {
+            Grade.XH: user_stats.grades.get("XH", 0),
+            Grade.X: user_stats.grades.get("X", 0),
+            Grade.SH: user_stats.grades.get("SH", 0),
+            Grade.S: user_stats.grades.get("S", 0),
+            Grade.A: user_stats.grades.get("A", 0),
+        }
+        self.bump_presence_version()
         return md
 
     async def stats_from_sql_full(self) -> None:
         """Retrieve `self`'s stats (all modes) from sql."""
-        for row in await stats_repo.fetch_many(player_id=self.id):
+        rows = await stats_repo.fetch_many(player_id=self.id)
+        if not self.restricted:
+            ranks = await app.usecases.ranks.fetch_many(
+                self.id,
+                modes=[row["mode"] for row in rows],
+            )
+        else:
+            ranks = {}
+
+        for row in rows:
             game_mode = GameMode(row["mode"])
+            rank = ranks[row["mode"]].global_rank if row["mode"] in ranks else 0
             self.stats[game_mode] = ModeData(
                 tscore=row["tscore"],
                 rscore=row["rscore"],
@@ -992,7 +1046,7 @@ class Player:
                 playtime=row["playtime"],
                 max_combo=row["max_combo"],
                 total_hits=row["total_hits"],
-                rank=await self.get_global_rank(game_mode),
+                rank=rank,
                 grades={
                     Grade.XH: row["xh_count"],
                     Grade.X: row["x_count"],
@@ -1002,6 +1056,8 @@ class Player:
                 },
             )
 
+        self.bump_presence_version()
+
     def update_latest_activity_soon(self) -> None:
         """Update the player's latest activity in the database."""
         task = users_repo.partial_update(
@@ -1012,13 +1068,63 @@ class Player:
 
     def enqueue(self, data: bytes) -> None:
         """Add data to be sent to the client."""
-        self._packet_queue += data
+        if self._packet_queue_overflowed:
+            return  # being disconnected for falling behind
+
+        self._packet_queue.append(data)
+        self._packet_queue_size += len(data)
+
+        if self._packet_queue_size > self._packet_queue_limit:
+            # the client has stopped polling for data; drop any
+            # packets which have been superseded by newer ones.
+            self._packet_queue = app.packets.coalesce_packets(self._packet_queue)
+            self._packet_queue_size = sum(map(len, self._packet_queue))
+
+            if self._packet_queue_size > app.settings.PACKET_QUEUE_MAX_BYTES:
+                # then any which aren't essential (e.g. spectator frames)
+                self._packet_queue = app.packets.drop_packets(
+                    self._packet_queue,
+                    app.packets.DROPPABLE_PACKETS,
+                )
+                self._packet_queue_size = sum(map(len, self._packet_queue))
+
+            if self._packet_queue_size > app.settings.PACKET_QUEUE_MAX_BYTES:
+                # the client isn't keeping up; disconnect it, rather
+                # than letting its queue grow without bound.
+                log(
+                    f"Disconnecting {self}; their packet queue is over "
+                    f"capacity ({self._packet_queue_size} bytes).",
+                    Ansi.LYELLOW,
+                )
+                self._packet_queue.clear()
+                self._packet_queue_size = 0
+                self._packet_queue_overflowed = True
+
+                # (not right away; we may be in the middle of a broadcast)
+                app.state.loop.call_soon(self._disconnect_overflowed)
+                return
+
+            # allow the queue to grow a bit before trying again,
+            # so we're not coalescing the queue on every enqueue.
+            self._packet_queue_limit = max(
+                app.settings.PACKET_QUEUE_MAX_BYTES,
+                self._packet_queue_size * 2,
+            )
+
+    def _disconnect_overflowed(self) -> None:
+        if app.state.services.datadog:
+            app.state.services.datadog.increment("bancho.packet_queue_overflows")  # type: ignore[no-untyped-call]
+
+        if self.is_online:
+            self.logout()
 
     def dequeue(self) -> bytes | None:
         """Get data from the queue to send to the client."""
         if self._packet_queue:
-            data = bytes(self._packet_queue)
+            data = b"".join(self._packet_queue)
             self._packet_queue.clear()
+            self._packet_queue_size = 0
+            self._packet_queue_limit = app.settings.PACKET_QUEUE_MAX_BYTES
             return data
 
         return None
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import math
+import random
+from collections.abc import Iterator
+
+# enough levels for ~16m members per set.
+MAX_LEVEL = 24
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: tuple[float, str], level: int) -> None:
+        self.key = key
+        self.next: list[_Node] = [self] * level  # replaced on insertion
+        # the number of positions each link skips over
+        self.width = [1] * level
+
+
+def _random_level() -> int:
+    # each level holds half the nodes of the level below it
+    return min(MAX_LEVEL, 1 - int(math.log2(1.0 - random.random())))
+
+
+class RankedSet:
+    """\
+    An in-memory equivalent of a redis sorted set, supporting adds,
+    removes & rank lookups in O(log n) time.
+
+    Members are kept in an indexable skip list (each link storing how
+    many members it skips over), ordered by (score, member) just as
+    redis orders them, so ranks match `ZREVRANK` exactly, ties included.
+    """
+
+    def __init__(self) -> None:
+        self._scores: dict[str, float] = {}
+        self._tail = _Node((math.inf, ""), MAX_LEVEL)
+        self._head = _Node((-math.inf, ""), MAX_LEVEL)
+        self._head.next = [self._tail] * MAX_LEVEL
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, member: str) -> bool:
+        return member in self._scores
+
+    def __iter__(self) -> Iterator[tuple[str, float]]:
+        """Iterate over the (member, score) pairs, from lowest to highest."""
+        node = self._head.next[0]
+        while node is not self._tail:
+            score, member = node.key
+            yield member, score
+            node = node.next[0]
+
+    def score(self, member: str) -> float | None:
+        return self._scores.get(member)
+
+    def _find_predecessors(
+        self,
+        key: tuple[float, str],
+    ) -> tuple[list[_Node], list[int]]:
+        """\
+        Find the last node before `key` on each level, along with the
+        position of each of those nodes (the head being at position 0).
+        """
+        chain = [self._head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+
+        node = self._head
+        position = 0
+        for level in range(MAX_LEVEL - 1, -1, -1):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+
+        return chain, positions
+
+    def add(self, member: str, score: float) -> None:
+        """Add `member` with `score`, replacing any existing score."""
+        current_score = self._scores.get(member)
+        if current_score == score:
+            return
+
+        if current_score is not None:
+            self.remove(member)
+
+        key = (score, member)
+        chain, positions = self._find_predecessors(key)
+
+        level_count = _random_level()
+        node = _Node(key, level_count)
+        position = positions[0] + 1  # the new node's position
+
+        for level in range(level_count):
+            previous = chain[level]
+            steps = position - positions[level]
+
+            node.next[level] = previous.next[level]
+            node.width[level] = previous.width[level] - steps + 1
+            previous.next[level] = node
+            previous.width[level] = steps
+
+        for level in range(level_count, MAX_LEVEL):
+            chain[level].width[level] += 1
+
+        self._scores[member] = score
+
+    def remove(self, member: str) -> bool:
+        """Remove `member`, returning whether it was present."""
+        score = self._scores.pop(member, None)
+        if score is None:
+            return False
+
+        chain, _ = self._find_predecessors((score, member))
+        node = chain[0].next[0]
+
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+
+        for level in range(len(node.next), MAX_LEVEL):
+            chain[level].width[level] -= 1
+
+        return True
+
+    def reverse_rank(self, member: str) -> int | None:
+        """\
+        Return the 0-based position of `member`, from highest to lowest
+        score (the equivalent of redis' `ZREVRANK`).
+        """
+        score = self._scores.get(member)
+        if score is None:
+            return None
+
+        _, positions = self._find_predecessors((score, member))
+        return len(self._scores) - 1 - positions[0]
+
+
+class RankIndex:
+    """\
+    In-process global & country pp leaderboards for each gamemode,
+    mirroring the `bancho:leaderboard:{mode}[:{country}]` sorted sets.
+    """
+
+    def __init__(self) -> None:
+        self._sets: dict[tuple[int, str | None], RankedSet] = {}
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def items(self) -> Iterator[tuple[str, RankedSet]]:
+        """Iterate over each set, along with its redis key."""
+        for (mode, country), ranked_set in self._sets.items():
+            if country is None:
+                yield f"bancho:leaderboard:{mode}", ranked_set
+            else:
+                yield f"bancho:leaderboard:{mode}:{country}", ranked_set
+
+    def update(self, player_id: int, country: str, mode: int, pp: float) -> None:
+        member = str(player_id)
+        for key in ((mode, None), (mode, country)):
+            ranked_set = self._sets.get(key)
+            if ranked_set is None:
+                ranked_set = self._sets[key] = RankedSet()
+            ranked_set.add(member, pp)
+
+    def remove(self, player_id: int, country: str, mode: int) -> None:
+        member = str(player_id)
+        for key in ((mode, None), (mode, country)):
+            ranked_set = self._sets.get(key)
+            if ranked_set is not None:
+                ranked_set.remove(member)
+
+    def global_rank(self, player_id: int, mode: int) -> int:
+        """Return the player's 1-based global rank, or 0 if unranked."""
+        ranked_set = self._sets.get((mode, None))
+        if ranked_set is None:
+            return 0
+
+        rank = ranked_set.reverse_rank(str(player_id))
+        return rank + 1 if rank is not None else 0
+
+    def country_rank(self, player_id: int, mode: int, country: str) -> int:
+        """Return the player's 1-based country rank, or 0 if unranked."""
+        ranked_set = self._sets.get((mode, country))
+        if ranked_set is None:
+            return 0
+
+        rank = ranked_set.reverse_rank(str(player_id))
+        return rank + 1 if rank is not None else 0
@@ -6,6 +6,7 @@ from datetime import datetime
 from enum import IntEnum, unique
 from pathlib import Path
 from typing import TYPE_CHECKING
+from typing import Literal
 
 import app.state
 import app.usecases.performance
@@ -15,6 +16,7 @@ from app.constants.gamemodes import GameMode
 from app.constants.mods import Mods
 from app.objects.beatmap import Beatmap
 from app.repositories import scores as scores_repo
+from app.usecases import leaderboards as leaderboards_usecases
 from app.usecases.performance import ScoreParams
 from app.utils import escape_enum, pymysql_encode
 
@@ -291,28 +293,21 @@ class Score:
     async def calculate_placement(self) -> int:
         assert self.bmap is not None
 
+        scoring_metric: Literal["pp", "score"]
         if self.mode >= GameMode.RELAX_OSU:
             scoring_metric = "pp"
-            score = self.pp
+            score: float = self.pp
         else:
             scoring_metric = "score"
             score = self.score
 
-        num_better_scores: int | None = await app.state.services.database.fetch_val(
-            "SELECT COUNT(*) AS c FROM scores s "
-            "INNER JOIN users u ON u.id = s.userid "
-            "WHERE s.map_md5 = :map_md5 AND s.mode = :mode "
-            "AND s.status = 2 AND u.priv & 1 "
-            f"AND s.{scoring_metric} > :score",
-            {
-                "map_md5": self.bmap.md5,
-                "mode": self.mode,
-                "score": score,
-            },
-            column=0,  # COUNT(*)
+        # placed by binary search in the (cached) leaderboard
+        leaderboard = await leaderboards_usecases.fetch(
+            self.bmap.md5,
+            self.mode,
+            scoring_metric,
         )
-        assert num_better_scores is not None
-        return num_better_scores + 1
+        return leaderboard.placement(score)
 
     async def calculate_performance(self, beatmap_id: int) -> tuple[float, float]:
         """Calculate PP and star rating for our score."""
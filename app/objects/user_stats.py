@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from bisect import insort
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+# the number of best scores kept for weighting. the nth best score is
+# weighted by 0.95^(n-1), so those beyond this don't affect the total.
+TOP_SCORES_KEPT = 500
+
+_WEIGHTS = [0.95**i for i in range(TOP_SCORES_KEPT)]
+
+# the grades counted in stats, as named in the `scores` table.
+COUNTED_GRADES = ("XH", "X", "SH", "S", "A")
+
+# (-pp, -acc, -score id); sorted as the recalculation query orders them.
+TopScore = tuple[float, float, int]
+
+
+@dataclass
+class UserStats:
+    """\
+    A player's stats in a single gamemode, updated incrementally as they
+    submit scores, rather than recalculated from all of their scores.
+
+    Only the best `TOP_SCORES_KEPT` of their scores counted towards their
+    pp are kept, along with the total number counted (for bonus pp).
+    """
+
+    tscore: int = 0
+    rscore: int = 0
+    plays: int = 0
+    playtime_ms: int = 0
+    max_combo: int = 0
+    total_hits: int = 0
+    grades: dict[str, int] = field(default_factory=dict)  # {grade: count}
+
+    top_scores: list[TopScore] = field(default_factory=list)
+    ranked_count: int = 0
+
+    loaded_at: float = field(default_factory=time.time)
+    modified: bool = False  # since being loaded
+
+    @property
+    def pp(self) -> int:
+        if not self.top_scores:
+            return 0
+
+        weighted_pp = sum(
+            weight * -neg_pp
+            for weight, (neg_pp, _, _) in zip(_WEIGHTS, self.top_scores)
+        )
+        bonus_pp = (1 - 0.9994**self.ranked_count) * 416.6667
+
+        # round half up, as mysql does when storing it
+        return int(weighted_pp + bonus_pp + 0.5)
+
+    @property
+    def acc(self) -> float:
+        if not self.top_scores:
+            return 0.0
+
+        weights = _WEIGHTS[: len(self.top_scores)]
+        weighted_acc = sum(
+            weight * -neg_acc
+            for weight, (_, neg_acc, _) in zip(weights, self.top_scores)
+        )
+        return weighted_acc / sum(weights)
+
+    @property
+    def playtime(self) -> int:
+        return (self.playtime_ms + 500) // 1000
+
+    def add_play(
+        self,
+        score: int,
+        max_combo: int,
+        total_hits: int,
+        time_elapsed: int,
+        grade: str,
+    ) -> None:
+        """Count a submitted score, of any status."""
+        self.tscore += score
+        self.plays += 1
+        self.playtime_ms += time_elapsed
+        self.max_combo = max(self.max_combo, max_combo)
+        self.total_hits += total_hits
+        if grade in COUNTED_GRADES:
+            self.grades[grade] = self.grades.get(grade, 0) + 1
+
+        self.modified = True
+
+    def add_best(self, score_id: int, pp: float, acc: float) -> None:
+        """Count a new best score towards the player's pp."""
+        insort(self.top_scores, (-round(pp, 3), -round(acc, 3), -score_id))
+        del self.top_scores[TOP_SCORES_KEPT:]
+        self.ranked_count += 1
+        self.modified = True
+
+    def remove_best(self, score_id: int, pp: float, acc: float) -> None:
+        """Stop counting a previous best score towards the player's pp."""
+        key = (-round(pp, 3), -round(acc, 3), -score_id)
+        index = bisect_left(self.top_scores, key)
+        if index < len(self.top_scores) and self.top_scores[index] == key:
+            del self.top_scores[index]
+
+        # it may have been beyond the kept scores
+        self.ranked_count -= 1
+        self.modified = True
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "tscore": self.tscore,
+            "rscore": self.rscore,
+            "plays": self.plays,
+            "playtime_ms": self.playtime_ms,
+            "max_combo": self.max_combo,
+            "total_hits": self.total_hits,
+            "grades": self.grades,
+            "top_scores": self.top_scores,
+            "ranked_count": self.ranked_count,
+            "loaded_at": self.loaded_at,
+            "modified": self.modified,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> UserStats:
+        return cls(
+            tscore=data["tscore"],
+            rscore=data["rscore"],
+            plays=data["plays"],
+            playtime_ms=data["playtime_ms"],
+            max_combo=data["max_combo"],
+            total_hits=data["total_hits"],
+            grades=data["grades"],
+            top_scores=[
+                (neg_pp, neg_acc, neg_score_id)
+                for neg_pp, neg_acc, neg_score_id in data["top_scores"]
+            ],
+            ranked_count=data["ranked_count"],
+            loaded_at=data["loaded_at"],
+            modified=data["modified"],
+        )
@@ -12,7 +12,9 @@ from dataclasses import field
 from enum import IntEnum
 from enum import unique
 from functools import cache
+from functools import cached_property
 from functools import lru_cache
+from functools import partial
 from typing import TYPE_CHECKING
 from typing import Any
 from typing import NamedTuple
@@ -21,6 +23,7 @@ from typing import cast
 # from app.objects.beatmap import BeatmapInfo
 
 if TYPE_CHECKING:
+    from app.metrics import PacketStats
     from app.objects.match import Match
     from app.objects.player import Player
 
@@ -253,14 +256,28 @@ class ReplayFrame(NamedTuple):
     time: int
 
 
-class ReplayFrameBundle(NamedTuple):
-    replay_frames: list[ReplayFrame]
+@dataclass
+class ReplayFrameBundle:
     score_frame: ScoreFrame
     action: ReplayAction
     extra: int
     sequence: int
 
     raw_data: memoryview  # readonly
+    frames_data: memoryview  # readonly
+
+    # NOTE: spectator frames are by far the most frequent packet we receive,
+    # and in most cases we only forward the raw data to the spectators.
+    # the frames themselves are only decoded if a handler asks for them.
+    @property
+    def frame_count(self) -> int:
+        return len(self.frames_data) // REPLAYFRAME_FMT.size
+
+    @cached_property
+    def replay_frames(self) -> list[ReplayFrame]:
+        return list(
+            map(ReplayFrame._make, REPLAYFRAME_FMT.iter_unpack(self.frames_data)),
+        )
 
 
 @dataclass
@@ -303,32 +320,91 @@ class BasePacket(ABC):
 PacketMap = dict[ClientPackets, type[BasePacket]]
 
 
+# precompiled readers for the fixed-width
+# portions of the packets we receive.
+PACKET_HEADER_FMT = struct.Struct("<HxI")
+
+_I8 = struct.Struct("<b")
+_I16 = struct.Struct("<h")
+_U16 = struct.Struct("<H")
+_I32 = struct.Struct("<i")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_U64 = struct.Struct("<Q")
+_F16 = struct.Struct("<e")
+_F32 = struct.Struct("<f")
+_F64 = struct.Struct("<d")
+
+MATCH_HEADER_FMT = struct.Struct("<hbbi")  # id, in_progress, powerplay, mods
+MATCH_SLOTS_FMT = struct.Struct("<16b16b")  # slot statuses, slot teams
+MATCH_SETTINGS_FMT = struct.Struct("<ibbbb")  # host, mode, win cond, team type, fm
+MATCH_SLOT_MODS_FMT = struct.Struct("<16i")
+SCOREFRAME_V2_FMT = struct.Struct("<dd")  # combo portion, bonus portion
+REPLAYFRAME_FMT = struct.Struct("<BBffi")
+REPLAYFRAME_BUNDLE_HEADER_FMT = struct.Struct("<iH")  # extra, frame count
+
+
+# NOTE: array lengths are read from client packets, so these caches
+# must be bounded; the common lengths (e.g. lists of online users)
+# stay cached, while arbitrary lengths from bad packets are evicted.
+@lru_cache(maxsize=256)
+def _i32_array_fmt(length: int) -> struct.Struct:
+    return struct.Struct(f"<{length}i")
+
+
+@lru_cache(maxsize=256)
+def _u32_array_fmt(length: int) -> struct.Struct:
+    return struct.Struct(f"<{length}I")
+
+
 class BanchoPacketReader:
     """\
     A class for reading bancho packets
     from the osu! client's request body.
 
+    Rather than re-slicing the body for each read, the reader keeps
+    an integer cursor into a single buffer, and decodes all values
+    in-place using precompiled `struct.Struct` readers.
+
     Attributes
     -----------
     body_view: `memoryview`
         A readonly view of the request's body.
 
+    offset: int
+        The position of the reader's cursor within `body_view`.
+
     packet_map: `dict[ClientPackets, BasePacket]`
         The map of registered packets the reader may handle.
 
-    current_length: int
+    stats: `PacketStats | None`
+        If provided, the type & length of every packet read
+        (including those without a handler) are recorded here.
+
+    current_type: `ClientPackets`
+        The type of the packet currently being handled.
+
+    current_len: `int`
         The length in bytes of the packet currently being handled.
 
     Intended Usage:
     >>> with memoryview(await request.body()) as body_view:
-    ...     for packet in BanchoPacketReader(body_view):
+    ...     for packet in BanchoPacketReader(body_view, packet_map):
     ...         await packet.handle()
     """
 
-    def __init__(self, body_view: memoryview, packet_map: PacketMap) -> None:
+    def __init__(
+        self,
+        body_view: memoryview,
+        packet_map: PacketMap,
+        stats: PacketStats | None = None,
+    ) -> None:
         self.body_view = body_view  # readonly
         self.packet_map = packet_map
+        self.stats = stats
 
+        self.offset = 0
+        self.current_type = ClientPackets.UNKNOWN_PACKET
         self.current_len = 0  # last read packet's length
 
     def __iter__(self) -> Iterator[BasePacket]:
@@ -339,14 +415,16 @@ class BanchoPacketReader:
         # header of a packet we can handle.
         p_type = ClientPackets.UNKNOWN_PACKET
         p_len = 0
-        while self.body_view:  # len(self.view) < 7?
+        while self.offset < len(self.body_view):  # len(self.view) < 7?
             p_type, p_len = self._read_header()
 
+            if self.stats is not None:
+                self.stats.record_packet(p_type, p_len)
+
             if p_type not in self.packet_map:
-                # packet type not handled, remove
-                # from internal buffer and continue.
-                if p_len != 0:
-                    self.body_view = self.body_view[p_len:]
+                # packet type not handled, skip
+                # over its data and continue.
+                self.offset += p_len
             else:
                 # we can handle this one.
                 break
@@ -355,6 +433,7 @@ class BanchoPacketReader:
 
         # we have a packet handler for this.
         packet_cls = self.packet_map[p_type]
+        self.current_type = p_type
         self.current_len = p_len
 
         return packet_cls(self)
@@ -362,74 +441,80 @@ class BanchoPacketReader:
     def _read_header(self) -> tuple[ClientPackets, int]:
         """Read the header of an osu! packet (id & length)."""
         # read type & length from the body
-        data = struct.unpack("<HxI", self.body_view[:7])
-        self.body_view = self.body_view[7:]
-        return ClientPackets(data[0]), data[1]
+        p_type, p_len = PACKET_HEADER_FMT.unpack_from(self.body_view, self.offset)
+        self.offset += 7
+        return ClientPackets(p_type), p_len
+
+    def _unpack(self, fmt: struct.Struct) -> tuple[Any, ...]:
+        """Unpack `fmt` at the cursor & advance past it."""
+        val = fmt.unpack_from(self.body_view, self.offset)
+        self.offset += fmt.size
+        return val
 
     """ public API (exposed for packet handler's __init__ methods) """
 
     def read_raw(self) -> memoryview:
-        val = self.body_view[: self.current_len]
-        self.body_view = self.body_view[self.current_len :]
+        val = self.body_view[self.offset : self.offset + self.current_len]
+        self.offset += self.current_len
         return val
 
     # integral types
 
     def read_i8(self) -> int:
-        val = self.body_view[0]
-        self.body_view = self.body_view[1:]
-        return val - 256 if val > 127 else val
+        (val,) = _I8.unpack_from(self.body_view, self.offset)
+        self.offset += 1
+        return cast(int, val)
 
     def read_u8(self) -> int:
-        val = self.body_view[0]
-        self.body_view = self.body_view[1:]
+        val = self.body_view[self.offset]
+        self.offset += 1
         return val
 
     def read_i16(self) -> int:
-        val = int.from_bytes(self.body_view[:2], "little", signed=True)
-        self.body_view = self.body_view[2:]
-        return val
+        (val,) = _I16.unpack_from(self.body_view, self.offset)
+        self.offset += 2
+        return cast(int, val)
 
     def read_u16(self) -> int:
-        val = int.from_bytes(self.body_view[:2], "little", signed=False)
-        self.body_view = self.body_view[2:]
-        return val
+        (val,) = _U16.unpack_from(self.body_view, self.offset)
+        self.offset += 2
+        return cast(int, val)
 
     def read_i32(self) -> int:
-        val = int.from_bytes(self.body_view[:4], "little", signed=True)
-        self.body_view = self.body_view[4:]
-        return val
+        (val,) = _I32.unpack_from(self.body_view, self.offset)
+        self.offset += 4
+        return cast(int, val)
 
     def read_u32(self) -> int:
-        val = int.from_bytes(self.body_view[:4], "little", signed=False)
-        self.body_view = self.body_view[4:]
-        return val
+        (val,) = _U32.unpack_from(self.body_view, self.offset)
+        self.offset += 4
+        return cast(int, val)
 
     def read_i64(self) -> int:
-        val = int.from_bytes(self.body_view[:8], "little", signed=True)
-        self.body_view = self.body_view[8:]
-        return val
+        (val,) = _I64.unpack_from(self.body_view, self.offset)
+        self.offset += 8
+        return cast(int, val)
 
     def read_u64(self) -> int:
-        val = int.from_bytes(self.body_view[:8], "little", signed=False)
-        self.body_view = self.body_view[8:]
-        return val
+        (val,) = _U64.unpack_from(self.body_view, self.offset)
+        self.offset += 8
+        return cast(int, val)
 
     # floating-point types
 
     def read_f16(self) -> float:
-        (val,) = struct.unpack_from("<e", self.body_view[:2])
-        self.body_view = self.body_view[2:]
+        (val,) = _F16.unpack_from(self.body_view, self.offset)
+        self.offset += 2
         return cast(float, val)
 
     def read_f32(self) -> float:
-        (val,) = struct.unpack_from("<f", self.body_view[:4])
-        self.body_view = self.body_view[4:]
+        (val,) = _F32.unpack_from(self.body_view, self.offset)
+        self.offset += 4
         return cast(float, val)
 
     def read_f64(self) -> float:
-        (val,) = struct.unpack_from("<d", self.body_view[:8])
-        self.body_view = self.body_view[8:]
+        (val,) = _F64.unpack_from(self.body_view, self.offset)
+        self.offset += 8
         return cast(float, val)
 
     # complex types
@@ -437,35 +522,31 @@ class BanchoPacketReader:
     # XXX: some osu! packets use i16 for
     # array length, while others use i32
     def read_i32_list_i16l(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:2], "little")
-        self.body_view = self.body_view[2:]
-
-        val = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
-        return val
+        length = self.read_u16()
+        return self._unpack(_u32_array_fmt(length))
 
     def read_i32_list_i32l(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:4], "little")
-        self.body_view = self.body_view[4:]
-
-        val = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
-        return val
+        length = self.read_u32()
+        return self._unpack(_u32_array_fmt(length))
 
     def read_string(self) -> str:
-        exists = self.body_view[0] == 0x0B
-        self.body_view = self.body_view[1:]
+        view = self.body_view
+        offset = self.offset
+
+        exists = view[offset] == 0x0B
+        offset += 1
 
         if not exists:
             # no string sent.
+            self.offset = offset
             return ""
 
         # non-empty string, decode str length (uleb128)
         length = shift = 0
 
         while True:
-            byte = self.body_view[0]
-            self.body_view = self.body_view[1:]
+            byte = view[offset]
+            offset += 1
 
             length |= (byte & 0x7F) << shift
             if (byte & 0x80) == 0:
@@ -473,8 +554,9 @@ class BanchoPacketReader:
 
             shift += 7
 
-        val = self.body_view[:length].tobytes().decode()  # copy
-        self.body_view = self.body_view[length:]
+        end = offset + length
+        val = str(view[offset:end], "utf-8")
+        self.offset = end
         return val
 
     # custom osu! types
@@ -498,69 +580,87 @@ class BanchoPacketReader:
 
     def read_match(self) -> MultiplayerMatch:
         """Read an osu! match from the internal buffer."""
-        match = MultiplayerMatch(
-            id=self.read_i16(),
-            in_progress=self.read_i8() == 1,
-            powerplay=self.read_i8(),
-            mods=self.read_i32(),
-            name=self.read_string(),
-            passwd=self.read_string(),
-            map_name=self.read_string(),
-            map_id=self.read_i32(),
-            map_md5=self.read_string(),
-            slot_statuses=[self.read_i8() for _ in range(16)],
-            slot_teams=[self.read_i8() for _ in range(16)],
-            # ^^ up to slot_ids, as it relies on slot_statuses ^^
+        match_id, in_progress, powerplay, mods = self._unpack(MATCH_HEADER_FMT)
+        name = self.read_string()
+        passwd = self.read_string()
+        map_name = self.read_string()
+        map_id = self.read_i32()
+        map_md5 = self.read_string()
+
+        slots = self._unpack(MATCH_SLOTS_FMT)
+        slot_statuses = list(slots[:16])
+        slot_teams = list(slots[16:])
+
+        # slot ids are only sent for slots which have a player
+        num_players = sum(1 for status in slot_statuses if status & 124 != 0)
+        slot_ids = list(self._unpack(_i32_array_fmt(num_players)))
+
+        host_id, mode, win_condition, team_type, freemods = self._unpack(
+            MATCH_SETTINGS_FMT,
         )
 
-        for status in match.slot_statuses:
-            if status & 124 != 0:  # slot has a player
-                match.slot_ids.append(self.read_i32())
-
-        match.host_id = self.read_i32()
-        match.mode = self.read_i8()
-        match.win_condition = self.read_i8()
-        match.team_type = self.read_i8()
-        match.freemods = self.read_i8() == 1
+        match = MultiplayerMatch(
+            id=match_id,
+            in_progress=in_progress == 1,
+            powerplay=powerplay,
+            mods=mods,
+            name=name,
+            passwd=passwd,
+            map_name=map_name,
+            map_id=map_id,
+            map_md5=map_md5,
+            slot_statuses=slot_statuses,
+            slot_teams=slot_teams,
+            slot_ids=slot_ids,
+            host_id=host_id,
+            mode=mode,
+            win_condition=win_condition,
+            team_type=team_type,
+            freemods=freemods == 1,
+        )
 
         if match.freemods:
-            match.slot_mods = [self.read_i32() for _ in range(16)]
+            match.slot_mods = list(self._unpack(MATCH_SLOT_MODS_FMT))
 
         match.seed = self.read_i32()  # used for mania random mod
 
         return match
 
     def read_scoreframe(self) -> ScoreFrame:
-        sf = ScoreFrame(*SCOREFRAME_FMT.unpack_from(self.body_view[:29]))
-        self.body_view = self.body_view[29:]
+        sf = ScoreFrame(*self._unpack(SCOREFRAME_FMT))
 
         if sf.score_v2:
-            sf.combo_portion = self.read_f64()
-            sf.bonus_portion = self.read_f64()
+            sf.combo_portion, sf.bonus_portion = self._unpack(SCOREFRAME_V2_FMT)
 
         return sf
 
     def read_replayframe(self) -> ReplayFrame:
-        return ReplayFrame(
-            button_state=self.read_u8(),
-            taiko_byte=self.read_u8(),  # pre-taiko support (<=2008)
-            x=self.read_f32(),
-            y=self.read_f32(),
-            time=self.read_i32(),
-        )
+        return ReplayFrame._make(self._unpack(REPLAYFRAME_FMT))
 
     def read_replayframe_bundle(self) -> ReplayFrameBundle:
         # save raw format to distribute to the other clients
-        raw_data = self.body_view[: self.current_len]
+        raw_data = self.body_view[self.offset : self.offset + self.current_len]
+
+        extra, framecount = self._unpack(REPLAYFRAME_BUNDLE_HEADER_FMT)
+
+        # the frames are fixed-width; skip over them here
+        # and leave them to be decoded only if needed.
+        frames_end = self.offset + framecount * REPLAYFRAME_FMT.size
+        frames_data = self.body_view[self.offset : frames_end]
+        self.offset = frames_end
 
-        extra = self.read_i32()  # bancho proto >= 18
-        framecount = self.read_u16()
-        frames = [self.read_replayframe() for _ in range(framecount)]
         action = ReplayAction(self.read_u8())
         scoreframe = self.read_scoreframe()
         sequence = self.read_u16()
 
-        return ReplayFrameBundle(frames, scoreframe, action, extra, sequence, raw_data)
+        return ReplayFrameBundle(
+            score_frame=scoreframe,
+            action=action,
+            extra=extra,
+            sequence=sequence,
+            raw_data=raw_data,
+            frames_data=frames_data,
+        )
 
 
 # write functions
@@ -582,11 +682,19 @@ def write_uleb128(num: int) -> bytes | bytearray:
     return ret
 
 
+# the vast majority of strings we send are short enough
+# to have their length encoded in a single uleb128 byte.
+_SHORT_STRING_PREFIXES = tuple(b"\x0b" + bytes((i,)) for i in range(0x80))
+
+
 def write_string(s: str) -> bytes:
     """Write `s` into bytes (ULEB128 & string)."""
     if s:
         encoded = s.encode()
-        ret = b"\x0b" + write_uleb128(len(encoded)) + encoded
+        if len(encoded) < 0x80:
+            ret = _SHORT_STRING_PREFIXES[len(encoded)] + encoded
+        else:
+            ret = b"\x0b" + write_uleb128(len(encoded)) + encoded
     else:
         ret = b"\x00"
 
@@ -636,43 +744,56 @@ def write_channel(name: str, topic: str, count: int) -> bytearray:
 #    return ret
 
 
-def write_match(m: Match, send_pw: bool = True) -> bytearray:
-    """Write `m` into bytes (osu! match)."""
-    # 0 is for match type
-    ret = bytearray(struct.pack("<HbbI", m.id, m.in_progress, 0, m.mods))
-    ret += write_string(m.name)
+WRITE_MATCH_HEADER_FMT = struct.Struct("<HbbI")  # id, in_progress, type, mods
+WRITE_MATCH_MAP_ID_FMT = struct.Struct("<i")
+# host, mode, win cond, team type, fm
+WRITE_MATCH_SETTINGS_FMT = struct.Struct("<IBBBB")
+WRITE_MATCH_SEED_FMT = struct.Struct("<I")
 
+
+def write_match(m: Match, send_pw: bool = True) -> bytes:
+    """Write `m` into bytes (osu! match)."""
     # osu expects \x0b\x00 if there's a password, but it's
     # not being sent, and \x00 if there's no password.
     if m.passwd:
         if send_pw:
-            ret += write_string(m.passwd)
+            passwd = write_string(m.passwd)
         else:
-            ret += b"\x0b\x00"
+            passwd = b"\x0b\x00"
     else:
-        ret += b"\x00"
-
-    ret += write_string(m.map_name)
-    ret += m.map_id.to_bytes(4, "little", signed=True)
-    ret += write_string(m.map_md5)
-
-    ret.extend([s.status for s in m.slots])
-    ret.extend([s.team for s in m.slots])
+        passwd = b"\x00"
 
+    slot_player_ids = []
     for s in m.slots:
         if s.status & 0b01111100 != 0:  # SlotStatus.has_player
             assert s.player is not None
-            ret += s.player.id.to_bytes(4, "little")
-
-    ret += m.host.id.to_bytes(4, "little")
-    ret.extend((m.mode, m.win_condition, m.team_type, m.freemods))
+            slot_player_ids.append(s.player.id)
+
+    parts = [
+        # 0 is for match type
+        WRITE_MATCH_HEADER_FMT.pack(m.id, m.in_progress, 0, m.mods),
+        write_string(m.name),
+        passwd,
+        write_string(m.map_name),
+        WRITE_MATCH_MAP_ID_FMT.pack(m.map_id),
+        write_string(m.map_md5),
+        bytes([s.status for s in m.slots]),
+        bytes([s.team for s in m.slots]),
+        _u32_array_fmt(len(slot_player_ids)).pack(*slot_player_ids),
+        WRITE_MATCH_SETTINGS_FMT.pack(
+            m.host.id,
+            m.mode,
+            m.win_condition,
+            m.team_type,
+            m.freemods,
+        ),
+    ]
 
     if m.freemods:
-        for s in m.slots:
-            ret += s.mods.to_bytes(4, "little")
+        parts.append(_u32_array_fmt(len(m.slots)).pack(*[s.mods for s in m.slots]))
 
-    ret += m.seed.to_bytes(4, "little")
-    return ret
+    parts.append(WRITE_MATCH_SEED_FMT.pack(m.seed))
+    return b"".join(parts)
 
 
 SCOREFRAME_FMT = struct.Struct("<iBHHHHHHiHH?BB?")
@@ -719,7 +840,7 @@ _noexpand_types: dict[osuTypes, Callable[..., bytes]] = {
     # not (yet?) implemented: write replayframe & bundle
 }
 
-_expand_types: dict[osuTypes, Callable[..., bytearray]] = {
+_expand_types: dict[osuTypes, Callable[..., bytes | bytearray]] = {
     # multiarg, tuple expansion
     osuTypes.message: write_message,
     osuTypes.channel: write_channel,
@@ -729,6 +850,9 @@ _expand_types: dict[osuTypes, Callable[..., bytearray]] = {
 
 def write(packid: int, *args: tuple[Any, osuTypes]) -> bytes:
     """Write `args` into bytes."""
+    # NOTE: the packets we send are built with the serializers
+    # compiled from `PACKET_SCHEMAS` below; this generic writer
+    # remains for any ad-hoc packets without a schema.
     ret = bytearray(struct.pack("<Hx", packid))
 
     for p_args, p_type in args:
@@ -744,6 +868,272 @@ def write(packid: int, *args: tuple[Any, osuTypes]) -> bytes:
     return bytes(ret)
 
 
+#
+# packet schemas
+#
+
+# the schema of each packet we send, as an ordered set of field types.
+# at import time, each schema is compiled into a specialized serializer,
+# grouping runs of fixed-width fields into a single precompiled struct
+# so that each packet is built with as few calls & copies as possible.
+
+PacketSchema = tuple[osuTypes, ...]
+PacketData = bytes | bytearray | memoryview
+
+PACKET_SCHEMAS: dict[ServerPackets, PacketSchema] = {
+    ServerPackets.USER_ID: (osuTypes.i32,),
+    ServerPackets.SEND_MESSAGE: (osuTypes.message,),
+    ServerPackets.PONG: (),
+    ServerPackets.HANDLE_IRC_CHANGE_USERNAME: (osuTypes.string,),
+    ServerPackets.USER_STATS: (
+        osuTypes.i32,  # id
+        osuTypes.u8,  # action
+        osuTypes.string,  # info_text
+        osuTypes.string,  # map_md5
+        osuTypes.i32,  # mods
+        osuTypes.u8,  # mode
+        osuTypes.i32,  # map_id
+        osuTypes.i64,  # ranked score
+        osuTypes.f32,  # accuracy
+        osuTypes.i32,  # plays
+        osuTypes.i64,  # total score
+        osuTypes.i32,  # global rank
+        osuTypes.u16,  # pp
+    ),
+    ServerPackets.USER_LOGOUT: (osuTypes.i32, osuTypes.u8),
+    ServerPackets.SPECTATOR_JOINED: (osuTypes.i32,),
+    ServerPackets.SPECTATOR_LEFT: (osuTypes.i32,),
+    ServerPackets.SPECTATE_FRAMES: (osuTypes.raw,),
+    ServerPackets.VERSION_UPDATE: (),
+    ServerPackets.SPECTATOR_CANT_SPECTATE: (osuTypes.i32,),
+    ServerPackets.GET_ATTENTION: (),
+    ServerPackets.NOTIFICATION: (osuTypes.string,),
+    ServerPackets.UPDATE_MATCH: (osuTypes.match,),
+    ServerPackets.NEW_MATCH: (osuTypes.match,),
+    ServerPackets.DISPOSE_MATCH: (osuTypes.i32,),
+    ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS: (),
+    ServerPackets.MATCH_JOIN_SUCCESS: (osuTypes.match,),
+    ServerPackets.MATCH_JOIN_FAIL: (),
+    ServerPackets.FELLOW_SPECTATOR_JOINED: (osuTypes.i32,),
+    ServerPackets.FELLOW_SPECTATOR_LEFT: (osuTypes.i32,),
+    ServerPackets.MATCH_START: (osuTypes.match,),
+    ServerPackets.MATCH_SCORE_UPDATE: (osuTypes.scoreframe,),
+    ServerPackets.MATCH_TRANSFER_HOST: (),
+    ServerPackets.MATCH_ALL_PLAYERS_LOADED: (),
+    ServerPackets.MATCH_PLAYER_FAILED: (osuTypes.i32,),
+    ServerPackets.MATCH_COMPLETE: (),
+    ServerPackets.MATCH_SKIP: (),
+    ServerPackets.CHANNEL_JOIN_SUCCESS: (osuTypes.string,),
+    ServerPackets.CHANNEL_INFO: (osuTypes.channel,),
+    ServerPackets.CHANNEL_KICK: (osuTypes.string,),
+    ServerPackets.CHANNEL_AUTO_JOIN: (osuTypes.channel,),
+    ServerPackets.PRIVILEGES: (osuTypes.i32,),
+    ServerPackets.FRIENDS_LIST: (osuTypes.i32_list,),
+    ServerPackets.PROTOCOL_VERSION: (osuTypes.i32,),
+    ServerPackets.MAIN_MENU_ICON: (osuTypes.string,),
+    ServerPackets.MONITOR: (),
+    ServerPackets.MATCH_PLAYER_SKIPPED: (osuTypes.i32,),
+    ServerPackets.USER_PRESENCE: (
+        osuTypes.i32,  # id
+        osuTypes.string,  # name
+        osuTypes.u8,  # utc offset (+24)
+        osuTypes.u8,  # country code
+        osuTypes.u8,  # bancho privileges | (mode << 5)
+        osuTypes.f32,  # longitude
+        osuTypes.f32,  # latitude
+        osuTypes.i32,  # global rank
+    ),
+    ServerPackets.RESTART: (osuTypes.i32,),
+    ServerPackets.MATCH_INVITE: (osuTypes.message,),
+    ServerPackets.CHANNEL_INFO_END: (),
+    ServerPackets.MATCH_CHANGE_PASSWORD: (osuTypes.string,),
+    ServerPackets.SILENCE_END: (osuTypes.i32,),
+    ServerPackets.USER_SILENCED: (osuTypes.i32,),
+    ServerPackets.USER_PRESENCE_SINGLE: (osuTypes.i32,),
+    ServerPackets.USER_PRESENCE_BUNDLE: (osuTypes.i32_list,),
+    ServerPackets.USER_DM_BLOCKED: (osuTypes.message,),
+    ServerPackets.TARGET_IS_SILENCED: (osuTypes.message,),
+    ServerPackets.VERSION_UPDATE_FORCED: (),
+    ServerPackets.SWITCH_SERVER: (osuTypes.i32,),
+    ServerPackets.ACCOUNT_RESTRICTED: (),
+    ServerPackets.RTX: (osuTypes.string,),
+    ServerPackets.MATCH_ABORT: (),
+    ServerPackets.SWITCH_TOURNAMENT_SERVER: (osuTypes.string,),
+}
+
+_fixed_width_fmts: dict[osuTypes, str] = {
+    osuTypes.i8: "b",
+    osuTypes.u8: "B",
+    osuTypes.i16: "h",
+    osuTypes.u16: "H",
+    osuTypes.i32: "i",
+    osuTypes.u32: "I",
+    osuTypes.f32: "f",
+    osuTypes.i64: "q",
+    osuTypes.u64: "Q",
+    osuTypes.f64: "d",
+}
+
+# composite types are flattened into their fields at compile time
+_composite_types: dict[osuTypes, PacketSchema] = {
+    osuTypes.message: (osuTypes.string, osuTypes.string, osuTypes.string, osuTypes.i32),
+    osuTypes.channel: (osuTypes.string, osuTypes.string, osuTypes.u16),
+}
+
+
+def _write_raw(data: bytes | memoryview) -> bytes | memoryview:
+    return data
+
+
+# variable-width writers, and the number of arguments they consume
+_variable_width_writers: dict[osuTypes, tuple[Callable[..., PacketData], int]] = {
+    osuTypes.string: (write_string, 1),
+    osuTypes.i32_list: (write_i32_list, 1),
+    osuTypes.scoreframe: (write_scoreframe, 1),
+    osuTypes.match: (write_match, 2),  # (match, send_pw)
+    osuTypes.raw: (_write_raw, 1),
+}
+
+
+def compile_serializer(
+    packid: ServerPackets,
+    schema: PacketSchema,
+) -> Callable[..., bytes]:
+    """Compile a specialized serializer for a packet's schema."""
+    fields: list[osuTypes] = []
+    for osu_type in schema:
+        fields.extend(_composite_types.get(osu_type, (osu_type,)))
+
+    # split the fields into segments; each is a writer, and the slice
+    # of the serializer's arguments that it consumes. consecutive
+    # fixed-width fields are merged into a single struct.
+    segments: list[tuple[Callable[..., PacketData], int, int]] = []
+    fmt = ""
+    arg_idx = fmt_start = 0
+
+    for osu_type in fields:
+        if osu_type in _fixed_width_fmts:
+            fmt += _fixed_width_fmts[osu_type]
+            arg_idx += 1
+            continue
+
+        if fmt:
+            segments.append((struct.Struct(f"<{fmt}").pack, fmt_start, arg_idx))
+            fmt = ""
+
+        writer, num_args = _variable_width_writers[osu_type]
+        segments.append((writer, arg_idx, arg_idx + num_args))
+        arg_idx += num_args
+        fmt_start = arg_idx
+
+    if not segments:
+        # all fields are fixed-width; the entire packet
+        # (header included) can be packed in a single call.
+        packet_fmt = struct.Struct(f"<HxI{fmt}")
+        return partial(packet_fmt.pack, packid, packet_fmt.size - 7)
+
+    if fmt:
+        segments.append((struct.Struct(f"<{fmt}").pack, fmt_start, arg_idx))
+
+    pack_header = PACKET_HEADER_FMT.pack
+
+    def serialize(*args: Any) -> bytes:
+        parts: list[PacketData] = [b""]  # header; written once the length is known
+        for writer, start, stop in segments:
+            parts.append(writer(*args[start:stop]))
+
+        parts[0] = pack_header(packid, sum(map(len, parts)))
+        return b"".join(parts)
+
+    return serialize
+
+
+_serializers: dict[ServerPackets, Callable[..., bytes]] = {
+    packid: compile_serializer(packid, schema)
+    for packid, schema in PACKET_SCHEMAS.items()
+}
+
+
+# server packets which are entirely superseded by a newer packet of the
+# same type about the same subject, and the format of the subject's id.
+COALESCIBLE_PACKETS: dict[int, struct.Struct] = {
+    ServerPackets.USER_STATS: _I32,  # user id
+    ServerPackets.USER_PRESENCE: _I32,  # user id
+    ServerPackets.UPDATE_MATCH: _U16,  # match id
+}
+
+
+# server packets which may be dropped from a client's queue if it isn't
+# keeping up, losing only some of what the client displays.
+DROPPABLE_PACKETS = frozenset({ServerPackets.SPECTATE_FRAMES})
+
+
+def _packet_bounds(chunk: bytes) -> list[tuple[int, int, int]]:
+    """Find the type & bounds of each packet within `chunk`."""
+    packets: list[tuple[int, int, int]] = []
+    offset = 0
+    while offset < len(chunk):
+        p_type, p_len = PACKET_HEADER_FMT.unpack_from(chunk, offset)
+        packets.append((p_type, offset, offset + 7 + p_len))
+        offset += 7 + p_len
+    return packets
+
+
+def coalesce_packets(chunks: list[bytes]) -> list[bytes]:
+    """\
+    Drop any packets from `chunks` which are superseded by a later
+    packet of the same type & subject (e.g. a player's stats).
+    """
+    seen: set[tuple[int, int]] = set()
+    coalesced: list[bytes] = []
+
+    for chunk in reversed(chunks):
+        packets = _packet_bounds(chunk)
+
+        kept: list[bytes] = []
+        dropped = False
+        for p_type, start, end in reversed(packets):
+            subject_fmt = COALESCIBLE_PACKETS.get(p_type)
+            if subject_fmt is not None:
+                (subject_id,) = subject_fmt.unpack_from(chunk, start + 7)
+                if (p_type, subject_id) in seen:
+                    dropped = True
+                    continue
+
+                seen.add((p_type, subject_id))
+
+            kept.append(chunk[start:end])
+
+        if not dropped:
+            coalesced.append(chunk)
+        elif kept:
+            coalesced.append(b"".join(reversed(kept)))
+
+    coalesced.reverse()
+    return coalesced
+
+
+def drop_packets(chunks: list[bytes], packet_ids: frozenset[int]) -> list[bytes]:
+    """Drop any packets of the types in `packet_ids` from `chunks`."""
+    remaining: list[bytes] = []
+
+    for chunk in chunks:
+        packets = _packet_bounds(chunk)
+        if not any(p_type in packet_ids for p_type, _, _ in packets):
+            remaining.append(chunk)
+            continue
+
+        kept = b"".join(
+            chunk[start:end]
+            for p_type, start, end in packets
+            if p_type not in packet_ids
+        )
+        if kept:
+            remaining.append(kept)
+
+    return remaining
+
+
 #
 # packets
 #
@@ -770,30 +1160,24 @@ def login_reply(user_id: int) -> bytes:
 
     In failure cases, we'll send a negative integer of type `LoginFailureReason`.
     """
-    return write(ServerPackets.USER_ID, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.USER_ID](user_id)
 
 
 # packet id: 7
 def send_message(sender: str, msg: str, recipient: str, sender_id: int) -> bytes:
-    return write(
-        ServerPackets.SEND_MESSAGE,
-        ((sender, msg, recipient, sender_id), osuTypes.message),
-    )
+    return _serializers[ServerPackets.SEND_MESSAGE](sender, msg, recipient, sender_id)
 
 
 # packet id: 8
 @cache
 def pong() -> bytes:
-    return write(ServerPackets.PONG)
+    return _serializers[ServerPackets.PONG]()
 
 
 # packet id: 9
 # NOTE: deprecated
 def change_username(old: str, new: str) -> bytes:
-    return write(
-        ServerPackets.HANDLE_IRC_CHANGE_USERNAME,
-        (f"{old}>>>>{new}", osuTypes.string),
-    )
+    return _serializers[ServerPackets.HANDLE_IRC_CHANGE_USERNAME](f"{old}>>>>{new}")
 
 
 BOT_STATUSES = (
@@ -818,21 +1202,20 @@ def bot_stats(player: Player) -> bytes:
     # pick at random from list of potential statuses.
     status_id, status_txt = random.choice(BOT_STATUSES)
 
-    return write(
-        ServerPackets.USER_STATS,
-        (player.id, osuTypes.i32),  # id
-        (status_id, osuTypes.u8),  # action
-        (status_txt, osuTypes.string),  # info_text
-        ("", osuTypes.string),  # map_md5
-        (0, osuTypes.i32),  # mods
-        (0, osuTypes.u8),  # mode
-        (0, osuTypes.i32),  # map_id
-        (0, osuTypes.i64),  # rscore
-        (0.0, osuTypes.f32),  # acc
-        (0, osuTypes.i32),  # plays
-        (0, osuTypes.i64),  # tscore
-        (0, osuTypes.i32),  # rank
-        (0, osuTypes.u16),  # pp
+    return _serializers[ServerPackets.USER_STATS](
+        player.id,  # id
+        status_id,  # action
+        status_txt,  # info_text
+        "",  # map_md5
+        0,  # mods
+        0,  # mode
+        0,  # map_id
+        0,  # rscore
+        0.0,  # acc
+        0,  # plays
+        0,  # tscore
+        0,  # rank
+        0,  # pp
     )
 
 
@@ -858,25 +1241,30 @@ def _user_stats(
         ranked_score = pp
         pp = 0
 
-    return write(
-        ServerPackets.USER_STATS,
-        (user_id, osuTypes.i32),
-        (action, osuTypes.u8),
-        (info_text, osuTypes.string),
-        (map_md5, osuTypes.string),
-        (mods, osuTypes.i32),
-        (mode, osuTypes.u8),
-        (map_id, osuTypes.i32),
-        (ranked_score, osuTypes.i64),
-        (accuracy / 100.0, osuTypes.f32),
-        (plays, osuTypes.i32),
-        (total_score, osuTypes.i64),
-        (global_rank, osuTypes.i32),
-        (pp, osuTypes.u16),
+    return _serializers[ServerPackets.USER_STATS](
+        user_id,
+        action,
+        info_text,
+        map_md5,
+        mods,
+        mode,
+        map_id,
+        ranked_score,
+        accuracy / 100.0,
+        plays,
+        total_score,
+        global_rank,
+        pp,
     )
 
 
 def user_stats(player: Player) -> bytes:
+    # the same player's stats are often sent to many players at once;
+    # serialize them only once for each version of the player's state.
+    cached = player.packet_cache.get(ServerPackets.USER_STATS)
+    if cached is not None and cached[0] == player.presence_version:
+        return cached[1]
+
     gm_stats = player.gm_stats
     if gm_stats.pp > 0xFFFF:
         # HACK: if pp is over osu!'s ingame cap,
@@ -887,40 +1275,41 @@ def user_stats(player: Player) -> bytes:
         rscore = gm_stats.rscore
         pp = gm_stats.pp
 
-    return write(
-        ServerPackets.USER_STATS,
-        (player.id, osuTypes.i32),
-        (player.status.action, osuTypes.u8),
-        (player.status.info_text, osuTypes.string),
-        (player.status.map_md5, osuTypes.string),
-        (player.status.mods, osuTypes.i32),
-        (player.status.mode.as_vanilla, osuTypes.u8),
-        (player.status.map_id, osuTypes.i32),
-        (rscore, osuTypes.i64),
-        (gm_stats.acc / 100.0, osuTypes.f32),
-        (gm_stats.plays, osuTypes.i32),
-        (gm_stats.tscore, osuTypes.i64),
-        (gm_stats.rank, osuTypes.i32),
-        (pp, osuTypes.u16),
+    data = _serializers[ServerPackets.USER_STATS](
+        player.id,
+        player.status.action,
+        player.status.info_text,
+        player.status.map_md5,
+        player.status.mods,
+        player.status.mode.as_vanilla,
+        player.status.map_id,
+        rscore,
+        gm_stats.acc / 100.0,
+        gm_stats.plays,
+        gm_stats.tscore,
+        gm_stats.rank,
+        pp,
     )
+    player.packet_cache[ServerPackets.USER_STATS] = (player.presence_version, data)
+    return data
 
 
 # packet id: 12
 @cache
 def logout(user_id: int) -> bytes:
-    return write(ServerPackets.USER_LOGOUT, (user_id, osuTypes.i32), (0, osuTypes.u8))
+    return _serializers[ServerPackets.USER_LOGOUT](user_id, 0)
 
 
 # packet id: 13
 @cache
 def spectator_joined(user_id: int) -> bytes:
-    return write(ServerPackets.SPECTATOR_JOINED, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.SPECTATOR_JOINED](user_id)
 
 
 # packet id: 14
 @cache
 def spectator_left(user_id: int) -> bytes:
-    return write(ServerPackets.SPECTATOR_LEFT, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.SPECTATOR_LEFT](user_id)
 
 
 # packet id: 15
@@ -930,81 +1319,81 @@ def spectate_frames(data: bytes) -> bytes:
 
     # spectator frames *received* by the server are always validated.
 
-    return write(ServerPackets.SPECTATE_FRAMES, (data, osuTypes.raw))
+    return _serializers[ServerPackets.SPECTATE_FRAMES](data)
 
 
 # packet id: 19
 @cache
 def version_update() -> bytes:
-    return write(ServerPackets.VERSION_UPDATE)
+    return _serializers[ServerPackets.VERSION_UPDATE]()
 
 
 # packet id: 22
 @cache
 def spectator_cant_spectate(user_id: int) -> bytes:
-    return write(ServerPackets.SPECTATOR_CANT_SPECTATE, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.SPECTATOR_CANT_SPECTATE](user_id)
 
 
 # packet id: 23
 @cache
 def get_attention() -> bytes:
-    return write(ServerPackets.GET_ATTENTION)
+    return _serializers[ServerPackets.GET_ATTENTION]()
 
 
 # packet id: 24
 @lru_cache(maxsize=4)
 def notification(msg: str) -> bytes:
-    return write(ServerPackets.NOTIFICATION, (msg, osuTypes.string))
+    return _serializers[ServerPackets.NOTIFICATION](msg)
 
 
 # packet id: 26
 def update_match(m: Match, send_pw: bool = True) -> bytes:
-    return write(ServerPackets.UPDATE_MATCH, ((m, send_pw), osuTypes.match))
+    return _serializers[ServerPackets.UPDATE_MATCH](m, send_pw)
 
 
 # packet id: 27
 def new_match(m: Match) -> bytes:
-    return write(ServerPackets.NEW_MATCH, ((m, True), osuTypes.match))
+    return _serializers[ServerPackets.NEW_MATCH](m, True)
 
 
 # packet id: 28
 @cache
 def dispose_match(id: int) -> bytes:
-    return write(ServerPackets.DISPOSE_MATCH, (id, osuTypes.i32))
+    return _serializers[ServerPackets.DISPOSE_MATCH](id)
 
 
 # packet id: 34
 @cache
 def toggle_block_non_friend_dm() -> bytes:
-    return write(ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS)
+    return _serializers[ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS]()
 
 
 # packet id: 36
 def match_join_success(m: Match) -> bytes:
-    return write(ServerPackets.MATCH_JOIN_SUCCESS, ((m, True), osuTypes.match))
+    return _serializers[ServerPackets.MATCH_JOIN_SUCCESS](m, True)
 
 
 # packet id: 37
 @cache
 def match_join_fail() -> bytes:
-    return write(ServerPackets.MATCH_JOIN_FAIL)
+    return _serializers[ServerPackets.MATCH_JOIN_FAIL]()
 
 
 # packet id: 42
 @cache
 def fellow_spectator_joined(user_id: int) -> bytes:
-    return write(ServerPackets.FELLOW_SPECTATOR_JOINED, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.FELLOW_SPECTATOR_JOINED](user_id)
 
 
 # packet id: 43
 @cache
 def fellow_spectator_left(user_id: int) -> bytes:
-    return write(ServerPackets.FELLOW_SPECTATOR_LEFT, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.FELLOW_SPECTATOR_LEFT](user_id)
 
 
 # packet id: 46
 def match_start(m: Match) -> bytes:
-    return write(ServerPackets.MATCH_START, ((m, True), osuTypes.match))
+    return _serializers[ServerPackets.MATCH_START](m, True)
 
 
 # packet id: 48
@@ -1013,64 +1402,61 @@ def match_start(m: Match) -> bytes:
 #       rather than parsing them. Though I might
 #       end up doing it eventually for security reasons
 def match_score_update(frame: ScoreFrame) -> bytes:
-    return write(ServerPackets.MATCH_SCORE_UPDATE, (frame, osuTypes.scoreframe))
+    return _serializers[ServerPackets.MATCH_SCORE_UPDATE](frame)
 
 
 # packet id: 50
 @cache
 def match_transfer_host() -> bytes:
-    return write(ServerPackets.MATCH_TRANSFER_HOST)
+    return _serializers[ServerPackets.MATCH_TRANSFER_HOST]()
 
 
 # packet id: 53
 @cache
 def match_all_players_loaded() -> bytes:
-    return write(ServerPackets.MATCH_ALL_PLAYERS_LOADED)
+    return _serializers[ServerPackets.MATCH_ALL_PLAYERS_LOADED]()
 
 
 # packet id: 57
 @cache
 def match_player_failed(slot_id: int) -> bytes:
-    return write(ServerPackets.MATCH_PLAYER_FAILED, (slot_id, osuTypes.i32))
+    return _serializers[ServerPackets.MATCH_PLAYER_FAILED](slot_id)
 
 
 # packet id: 58
 @cache
 def match_complete() -> bytes:
-    return write(ServerPackets.MATCH_COMPLETE)
+    return _serializers[ServerPackets.MATCH_COMPLETE]()
 
 
 # packet id: 61
 @cache
 def match_skip() -> bytes:
-    return write(ServerPackets.MATCH_SKIP)
+    return _serializers[ServerPackets.MATCH_SKIP]()
 
 
 # packet id: 64
 @lru_cache(maxsize=16)
 def channel_join(name: str) -> bytes:
-    return write(ServerPackets.CHANNEL_JOIN_SUCCESS, (name, osuTypes.string))
+    return _serializers[ServerPackets.CHANNEL_JOIN_SUCCESS](name)
 
 
 # packet id: 65
 @lru_cache(maxsize=8)
 def channel_info(name: str, topic: str, p_count: int) -> bytes:
-    return write(ServerPackets.CHANNEL_INFO, ((name, topic, p_count), osuTypes.channel))
+    return _serializers[ServerPackets.CHANNEL_INFO](name, topic, p_count)
 
 
 # packet id: 66
 @lru_cache(maxsize=8)
 def channel_kick(name: str) -> bytes:
-    return write(ServerPackets.CHANNEL_KICK, (name, osuTypes.string))
+    return _serializers[ServerPackets.CHANNEL_KICK](name)
 
 
 # packet id: 67
 @lru_cache(maxsize=8)
 def channel_auto_join(name: str, topic: str, p_count: int) -> bytes:
-    return write(
-        ServerPackets.CHANNEL_AUTO_JOIN,
-        ((name, topic, p_count), osuTypes.channel),
-    )
+    return _serializers[ServerPackets.CHANNEL_AUTO_JOIN](name, topic, p_count)
 
 
 # packet id: 69
@@ -1084,27 +1470,24 @@ def channel_auto_join(name: str, topic: str, p_count: int) -> bytes:
 # packet id: 71
 @cache
 def bancho_privileges(priv: int) -> bytes:
-    return write(ServerPackets.PRIVILEGES, (priv, osuTypes.i32))
+    return _serializers[ServerPackets.PRIVILEGES](priv)
 
 
 # packet id: 72
 def friends_list(friends: Collection[int]) -> bytes:
-    return write(ServerPackets.FRIENDS_LIST, (friends, osuTypes.i32_list))
+    return _serializers[ServerPackets.FRIENDS_LIST](friends)
 
 
 # packet id: 75
 @cache
 def protocol_version(ver: int) -> bytes:
-    return write(ServerPackets.PROTOCOL_VERSION, (ver, osuTypes.i32))
+    return _serializers[ServerPackets.PROTOCOL_VERSION](ver)
 
 
 # packet id: 76
 @cache
 def main_menu_icon(icon_url: str, onclick_url: str) -> bytes:
-    return write(
-        ServerPackets.MAIN_MENU_ICON,
-        (icon_url + "|" + onclick_url, osuTypes.string),
-    )
+    return _serializers[ServerPackets.MAIN_MENU_ICON](icon_url + "|" + onclick_url)
 
 
 # packet id: 80
@@ -1118,13 +1501,13 @@ def monitor() -> bytes:
 
     # this doesn't work on newer clients, and I had no plans
     # of trying to put it to use - just coded for completion.
-    return write(ServerPackets.MONITOR)
+    return _serializers[ServerPackets.MONITOR]()
 
 
 # packet id: 81
 @cache
 def match_player_skipped(user_id: int) -> bytes:
-    return write(ServerPackets.MATCH_PLAYER_SKIPPED, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.MATCH_PLAYER_SKIPPED](user_id)
 
 
 # since the bot is always online and is
@@ -1133,16 +1516,15 @@ def match_player_skipped(user_id: int) -> bytes:
 # *very* frequently; only build it once.
 @cache
 def bot_presence(player: Player) -> bytes:
-    return write(
-        ServerPackets.USER_PRESENCE,
-        (player.id, osuTypes.i32),
-        (player.name, osuTypes.string),
-        (-5 + 24, osuTypes.u8),
-        (245, osuTypes.u8),  # satellite provider
-        (31, osuTypes.u8),
-        (1234.0, osuTypes.f32),  # send coordinates waaay
-        (4321.0, osuTypes.f32),  # off the map for the bot
-        (0, osuTypes.i32),
+    return _serializers[ServerPackets.USER_PRESENCE](
+        player.id,
+        player.name,
+        -5 + 24,
+        245,  # satellite provider
+        31,
+        1234.0,  # send coordinates waaay
+        4321.0,  # off the map for the bot
+        0,
     )
 
 
@@ -1158,69 +1540,74 @@ def _user_presence(
     longitude: int,
     global_rank: int,
 ) -> bytes:
-    return write(
-        ServerPackets.USER_PRESENCE,
-        (user_id, osuTypes.i32),
-        (name, osuTypes.string),
-        (utc_offset + 24, osuTypes.u8),
-        (country_code, osuTypes.u8),
-        (bancho_privileges | (mode << 5), osuTypes.u8),
-        (longitude, osuTypes.f32),
-        (latitude, osuTypes.f32),
-        (global_rank, osuTypes.i32),
+    return _serializers[ServerPackets.USER_PRESENCE](
+        user_id,
+        name,
+        utc_offset + 24,
+        country_code,
+        bancho_privileges | (mode << 5),
+        longitude,
+        latitude,
+        global_rank,
     )
 
 
 def user_presence(player: Player) -> bytes:
-    return write(
-        ServerPackets.USER_PRESENCE,
-        (player.id, osuTypes.i32),
-        (player.name, osuTypes.string),
-        (player.utc_offset + 24, osuTypes.u8),
-        (player.geoloc["country"]["numeric"], osuTypes.u8),
-        (player.bancho_priv | (player.status.mode.as_vanilla << 5), osuTypes.u8),
-        (player.geoloc["longitude"], osuTypes.f32),
-        (player.geoloc["latitude"], osuTypes.f32),
-        (player.gm_stats.rank, osuTypes.i32),
+    # the same player's presence is often sent to many players at once;
+    # serialize it only once for each version of the player's state.
+    cached = player.packet_cache.get(ServerPackets.USER_PRESENCE)
+    if cached is not None and cached[0] == player.presence_version:
+        return cached[1]
+
+    data = _serializers[ServerPackets.USER_PRESENCE](
+        player.id,
+        player.name,
+        player.utc_offset + 24,
+        player.geoloc["country"]["numeric"],
+        player.bancho_priv | (player.status.mode.as_vanilla << 5),
+        player.geoloc["longitude"],
+        player.geoloc["latitude"],
+        player.gm_stats.rank,
     )
+    player.packet_cache[ServerPackets.USER_PRESENCE] = (player.presence_version, data)
+    return data
 
 
 # packet id: 86
 @cache
 def restart_server(ms: int) -> bytes:
-    return write(ServerPackets.RESTART, (ms, osuTypes.i32))
+    return _serializers[ServerPackets.RESTART](ms)
 
 
 # packet id: 88
 def match_invite(player: Player, target_name: str) -> bytes:
     assert player.match is not None
     msg = f"Come join my game: {player.match.embed}."
-    return write(
-        ServerPackets.MATCH_INVITE,
-        ((player.name, msg, target_name, player.id), osuTypes.message),
+    return _serializers[ServerPackets.MATCH_INVITE](
+        player.name, msg, target_name, player.id
     )
 
 
 # packet id: 89
 @cache
 def channel_info_end() -> bytes:
-    return write(ServerPackets.CHANNEL_INFO_END)
+    return _serializers[ServerPackets.CHANNEL_INFO_END]()
 
 
 # packet id: 91
 def match_change_password(new: str) -> bytes:
-    return write(ServerPackets.MATCH_CHANGE_PASSWORD, (new, osuTypes.string))
+    return _serializers[ServerPackets.MATCH_CHANGE_PASSWORD](new)
 
 
 # packet id: 92
 def silence_end(delta: int) -> bytes:
-    return write(ServerPackets.SILENCE_END, (delta, osuTypes.i32))
+    return _serializers[ServerPackets.SILENCE_END](delta)
 
 
 # packet id: 94
 @cache
 def user_silenced(user_id: int) -> bytes:
-    return write(ServerPackets.USER_SILENCED, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.USER_SILENCED](user_id)
 
 
 """ not sure why 95 & 96 exist? unused in bancho.py """
@@ -1229,44 +1616,41 @@ def user_silenced(user_id: int) -> bytes:
 # packet id: 95
 @cache
 def user_presence_single(user_id: int) -> bytes:
-    return write(ServerPackets.USER_PRESENCE_SINGLE, (user_id, osuTypes.i32))
+    return _serializers[ServerPackets.USER_PRESENCE_SINGLE](user_id)
 
 
 # packet id: 96
 def user_presence_bundle(user_ids: Collection[int]) -> bytes:
-    return write(ServerPackets.USER_PRESENCE_BUNDLE, (user_ids, osuTypes.i32_list))
+    return _serializers[ServerPackets.USER_PRESENCE_BUNDLE](user_ids)
 
 
 # packet id: 100
 def user_dm_blocked(target: str) -> bytes:
-    return write(ServerPackets.USER_DM_BLOCKED, (("", "", target, 0), osuTypes.message))
+    return _serializers[ServerPackets.USER_DM_BLOCKED]("", "", target, 0)
 
 
 # packet id: 101
 def target_silenced(target: str) -> bytes:
-    return write(
-        ServerPackets.TARGET_IS_SILENCED,
-        (("", "", target, 0), osuTypes.message),
-    )
+    return _serializers[ServerPackets.TARGET_IS_SILENCED]("", "", target, 0)
 
 
 # packet id: 102
 @cache
 def version_update_forced() -> bytes:
-    return write(ServerPackets.VERSION_UPDATE_FORCED)
+    return _serializers[ServerPackets.VERSION_UPDATE_FORCED]()
 
 
 # packet id: 103
 def switch_server(t: int) -> bytes:
     # increment endpoint index if
     # idletime >= t && match == null
-    return write(ServerPackets.SWITCH_SERVER, (t, osuTypes.i32))
+    return _serializers[ServerPackets.SWITCH_SERVER](t)
 
 
 # packet id: 104
 @cache
 def account_restricted() -> bytes:
-    return write(ServerPackets.ACCOUNT_RESTRICTED)
+    return _serializers[ServerPackets.ACCOUNT_RESTRICTED]()
 
 
 # packet id: 105
@@ -1276,13 +1660,13 @@ def rtx(msg: str) -> bytes:
     # to show some visual effects on screen for 5 seconds:
     # - black screen, freezes game, beeps loudly.
     # within the next 3-8 seconds at random.
-    return write(ServerPackets.RTX, (msg, osuTypes.string))
+    return _serializers[ServerPackets.RTX](msg)
 
 
 # packet id: 106
 @cache
 def match_abort() -> bytes:
-    return write(ServerPackets.MATCH_ABORT)
+    return _serializers[ServerPackets.MATCH_ABORT]()
 
 
 # packet id: 107
@@ -1290,4 +1674,4 @@ def switch_tournament_server(ip: str) -> bytes:
     # the client only reads the string if it's
     # not on the client's normal endpoints,
     # but we can send it either way xd.
-    return write(ServerPackets.SWITCH_TOURNAMENT_SERVER, (ip, osuTypes.string))
+    return _serializers[ServerPackets.SWITCH_TOURNAMENT_SERVER](ip)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import Sequence
 from datetime import datetime
 from enum import StrEnum
 from typing import TypedDict
@@ -250,6 +251,7 @@ async def fetch_many(
     filename: str | None = None,
     mode: int | None = None,
     frozen: bool | None = None,
+    filenames: Sequence[str] | None = None,
     page: int | None = None,
     page_size: int | None = None,
 ) -> list[Map]:
@@ -271,6 +273,8 @@ async def fetch_many(
         select_stmt = select_stmt.where(MapsTable.mode == mode)
     if frozen is not None:
         select_stmt = select_stmt.where(MapsTable.frozen == frozen)
+    if filenames is not None:
+        select_stmt = select_stmt.where(MapsTable.filename.in_(filenames))
 
     if page is not None and page_size is not None:
         select_stmt = select_stmt.limit(page_size).offset((page - 1) * page_size)
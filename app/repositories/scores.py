@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import Sequence
 from datetime import datetime
 from typing import TypedDict
 from typing import cast
@@ -202,6 +203,7 @@ async def fetch_many(
     status: int | None = None,
     mode: int | None = None,
     user_id: int | None = None,
+    map_md5s: Sequence[str] | None = None,
     page: int | None = None,
     page_size: int | None = None,
 ) -> list[Score]:
@@ -216,6 +218,8 @@ async def fetch_many(
         select_stmt = select_stmt.where(ScoresTable.mode == mode)
     if user_id is not None:
         select_stmt = select_stmt.where(ScoresTable.userid == user_id)
+    if map_md5s is not None:
+        select_stmt = select_stmt.where(ScoresTable.map_md5.in_(map_md5s))
 
     if page is not None and page_size is not None:
         select_stmt = select_stmt.limit(page_size).offset((page - 1) * page_size)
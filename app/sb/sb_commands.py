@@ -164,12 +164,17 @@ async def sb_user_sync(ctx: Context) -> str:
     if not sql_player:
         return "User not found."
 
+    app.state.cache.leaderboards.set_restricted(sql_player.id, sql_player.restricted)
+    app.state.cache.leaderboards.set_name(sql_player.id, sql_player.name)
+
     maybe_cached_player = app.state.sessions.players.get(id=sql_player.id)
 
     if maybe_cached_player is not None:
         await maybe_cached_player.relationships_from_sql()
         await maybe_cached_player.stats_from_sql_full()
         maybe_cached_player.priv = sql_player.priv
+        app.state.sessions.players.repartition(maybe_cached_player)
+        maybe_cached_player.bump_presence_version()
         (await maybe_cached_player.update_rank(mode) for mode in GameMode)
 
         return f"synced {maybe_cached_player.name}."
@@ -201,9 +206,14 @@ async def sb_me_sync(ctx: Context) -> str:
     if not sql_player:
         return "User not found."
 
+    app.state.cache.leaderboards.set_restricted(sql_player.id, sql_player.restricted)
+    app.state.cache.leaderboards.set_name(sql_player.id, sql_player.name)
+
     await ctx.player.relationships_from_sql()
     await ctx.player.stats_from_sql_full()
     ctx.player.priv = sql_player.priv
+    app.state.sessions.players.repartition(ctx.player)
+    ctx.player.bump_presence_version()
     (await ctx.player.update_rank(mode) for mode in GameMode)
 
     return f"synced {ctx.player.name}."
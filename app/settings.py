@@ -57,12 +57,80 @@ PERFORMANCE_BMAP_CACHE_TTL = float(
 )
 PERFORMANCE_BMAP_CACHE_SIZE = int(os.environ.get("PERFORMANCE_BMAP_CACHE_SIZE", 20))
 
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", 2))
+
+ANTICHEAT_WORKERS = int(os.environ.get("ANTICHEAT_WORKERS", 2))
+ANTICHEAT_QUEUE_SIZE = int(os.environ.get("ANTICHEAT_QUEUE_SIZE", 256))
+ANTICHEAT_TIMEOUT = float(os.environ.get("ANTICHEAT_TIMEOUT", 60))
+
+GEOLOCATION_DB_PATH = os.environ.get("GEOLOCATION_DB_PATH", "")
+GEOLOCATION_NETWORK_FALLBACK = read_bool(
+    os.environ.get("GEOLOCATION_NETWORK_FALLBACK", "True"),
+)
+GEOLOCATION_CACHE_SIZE = int(os.environ.get("GEOLOCATION_CACHE_SIZE", 65536))
+GEOLOCATION_CACHE_TTL = float(os.environ.get("GEOLOCATION_CACHE_TTL", 86400))
+
+LEADERBOARD_CACHE_MAX_BYTES = int(
+    os.environ.get("LEADERBOARD_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+)
+LEADERBOARD_CACHE_TTL = float(os.environ.get("LEADERBOARD_CACHE_TTL", 600))
+
+RANK_INDEX_ENABLED = read_bool(os.environ.get("RANK_INDEX_ENABLED", "False"))
+
+PLAYER_GRADE_CACHE_ENABLED = read_bool(
+    os.environ.get("PLAYER_GRADE_CACHE_ENABLED", "True"),
+)
+
+INCREMENTAL_STATS_ENABLED = read_bool(
+    os.environ.get("INCREMENTAL_STATS_ENABLED", "True"),
+)
+USER_STATS_CACHE_SIZE = int(os.environ.get("USER_STATS_CACHE_SIZE", 1024))
+USER_STATS_RECONCILE_INTERVAL = int(
+    os.environ.get("USER_STATS_RECONCILE_INTERVAL", 60 * 60),
+)
+
+PACKET_QUEUE_MAX_BYTES = int(os.environ.get("PACKET_QUEUE_MAX_BYTES", 1024 * 1024))
+
+REPLAY_STORE_WORKERS = int(os.environ.get("REPLAY_STORE_WORKERS", 4))
+REPLAY_STORE_COMPRESSION = os.environ.get("REPLAY_STORE_COMPRESSION", "none").lower()
+REPLAY_STORE_SEGMENT_MAX_BYTES = int(
+    os.environ.get("REPLAY_STORE_SEGMENT_MAX_BYTES", 256 * 1024 * 1024),
+)
+
 if PERFORMANCE_WORKERS < 1:
     raise ValueError("PERFORMANCE_WORKERS must be at least 1")
 if PERFORMANCE_BMAP_CACHE_TTL <= 0:
     raise ValueError("PERFORMANCE_BMAP_CACHE_TTL must be greater than 0")
 if PERFORMANCE_BMAP_CACHE_SIZE < 1:
     raise ValueError("PERFORMANCE_BMAP_CACHE_SIZE must be at least 1")
+if BCRYPT_WORKERS < 1:
+    raise ValueError("BCRYPT_WORKERS must be at least 1")
+if ANTICHEAT_WORKERS < 1:
+    raise ValueError("ANTICHEAT_WORKERS must be at least 1")
+if ANTICHEAT_QUEUE_SIZE < 1:
+    raise ValueError("ANTICHEAT_QUEUE_SIZE must be at least 1")
+if ANTICHEAT_TIMEOUT <= 0:
+    raise ValueError("ANTICHEAT_TIMEOUT must be greater than 0")
+if GEOLOCATION_CACHE_SIZE < 1:
+    raise ValueError("GEOLOCATION_CACHE_SIZE must be at least 1")
+if GEOLOCATION_CACHE_TTL <= 0:
+    raise ValueError("GEOLOCATION_CACHE_TTL must be greater than 0")
+if LEADERBOARD_CACHE_MAX_BYTES < 1:
+    raise ValueError("LEADERBOARD_CACHE_MAX_BYTES must be at least 1")
+if LEADERBOARD_CACHE_TTL <= 0:
+    raise ValueError("LEADERBOARD_CACHE_TTL must be greater than 0")
+if USER_STATS_CACHE_SIZE < 0:
+    raise ValueError("USER_STATS_CACHE_SIZE must be at least 0")
+if USER_STATS_RECONCILE_INTERVAL < 1:
+    raise ValueError("USER_STATS_RECONCILE_INTERVAL must be at least 1")
+if PACKET_QUEUE_MAX_BYTES < 1:
+    raise ValueError("PACKET_QUEUE_MAX_BYTES must be at least 1")
+if REPLAY_STORE_WORKERS < 1:
+    raise ValueError("REPLAY_STORE_WORKERS must be at least 1")
+if REPLAY_STORE_COMPRESSION not in ("none", "lzma", "zstd"):
+    raise ValueError("REPLAY_STORE_COMPRESSION must be one of none, lzma or zstd")
+if REPLAY_STORE_SEGMENT_MAX_BYTES < 1:
+    raise ValueError("REPLAY_STORE_SEGMENT_MAX_BYTES must be at least 1")
 
 DISALLOWED_NAMES = read_list(os.environ["DISALLOWED_NAMES"])
 DISALLOWED_PASSWORDS = read_list(os.environ["DISALLOWED_PASSWORDS"])
@@ -5,6 +5,10 @@ from collections import defaultdict
 from typing import TYPE_CHECKING
 from typing import Literal
 
+from app.metrics import Histogram
+from app.metrics import PacketStats
+from app.metrics import RedisStats
+
 from . import cache
 from . import services
 from . import sessions
@@ -21,4 +25,7 @@ packets: dict[Literal["all", "restricted"], dict[ClientPackets, type[BasePacket]
     "all": {},
     "restricted": {},
 }
+packet_stats = PacketStats()
+login_stage_times: defaultdict[str, Histogram] = defaultdict(Histogram)  # (µs)
+redis_stats = RedisStats()
 shutting_down = False
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+from datetime import date
 from typing import TYPE_CHECKING
 
+import app.settings
+from app.objects.leaderboard import LeaderboardCache
+
 if TYPE_CHECKING:
     from app.objects.beatmap import Beatmap
     from app.objects.beatmap import BeatmapSet
+    from app.objects.player import OsuStream
 
 
 bcrypt: dict[bytes, bytes] = {}  # {bcrypt: md5, ...}
@@ -12,3 +17,8 @@ beatmap: dict[str | int, Beatmap] = {}  # {md5: map, id: map, ...}
 beatmapset: dict[int, BeatmapSet] = {}  # {bsid: map_set}
 unsubmitted: set[str] = set()  # {md5, ...}
 needs_update: set[str] = set()  # {md5, ...}
+allowed_client_versions: dict[OsuStream, set[date]] = {}  # {stream: {version, ...}}
+leaderboards = LeaderboardCache(
+    max_bytes=app.settings.LEADERBOARD_CACHE_MAX_BYTES,
+    ttl=app.settings.LEADERBOARD_CACHE_TTL,
+)
@@ -7,7 +7,6 @@ import re
 import secrets
 from collections.abc import AsyncGenerator
 from collections.abc import Mapping
-from collections.abc import MutableMapping
 from pathlib import Path
 from typing import TypedDict
 
@@ -21,8 +20,11 @@ import app.settings
 import app.state
 from app._typing import IPAddress
 from app.adapters.database import Database
+from app.adapters.geolocation import IPLocation
+from app.adapters.geolocation import IPRangeDatabase
 from app.logging import Ansi
 from app.logging import log
+from app.utils import TTLCache
 
 STRANGE_LOG_DIR = Path.cwd() / ".data/logs"
 
@@ -45,6 +47,7 @@ if str(app.settings.DATADOG_API_KEY) and str(app.settings.DATADOG_APP_KEY):
     datadog = datadog_client.ThreadStats()  # type: ignore[no-untyped-call]
 
 ip_resolver: IPResolver
+geolocation_db: IPRangeDatabase | None = None
 
 """ session usecases """
 
@@ -105,7 +108,10 @@ country_codes = CountryCodeDict({
 
 class IPResolver:
     def __init__(self) -> None:
-        self.cache: MutableMapping[str, IPAddress] = {}
+        self.cache: TTLCache[str, IPAddress] = TTLCache(
+            max_size=app.settings.GEOLOCATION_CACHE_SIZE,
+            ttl=app.settings.GEOLOCATION_CACHE_TTL,
+        )
 
     def get_ip(self, headers: Mapping[str, str]) -> IPAddress:
         """Resolve the IP address from the headers."""
@@ -121,7 +127,7 @@ class IPResolver:
         ip = self.cache.get(ip_str)
         if ip is None:
             ip = ipaddress.ip_address(ip_str)
-            self.cache[ip_str] = ip
+            self.cache.set(ip_str, ip)
 
         return ip
 
@@ -133,6 +139,30 @@ _UNKNOWN_GEOLOC: Geolocation = {
 }
 
 
+_geoloc_cache: TTLCache[IPAddress, Geolocation] = TTLCache(
+    max_size=app.settings.GEOLOCATION_CACHE_SIZE,
+    ttl=app.settings.GEOLOCATION_CACHE_TTL,
+)
+
+
+def load_geolocation_db() -> None:
+    """Load the offline geolocation database, if one is configured."""
+    global geolocation_db
+
+    if not app.settings.GEOLOCATION_DB_PATH:
+        return
+
+    try:
+        geolocation_db = IPRangeDatabase.from_csv(
+            Path(app.settings.GEOLOCATION_DB_PATH),
+        )
+    except (OSError, ValueError) as exc:
+        log(f"Failed to load the geolocation database: {exc}", Ansi.LRED)
+        return
+
+    log(f"Loaded {len(geolocation_db)} ip ranges for geolocation.", Ansi.LCYAN)
+
+
 async def fetch_geoloc(
     ip: IPAddress,
     headers: Mapping[str, str] | None = None,
@@ -142,6 +172,45 @@ async def fetch_geoloc(
         geoloc = _fetch_geoloc_from_headers(headers)
         if geoloc is not None:
             return geoloc
+
+    geoloc = _geoloc_cache.get(ip)
+    if geoloc is not None:
+        return geoloc
+
+    geoloc = _fetch_geoloc_from_db(ip)
+    if geoloc is None:
+        if not app.settings.GEOLOCATION_NETWORK_FALLBACK:
+            return _UNKNOWN_GEOLOC
+
+        geoloc = await _fetch_geoloc_from_network(ip)
+
+    if geoloc is not None and geoloc is not _UNKNOWN_GEOLOC:
+        _geoloc_cache.set(ip, geoloc)
+
+    return geoloc
+
+
+def _fetch_geoloc_from_db(ip: IPAddress) -> Geolocation | None:
+    """Fetch geolocation data based on ip (using the offline database)."""
+    if geolocation_db is None:
+        return None
+
+    location: IPLocation | None = geolocation_db.lookup(ip)
+    if location is None:
+        return None
+
+    return {
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "country": {
+            "acronym": location.country,
+            "numeric": country_codes[location.country],
+        },
+    }
+
+
+async def _fetch_geoloc_from_network(ip: IPAddress) -> Geolocation | None:
+    """Fetch geolocation data based on ip (using ip-api, or ipapi.co as fallback)."""
     try:
         geoloc = await _fetch_geoloc_from_ip(ip)
         if geoloc is not None:
@@ -9,6 +9,9 @@ from app.logging import log
 from app.objects.collections import Channels
 from app.objects.collections import Matches
 from app.objects.collections import Players
+from app.objects.collections import Roster
+from app.objects.collections import StatsBroadcaster
+from app.objects.collections import TimeoutWheel
 
 if TYPE_CHECKING:
     from app.objects.player import Player
@@ -16,6 +19,9 @@ if TYPE_CHECKING:
 players = Players()
 channels = Channels()
 matches = Matches()
+roster = Roster()
+stats_broadcaster = StatsBroadcaster()
+timeouts = TimeoutWheel()
 
 api_keys: dict[str, int] = {}
 streaming_players: dict[int, bool] = {}
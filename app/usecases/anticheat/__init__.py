@@ -1,15 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import struct
 from pathlib import Path
 
-from circleguard import Circleguard
-from circleguard import ReplayString
-from slider import Beatmap as SliderBeatmap
-
 import app
-from app import settings
+import app.state
 from app.constants.gamemodes import GameMode
 from app.constants.mods import Mods
 from app.constants.privileges import Privileges
@@ -20,8 +17,11 @@ from app.objects.player import Player
 from app.objects.score import Score
 from app.repositories import scores_suspicion
 from app.repositories.scores_suspicion import SuspicionKind
+from app.usecases import replays as replays_usecases
+from app.usecases.anticheat.analysis import ReplayAnalysis
+from app.usecases.anticheat.multiprocess import AnalysisDeferred
+from app.usecases.anticheat.multiprocess import AnticheatProcessPool
 
-REPLAYS_PATH = Path.cwd() / ".data/osr"
 BEATMAPS_PATH = Path.cwd() / ".data/osu"
 DATETIME_OFFSET = 0x89F7FF5F7B58000
 FROZEN_MSG = "We have detected potential violations of our experimental anticheat associated with your account, and it has been placed under restricted mode. This does not imply that your account has been banned, but we kindly request you to upload a verify video as instructed."
@@ -38,19 +38,23 @@ PPCAP = {
     GameMode.AUTOPILOT_OSU: 1000,
 }
 
-circleguard = Circleguard(settings.OSU_API_KEY)
 frametime_limition = 14
 vanilla_ur_limition = 60
 snaps_limition = 20
 
+# scores whose analysis was deferred (by the pool being busy), by priority.
+DEFERRED_SCORES_KEY = "bancho:anticheat:deferred"
+
+# added to the priority of scores on ranked & approved maps, so they're
+# analyzed before those on other maps (whatever their pp).
+RANKED_PRIORITY = 100_000
 
-def _parse_score(
-    score: Score, beatmap: Beatmap, player: Player
-) -> tuple[ReplayString, SliderBeatmap]:
-    replay_file = REPLAYS_PATH / f"{score.id}.osr"
-    beatmap_file = BEATMAPS_PATH / f"{beatmap.id}.osu"
-    raw_replay_data = replay_file.read_bytes()
+process_pool = AnticheatProcessPool()
 
+
+def _build_replay(
+    score: Score, beatmap: Beatmap, player: Player, raw_replay_data: bytes
+) -> bytes:
     replay_md5 = hashlib.md5(
         "{}p{}o{}o{}t{}a{}r{}e{}y{}o{}u{}{}{}".format(
             score.n100 + score.n300,
@@ -100,8 +104,14 @@ def _parse_score(
     replay_data += raw_replay_data
     # pack additional info buffer.
     replay_data += struct.pack("<q", score.id)
-    cg_beatmap = SliderBeatmap.from_path(beatmap_file)
-    return circleguard.ReplayString(replay_data), cg_beatmap
+    return bytes(replay_data)
+
+
+def _priority(score: Score, beatmap: Beatmap) -> float:
+    if beatmap.awards_ranked_pp:
+        return RANKED_PRIORITY + score.pp
+    else:
+        return score.pp
 
 
 async def _save_suspicion(
@@ -188,11 +198,29 @@ async def validate_checksum(
 async def validate_replay(score: Score, beatmap: Beatmap, player: Player):
     try:
         has_relax = score.mods & Mods.RELAX or score.mods & Mods.AUTOPILOT
-        replay, slider_beatmap = _parse_score(score, beatmap, player)
-        frametime = circleguard.frametime(replay)
-        ur = circleguard.ur(replay, beatmap=slider_beatmap) if not has_relax else 0
-        snaps = list(circleguard.snaps(replay, beatmap=slider_beatmap))
-        detail = {"frametime": frametime, "ur": ur, "snaps": len(snaps)}
+        assert score.id is not None
+        raw_replay_data = await replays_usecases.storage.read(score.id)
+        if raw_replay_data is None:
+            raise FileNotFoundError(f"no replay stored for score {score.id}")
+
+        # analyzed in another process; scores which can't be analyzed right
+        # away, while the pool is busy, are deferred to be analyzed later.
+        try:
+            analysis: ReplayAnalysis = await process_pool.analyze(
+                _build_replay(score, beatmap, player, raw_replay_data),
+                str(BEATMAPS_PATH / f"{beatmap.id}.osu"),
+                bool(has_relax),
+                priority=_priority(score, beatmap),
+            )
+        except AnalysisDeferred:
+            await app.state.services.redis.zadd(
+                DEFERRED_SCORES_KEY,
+                {str(score.id): _priority(score, beatmap)},
+            )
+            return
+
+        frametime, ur, snaps = analysis
+        detail = {"frametime": frametime, "ur": ur, "snaps": snaps}
         if (not has_relax) and frametime < frametime_limition:
             await _save_suspicion(
                 player,
@@ -211,12 +239,12 @@ async def validate_replay(score: Score, beatmap: Beatmap, player: Player):
                 detail,
             )
 
-        if len(snaps) > snaps_limition:
+        if snaps > snaps_limition:
             await _save_suspicion(
                 player,
                 score,
                 SuspicionKind.REPLAY,
-                f"potential assist (snaps: {len(snaps):.2f} / {snaps_limition})",
+                f"potential assist (snaps: {snaps:.2f} / {snaps_limition})",
                 detail,
             )
 
@@ -234,3 +262,34 @@ async def validate_replay(score: Score, beatmap: Beatmap, player: Player):
             f"Failed to check the score ({score.id} by {player.name}) due to {repr(e)}, skipped.",
             Ansi.RED,
         )
+
+
+async def resume_deferred() -> int:
+    """\
+    Analyze scores whose analysis was deferred, highest priority first,
+    as far as the pool can start them right away. Returns the number
+    of scores analyzed.
+    """
+    resumed = 0
+
+    while capacity := process_pool.spare_capacity:
+        deferred = await app.state.services.redis.zpopmax(
+            DEFERRED_SCORES_KEY,
+            capacity,
+        )
+        if not deferred:
+            break
+
+        scores = [await Score.from_sql(int(score_id)) for score_id, _ in deferred]
+        await asyncio.gather(
+            *(
+                validate_replay(score, score.bmap, score.player)
+                for score in scores
+                if score is not None
+                and score.bmap is not None
+                and score.player is not None
+            ),
+        )
+        resumed += len(deferred)
+
+    return resumed
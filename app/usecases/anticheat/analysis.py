@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+from circleguard import Circleguard
+from slider import Beatmap as SliderBeatmap
+
+from app import settings
+
+circleguard = Circleguard(settings.OSU_API_KEY)
+
+
+class ReplayAnalysis(NamedTuple):
+    frametime: float
+    ur: float  # 0 for relax & autopilot scores
+    snaps: int
+
+
+def analyze_replay(
+    replay_data: bytes,
+    beatmap_file: str,
+    has_relax: bool,
+) -> ReplayAnalysis:
+    """Analyze a replay (in .osr format) with circleguard."""
+    replay = circleguard.ReplayString(replay_data)
+    beatmap = SliderBeatmap.from_path(beatmap_file)
+
+    frametime = circleguard.frametime(replay)
+    ur = circleguard.ur(replay, beatmap=beatmap) if not has_relax else 0
+    snaps = sum(1 for _ in circleguard.snaps(replay, beatmap=beatmap))
+
+    return ReplayAnalysis(frametime, ur, snaps)
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from itertools import count
+from typing import Any
+
+import app.state
+from app.logging import Ansi
+from app.logging import log
+from app.usecases.anticheat.analysis import ReplayAnalysis
+from app.usecases.anticheat.analysis import analyze_replay
+from app.usecases.performance.multiprocess import _get_mp_context
+
+_STOP = None
+
+# how often workers are checked for timed out analyses & unexpected exits.
+SUPERVISE_INTERVAL = 1.0
+
+
+def anticheat_worker(worker_id: int, task_queue: Any, result_queue: Any) -> None:
+    while True:
+        task = task_queue.get()
+        if task is _STOP:
+            return
+
+        task_id, replay_data, beatmap_file, has_relax = task
+        try:
+            result = analyze_replay(replay_data, beatmap_file, has_relax)
+        except BaseException as exc:
+            result_queue.put(
+                (
+                    task_id,
+                    worker_id,
+                    None,
+                    f"{type(exc).__name__}: {exc}\n{traceback.format_exc()}",
+                ),
+            )
+        else:
+            result_queue.put((task_id, worker_id, result, None))
+
+
+class AnticheatWorkerError(Exception):
+    def __init__(self, worker_id: int, message: str) -> None:
+        super().__init__(message)
+        self.worker_id = worker_id
+
+
+class AnalysisDeferred(Exception):
+    """The pool's queue was full; the analysis should be retried later."""
+
+
+@dataclass
+class _Task:
+    task_id: int
+    priority: float
+    replay_data: bytes
+    beatmap_file: str
+    has_relax: bool
+    future: asyncio.Future[ReplayAnalysis]
+    queued_at: float
+    requeued: bool = False
+
+
+@dataclass
+class _Worker:
+    worker_id: int
+    process: Any
+    task_queue: Any
+    task: _Task | None = None
+    deadline: float = 0.0
+
+
+class AnticheatProcessPool:
+    """\
+    A supervised pool of processes for (cpu-bound) replay analysis.
+
+    Analyses wait in a bounded priority queue in this process, and are
+    sent to workers as they become idle, highest priority first. When the
+    queue is full, the lowest priority analysis (whether queued or newly
+    submitted) is rejected with `AnalysisDeferred`, rather than letting
+    the backlog grow. Workers whose analysis runs past `timeout` seconds,
+    or which exit unexpectedly, are killed & replaced; the analysis of a
+    worker which exited is retried once.
+    """
+
+    def __init__(self) -> None:
+        self._workers: list[_Worker] = []
+        self._queue: list[tuple[float, int, _Task]] = []  # (-priority, id, task)
+        self._queue_size = 0
+        self._timeout = 0.0
+        self._context: Any | None = None
+        self._result_queue: Any | None = None
+        self._result_thread: threading.Thread | None = None
+        self._supervisor: asyncio.Task[None] | None = None
+        self._task_ids = count()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of analyses waiting for a free worker."""
+        return len(self._queue)
+
+    @property
+    def spare_capacity(self) -> int:
+        """The number of analyses which could be started right away."""
+        idle_workers = sum(worker.task is None for worker in self._workers)
+        return max(idle_workers - len(self._queue), 0)
+
+    def start(self, workers: int, queue_size: int, timeout: float) -> None:
+        if self._workers:
+            return
+
+        self._context = _get_mp_context()
+        self._loop = asyncio.get_running_loop()
+        self._queue_size = queue_size
+        self._timeout = timeout
+        self._result_queue = self._context.Queue()
+        for worker_id in range(workers):
+            self._workers.append(self._spawn(worker_id))
+
+        self._result_thread = threading.Thread(
+            target=self._collect_results,
+            name="anticheat-results",
+            daemon=True,
+        )
+        self._result_thread.start()
+        self._supervisor = self._loop.create_task(self._supervise())
+
+    def _spawn(self, worker_id: int) -> _Worker:
+        assert self._context is not None
+
+        task_queue = self._context.Queue()
+        process = self._context.Process(
+            target=anticheat_worker,
+            args=(worker_id, task_queue, self._result_queue),
+            name=f"anticheat-worker-{worker_id}",
+        )
+        process.start()
+        return _Worker(worker_id, process, task_queue)
+
+    async def stop(self) -> None:
+        if not self._workers:
+            return
+
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            self._supervisor = None
+
+        # queued analyses are deferred, to be retried after restarting
+        for _, _, task in self._queue:
+            if not task.future.done():
+                task.future.set_exception(AnalysisDeferred())
+        self._queue.clear()
+
+        for worker in self._workers:
+            worker.task_queue.put(_STOP)
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(worker.process.join, self._timeout)
+                for worker in self._workers
+            ),
+        )
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.process.kill()
+                await asyncio.to_thread(worker.process.join)
+
+            # analyses which didn't finish in time are deferred as well
+            if worker.task is not None and not worker.task.future.done():
+                worker.task.future.set_exception(AnalysisDeferred())
+
+        if self._result_queue is not None:
+            self._result_queue.put(_STOP)
+        if self._result_thread is not None:
+            await asyncio.to_thread(self._result_thread.join)
+
+        self._workers.clear()
+        self._result_queue = None
+        self._result_thread = None
+        self._context = None
+        self._loop = None
+
+    def analyze(
+        self,
+        replay_data: bytes,
+        beatmap_file: str,
+        has_relax: bool,
+        priority: float,
+    ) -> asyncio.Future[ReplayAnalysis]:
+        """\
+        Queue a replay's analysis; those of a higher priority run first.
+
+        The returned future raises `AnalysisDeferred` if the queue is full
+        of analyses of a higher priority, `TimeoutError` if the analysis
+        times out, or `AnticheatWorkerError` if it otherwise fails.
+        """
+        if self._loop is None or not self._workers:
+            raise RuntimeError("Anticheat process pool is not running")
+
+        task = _Task(
+            task_id=next(self._task_ids),
+            priority=priority,
+            replay_data=replay_data,
+            beatmap_file=beatmap_file,
+            has_relax=has_relax,
+            future=self._loop.create_future(),
+            queued_at=time.monotonic(),
+        )
+
+        if len(self._queue) >= self._queue_size:
+            # make room by deferring whichever has the lowest priority
+            lowest = max(self._queue)
+            if lowest[0] <= -priority:
+                self._deferred(task)
+                return task.future
+
+            self._queue.remove(lowest)
+            heapq.heapify(self._queue)
+            self._deferred(lowest[2])
+
+        heapq.heappush(self._queue, (-priority, task.task_id, task))
+        self._dispatch()
+
+        if app.state.services.datadog:
+            app.state.services.datadog.gauge("bancho.anticheat.queue_depth", self.queue_depth)  # type: ignore[no-untyped-call]
+
+        return task.future
+
+    def _deferred(self, task: _Task) -> None:
+        if not task.future.done():
+            task.future.set_exception(AnalysisDeferred())
+
+        if app.state.services.datadog:
+            app.state.services.datadog.increment("bancho.anticheat.deferred")  # type: ignore[no-untyped-call]
+
+    def _dispatch(self) -> None:
+        """Send queued analyses to idle workers."""
+        for worker in self._workers:
+            if worker.task is not None:
+                continue
+
+            while self._queue:
+                _, _, task = heapq.heappop(self._queue)
+                if task.future.done():
+                    continue  # cancelled by its caller
+
+                now = time.monotonic()
+                worker.task = task
+                worker.deadline = now + self._timeout
+                worker.task_queue.put(
+                    (task.task_id, task.replay_data, task.beatmap_file, task.has_relax),
+                )
+
+                if app.state.services.datadog:
+                    queue_wait_ms = int((now - task.queued_at) * 1000)
+                    app.state.services.datadog.histogram("bancho.anticheat.queue_wait_ms", queue_wait_ms)  # type: ignore[no-untyped-call]
+                break
+            else:
+                return
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+
+            now = time.monotonic()
+            stopped_workers: list[_Worker] = []
+            for worker in list(self._workers):
+                if worker.task is not None and now >= worker.deadline:
+                    reason = f"analysis timed out after {self._timeout}s"
+                    error: Exception = TimeoutError(reason)
+                elif not worker.process.is_alive():
+                    reason = f"worker exited with code {worker.process.exitcode}"
+                    error = AnticheatWorkerError(worker.worker_id, reason)
+                else:
+                    continue
+
+                log(
+                    f"Restarting anticheat worker {worker.worker_id}: {reason}",
+                    Ansi.LYELLOW,
+                )
+                if app.state.services.datadog:
+                    app.state.services.datadog.increment("bancho.anticheat.worker_restarts")  # type: ignore[no-untyped-call]
+
+                # replace the worker before waiting for it to exit, so
+                # no analysis can be dispatched to it in the meantime.
+                self._workers[worker.worker_id] = self._spawn(worker.worker_id)
+                worker.process.kill()
+                stopped_workers.append(worker)
+
+                task, worker.task = worker.task, None
+                if task is None or task.future.done():
+                    continue
+
+                if isinstance(error, AnticheatWorkerError) and not task.requeued:
+                    # the worker may have exited before starting the
+                    # analysis; retry it (once) on another worker.
+                    task.requeued = True
+                    heapq.heappush(self._queue, (-task.priority, task.task_id, task))
+                else:
+                    task.future.set_exception(error)
+
+            self._dispatch()
+
+            for worker in stopped_workers:
+                await asyncio.to_thread(worker.process.join)
+                worker.task_queue.close()
+
+    def _collect_results(self) -> None:
+        assert self._result_queue is not None
+        assert self._loop is not None
+        while True:
+            result = self._result_queue.get()
+            if result is _STOP:
+                return
+
+            task_id, worker_id, analysis, error = result
+            self._loop.call_soon_threadsafe(
+                self._complete_task,
+                task_id,
+                worker_id,
+                analysis,
+                error,
+            )
+
+    def _complete_task(
+        self,
+        task_id: int,
+        worker_id: int,
+        analysis: ReplayAnalysis | None,
+        error: str | None,
+    ) -> None:
+        if worker_id >= len(self._workers):
+            return
+
+        worker = self._workers[worker_id]
+        task = worker.task
+        if task is None or task.task_id != task_id:
+            return  # from a worker which was since replaced
+
+        worker.task = None
+        if not task.future.done():
+            if error is not None:
+                task.future.set_exception(AnticheatWorkerError(worker_id, error))
+            else:
+                assert analysis is not None
+                task.future.set_result(analysis)
+
+        self._dispatch()
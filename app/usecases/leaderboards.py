@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+from typing import Literal
+
+import app.state
+from app.constants.privileges import Privileges
+from app.objects.leaderboard import Leaderboard
+from app.objects.leaderboard import LeaderboardKey
+from app.objects.leaderboard import LeaderboardScore
+from app.repositories import clans as clans_repo
+from app.repositories import ratings as ratings_repo
+from app.repositories import users as users_repo
+
+if TYPE_CHECKING:
+    from app.objects.score import Score
+
+_in_flight: dict[LeaderboardKey, asyncio.Future[Leaderboard]] = {}
+
+
+async def _load(key: LeaderboardKey) -> Leaderboard:
+    map_md5, mode, scoring_metric = key
+    cache = app.state.cache.leaderboards
+
+    cache.begin_load(key)
+    try:
+        rows = await app.state.services.database.fetch_all(
+            f"SELECT s.id, s.{scoring_metric} AS _score, "
+            "s.max_combo, s.n50, s.n100, s.n300, "
+            "s.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, "
+            "UNIX_TIMESTAMP(s.play_time) time, u.id userid, "
+            "u.name, c.tag clan_tag, u.country, u.priv "
+            "FROM scores s "
+            "INNER JOIN users u ON u.id = s.userid "
+            "LEFT JOIN clans c ON c.id = u.clan_id "
+            "WHERE s.map_md5 = :map_md5 AND s.mode = :mode "
+            "AND s.status = 2",  # 2: =best score
+            {"map_md5": map_md5, "mode": mode},
+        )
+    except BaseException:
+        cache.cancel_load(key)
+        raise
+
+    leaderboard = Leaderboard(
+        scores=(
+            LeaderboardScore(
+                id=row["id"],
+                score=row["_score"],
+                max_combo=row["max_combo"],
+                n50=row["n50"],
+                n100=row["n100"],
+                n300=row["n300"],
+                nmiss=row["nmiss"],
+                nkatu=row["nkatu"],
+                ngeki=row["ngeki"],
+                perfect=row["perfect"],
+                mods=row["mods"],
+                time=row["time"],
+                userid=row["userid"],
+                name=row["name"],
+                clan_tag=row["clan_tag"],
+                country=row["country"],
+            )
+            for row in rows
+        ),
+        restricted_user_ids=(
+            row["userid"] for row in rows if not row["priv"] & Privileges.UNRESTRICTED
+        ),
+    )
+
+    cache.finish_load(key, leaderboard)
+    return leaderboard
+
+
+async def fetch(
+    map_md5: str,
+    mode: int,
+    scoring_metric: Literal["pp", "score"],
+) -> Leaderboard:
+    """Fetch a beatmap's leaderboard, from the cache if possible."""
+    key: LeaderboardKey = (map_md5, mode, scoring_metric)
+
+    leaderboard = app.state.cache.leaderboards.get(key)
+    if leaderboard is not None:
+        if app.state.services.datadog:
+            app.state.services.datadog.increment("bancho.leaderboard_cache.hits")  # type: ignore[no-untyped-call]
+        return leaderboard
+
+    if app.state.services.datadog:
+        app.state.services.datadog.increment("bancho.leaderboard_cache.misses")  # type: ignore[no-untyped-call]
+
+    # concurrent misses for the same leaderboard share a single load
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_load(key))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+
+    return await asyncio.shield(future)
+
+
+async def fetch_rating(leaderboard: Leaderboard, map_md5: str) -> float:
+    """Fetch a map's average rating, caching it on its leaderboard."""
+    if leaderboard.rating is None:
+        leaderboard.rating = await ratings_repo.get_map_rating(map_md5=map_md5)
+
+    return leaderboard.rating
+
+
+async def add_best_score(score: Score) -> None:
+    """Update the cached leaderboards of a map with a new best score."""
+    assert score.bmap is not None
+    assert score.player is not None
+    assert score.id is not None
+
+    cache = app.state.cache.leaderboards
+    if not cache.has_map(score.bmap.md5, score.mode):
+        # it may still be being loaded
+        cache.mark_modified(score.bmap.md5)
+        return
+
+    # the country stored for the player, as when loading leaderboards;
+    # not the one geolocated from the ip they've logged in from.
+    user = await users_repo.fetch_one(id=score.player.id)
+    assert user is not None
+
+    clan_tag: str | None = None
+    if score.player.clan_id is not None:
+        clan = await clans_repo.fetch_one(id=score.player.clan_id)
+        if clan is not None:
+            clan_tag = clan["tag"]
+
+    metric_values: tuple[tuple[Literal["pp", "score"], float], ...] = (
+        ("pp", score.pp),
+        ("score", score.score),
+    )
+    scores = {
+        scoring_metric: LeaderboardScore(
+            id=score.id,
+            score=value,
+            max_combo=score.max_combo,
+            n50=score.n50,
+            n100=score.n100,
+            n300=score.n300,
+            nmiss=score.nmiss,
+            nkatu=score.nkatu,
+            ngeki=score.ngeki,
+            perfect=int(score.perfect),
+            mods=int(score.mods),
+            time=int(score.server_time.timestamp()),
+            userid=score.player.id,
+            name=score.player.name,
+            clan_tag=clan_tag,
+            country=user["country"],
+        )
+        for scoring_metric, value in metric_values
+    }
+
+    cache.upsert(
+        score.bmap.md5,
+        score.mode,
+        scores,
+        restricted=not user["priv"] & Privileges.UNRESTRICTED,
+    )
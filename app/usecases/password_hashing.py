@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+import bcrypt
+
+import app.state
+from app.metrics import Histogram
+
+T = TypeVar("T")
+
+
+def _timed_call(func: Callable[..., T], *args: bytes) -> tuple[T, int]:
+    """Call `func`, returning its result & the time it started."""
+    started_at = time.perf_counter_ns()
+    return func(*args), started_at
+
+
+class BcryptPool:
+    """\
+    A bounded pool of threads for bcrypt hashing & verification.
+
+    bcrypt is deliberately slow (~200ms per call), and releases the GIL
+    while it works, so running it in a small pool of threads keeps it
+    off of the event loop while bounding how many cpus it may occupy.
+
+    Concurrent checks of the same (hash, password) pair, such as after
+    a restart when many clients reconnect at once, share a single call.
+    """
+
+    def __init__(self) -> None:
+        self._executor: ThreadPoolExecutor | None = None
+        self._workers = 0
+        self._in_flight: dict[tuple[bytes, bytes], asyncio.Future[bool]] = {}
+
+        # calls submitted to the pool which haven't completed
+        self.pending = 0
+        self.queue_wait_ms = Histogram()
+        self.run_time_ms = Histogram()
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of calls waiting for a free worker."""
+        return max(self.pending - self._workers, 0)
+
+    def start(self, workers: int) -> None:
+        if self._executor is not None:
+            return
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="bcrypt-worker",
+        )
+        self._workers = workers
+
+    async def stop(self) -> None:
+        if self._executor is None:
+            return
+
+        executor = self._executor
+        self._executor = None
+        self._workers = 0
+
+        await asyncio.to_thread(executor.shutdown, wait=True)
+
+    async def _run(self, func: Callable[..., T], *args: bytes) -> T:
+        if self._executor is None:
+            raise RuntimeError("Bcrypt pool is not running")
+
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter_ns()
+
+        self.pending += 1
+        if app.state.services.datadog:
+            app.state.services.datadog.gauge("bancho.bcrypt.queue_depth", self.queue_depth)  # type: ignore[no-untyped-call]
+
+        try:
+            timed_result: tuple[T, int] = await loop.run_in_executor(
+                self._executor,
+                _timed_call,
+                func,
+                *args,
+            )
+        finally:
+            self.pending -= 1
+
+        result, started_at = timed_result
+
+        completed_at = time.perf_counter_ns()
+        queue_wait_ms = (started_at - submitted_at) // 1_000_000
+        self.queue_wait_ms.record(queue_wait_ms)
+        self.run_time_ms.record((completed_at - started_at) // 1_000_000)
+
+        if app.state.services.datadog:
+            app.state.services.datadog.histogram("bancho.bcrypt.queue_wait_ms", queue_wait_ms)  # type: ignore[no-untyped-call]
+
+        return result
+
+    async def checkpw(self, password: bytes, hashed_password: bytes) -> bool:
+        """Check whether `password` matches `hashed_password`."""
+        key = (hashed_password, password)
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._run(bcrypt.checkpw, password, hashed_password),
+            )
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # shielded, since the call is shared with any other waiters
+        return await asyncio.shield(future)
+
+    async def hashpw(self, password: bytes) -> bytes:
+        """Hash `password` with a newly generated salt."""
+        return await self._run(bcrypt.hashpw, password, bcrypt.gensalt())
+
+
+pool = BcryptPool()
+
+
+async def checkpw(password: bytes, hashed_password: bytes) -> bool:
+    return await pool.checkpw(password, hashed_password)
+
+
+async def hashpw(password: bytes) -> bytes:
+    return await pool.hashpw(password)
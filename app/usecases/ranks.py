@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from collections.abc import Mapping
+from typing import Any
+from typing import NamedTuple
+
+from redis.asyncio.client import Pipeline
+
+import app.state
+from app.constants.gamemodes import GameMode
+from app.constants.privileges import Privileges
+from app.objects.rank_index import RankIndex
+
+# the modes which have leaderboards; relax doesn't exist for mania (7),
+# and autopilot only exists for std (8).
+LEADERBOARD_MODES = (0, 1, 2, 3, 4, 5, 6, 8)
+
+# an optional in-process copy of the leaderboards, which rank lookups
+# are answered from without a round trip to redis when it's loaded.
+index: RankIndex | None = None
+
+
+class Ranks(NamedTuple):
+    global_rank: int  # 0 if unranked
+    country_rank: int  # 0 if unranked, or not fetched
+
+
+class RankMismatch(NamedTuple):
+    key: str
+    member: str
+    redis_score: float | None  # none if missing
+    index_score: float | None  # none if missing
+
+
+def _global_key(mode: int) -> str:
+    return f"bancho:leaderboard:{mode}"
+
+
+def _country_key(mode: int, country: str) -> str:
+    return f"bancho:leaderboard:{mode}:{country}"
+
+
+def _to_rank(zrevrank: int | None) -> int:
+    return zrevrank + 1 if zrevrank is not None else 0
+
+
+async def _execute(operation: str, pipeline: Pipeline) -> list[Any]:
+    """Send all of `pipeline`'s commands to redis in a single round trip."""
+    command_count = len(pipeline)
+    if not command_count:
+        return []
+
+    results: list[Any] = await pipeline.execute()
+
+    app.state.redis_stats.record_round_trip(operation, command_count)
+    if app.state.services.datadog:
+        tags = [f"operation:{operation}"]
+        app.state.services.datadog.increment("bancho.redis.round_trips", tags=tags)  # type: ignore[no-untyped-call]
+        app.state.services.datadog.increment("bancho.redis.commands", command_count, tags=tags)  # type: ignore[no-untyped-call]
+
+    return results
+
+
+async def update(player_id: int, country: str, mode: GameMode, pp: int) -> int:
+    """\
+    Set a player's pp on the global & country leaderboards of `mode`,
+    returning their new global rank.
+    """
+    member = str(player_id)
+
+    async with app.state.services.redis.pipeline(transaction=False) as pipeline:
+        pipeline.zadd(_global_key(mode.value), {member: pp})
+        pipeline.zadd(_country_key(mode.value, country), {member: pp})
+
+        if index is not None:
+            await _execute("update_rank", pipeline)
+            index.update(player_id, country, mode.value, pp)
+            return index.global_rank(player_id, mode.value)
+
+        pipeline.zrevrank(_global_key(mode.value), member)
+        *_, global_rank = await _execute("update_rank", pipeline)
+
+    return _to_rank(global_rank)
+
+
+async def add(player_id: int, country: str, pps: Mapping[GameMode, int]) -> None:
+    """Add a player to the global & country leaderboards of each mode."""
+    member = str(player_id)
+
+    async with app.state.services.redis.pipeline(transaction=False) as pipeline:
+        for mode, pp in pps.items():
+            pipeline.zadd(_global_key(mode.value), {member: pp})
+            pipeline.zadd(_country_key(mode.value, country), {member: pp})
+
+        await _execute("add_ranks", pipeline)
+
+    if index is not None:
+        for mode, pp in pps.items():
+            index.update(player_id, country, mode.value, pp)
+
+
+async def remove(player_id: int, country: str) -> None:
+    """Remove a player from the global & country leaderboards of all modes."""
+    member = str(player_id)
+
+    async with app.state.services.redis.pipeline(transaction=False) as pipeline:
+        for mode in LEADERBOARD_MODES:
+            pipeline.zrem(_global_key(mode), member)
+            pipeline.zrem(_country_key(mode, country), member)
+
+        await _execute("remove_ranks", pipeline)
+
+    if index is not None:
+        for mode in LEADERBOARD_MODES:
+            index.remove(player_id, country, mode)
+
+
+async def fetch_many(
+    player_id: int,
+    modes: Iterable[int],
+    country: str | None = None,
+) -> dict[int, Ranks]:
+    """\
+    Fetch a player's global rank in each of `modes`, along with their
+    country rank in `country`, if one is given.
+    """
+    if index is not None:
+        return {
+            mode: Ranks(
+                global_rank=index.global_rank(player_id, mode),
+                country_rank=(
+                    index.country_rank(player_id, mode, country)
+                    if country is not None
+                    else 0
+                ),
+            )
+            for mode in modes
+        }
+
+    modes = list(modes)
+    member = str(player_id)
+
+    async with app.state.services.redis.pipeline(transaction=False) as pipeline:
+        for mode in modes:
+            pipeline.zrevrank(_global_key(mode), member)
+            if country is not None:
+                pipeline.zrevrank(_country_key(mode, country), member)
+
+        results = await _execute("fetch_ranks", pipeline)
+
+    step = 2 if country is not None else 1
+    return {
+        mode: Ranks(
+            global_rank=_to_rank(results[i * step]),
+            country_rank=_to_rank(results[i * step + 1]) if country is not None else 0,
+        )
+        for i, mode in enumerate(modes)
+    }
+
+
+async def load_index() -> RankIndex:
+    """\
+    Build an in-process rank index from the stats of all unrestricted
+    players who have played, and begin answering rank lookups from it.
+    """
+    global index
+
+    rows = await app.state.services.database.fetch_all(
+        "SELECT s.id, s.mode, s.pp, u.country FROM stats s "
+        "INNER JOIN users u ON u.id = s.id "
+        "WHERE u.priv & :unrestricted AND (s.pp > 0 OR s.plays > 0)",
+        {"unrestricted": Privileges.UNRESTRICTED},
+    )
+
+    new_index = RankIndex()
+    for row in rows:
+        new_index.update(row["id"], row["country"], row["mode"], row["pp"])
+
+    index = new_index
+    return new_index
+
+
+async def check_index_consistency(rank_index: RankIndex) -> list[RankMismatch]:
+    """\
+    Compare `rank_index` against the leaderboards in redis, returning
+    every member whose score differs, or which is missing from either.
+    """
+    redis = app.state.services.redis
+    mismatches: list[RankMismatch] = []
+
+    index_sets = dict(rank_index.items())
+    redis_keys = {
+        key.decode() async for key in redis.scan_iter(match="bancho:leaderboard:*")
+    }
+
+    for key in sorted(redis_keys | index_sets.keys()):
+        redis_scores: dict[str, float] = {}
+        if key in redis_keys:
+            for member, score in await redis.zrange(key, 0, -1, withscores=True):
+                redis_scores[member.decode()] = score
+
+        index_scores = dict(index_sets[key]) if key in index_sets else {}
+
+        for member in sorted(redis_scores.keys() | index_scores.keys()):
+            redis_score = redis_scores.get(member)
+            index_score = index_scores.get(member)
+            if redis_score != index_score:
+                mismatches.append(
+                    RankMismatch(key, member, redis_score, index_score),
+                )
+
+    return mismatches
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.adapters.replay_store import CHUNK_SIZE
+from app.adapters.replay_store import Codec
+from app.adapters.replay_store import ReplayStore
+
+# where replays were stored (as a file per score) before the replay store;
+# those which haven't been migrated (see tools/migrate_replays.py) are read
+# from here.
+LEGACY_REPLAYS_PATH = Path.cwd() / ".data/osr"
+
+
+def _iter_file(path: Path) -> Generator[bytes, None, None]:
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+class ReplayStream:
+    """A replay, read in chunks (off of the event loop) as it's iterated."""
+
+    def __init__(
+        self,
+        size: int,
+        chunks: Generator[bytes, None, None],
+        executor: ThreadPoolExecutor,
+    ) -> None:
+        self.size = size
+        self._chunks = chunks
+        self._executor = executor
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk: bytes | None = await loop.run_in_executor(
+                    self._executor,
+                    next,
+                    self._chunks,
+                    None,
+                )
+                if chunk is None:
+                    break
+
+                yield chunk
+        finally:
+            await loop.run_in_executor(self._executor, self._chunks.close)
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self])
+
+
+class ReplayStorage:
+    """\
+    Replays, stored in a `ReplayStore` which is read from & written
+    to by a pool of threads, keeping disk io off of the event loop.
+    """
+
+    def __init__(self, legacy_path: Path = LEGACY_REPLAYS_PATH) -> None:
+        self._executor: ThreadPoolExecutor | None = None
+        self._store: ReplayStore | None = None
+        self.legacy_path = legacy_path
+
+    def start(
+        self,
+        path: Path,
+        workers: int,
+        compression: Codec = Codec.NONE,
+        segment_max_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        if self._executor is not None:
+            return
+
+        self._store = ReplayStore(path, compression, segment_max_bytes)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="replay-worker",
+        )
+
+    async def stop(self) -> None:
+        if self._executor is None or self._store is None:
+            return
+
+        executor, store = self._executor, self._store
+        self._executor = self._store = None
+
+        await asyncio.to_thread(executor.shutdown, wait=True)
+        store.close()
+
+    def _running(self) -> tuple[ThreadPoolExecutor, ReplayStore]:
+        if self._executor is None or self._store is None:
+            raise RuntimeError("Replay storage is not running")
+
+        return self._executor, self._store
+
+    async def save(self, score_id: int, data: bytes) -> None:
+        executor, store = self._running()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, store.put, score_id, data)
+
+    def _open(self, score_id: int) -> tuple[int, Generator[bytes, None, None]] | None:
+        _, store = self._running()
+
+        location = store.locate(score_id)
+        if location is not None:
+            return location.raw_length, store.iter_chunks(location)
+
+        legacy_file = self.legacy_path / f"{score_id}.osr"
+        try:
+            size = legacy_file.stat().st_size
+        except FileNotFoundError:
+            return None
+
+        return size, _iter_file(legacy_file)
+
+    async def open(self, score_id: int) -> ReplayStream | None:
+        """Open a score's replay, to be streamed, if it has one."""
+        executor, _ = self._running()
+        loop = asyncio.get_running_loop()
+
+        opened = await loop.run_in_executor(executor, self._open, score_id)
+        if opened is None:
+            return None
+
+        size, chunks = opened
+        return ReplayStream(size, chunks, executor)
+
+    async def read(self, score_id: int) -> bytes | None:
+        """Read the whole of a score's replay, if it has one."""
+        stream = await self.open(score_id)
+        if stream is None:
+            return None
+
+        return await stream.read()
+
+
+storage = ReplayStorage()
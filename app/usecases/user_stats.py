@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import app.settings
+import app.state
+from app.constants.gamemodes import GameMode
+from app.objects.beatmap import RankedStatus
+from app.objects.score import Score
+from app.objects.score import SubmissionStatus
+from app.objects.user_stats import COUNTED_GRADES
+from app.objects.user_stats import TOP_SCORES_KEPT
+from app.objects.user_stats import UserStats
+from app.repositories import stats as stats_repo
+
+# (player id, mode)
+UserStatsKey = tuple[int, int]
+
+# the map statuses whose scores award pp & ranked score.
+RANKED_STATUSES = (RankedStatus.Ranked, RankedStatus.Approved)
+
+# the most recently used stats, also stored in redis (which other
+# processes, and this one once they're evicted, load them from).
+_cache: OrderedDict[UserStatsKey, UserStats] = OrderedDict()
+_in_flight: dict[UserStatsKey, asyncio.Future[UserStats]] = {}
+
+
+class StatsMismatch(NamedTuple):
+    player_id: int
+    mode: int
+    pp: int  # incrementally updated
+    acc: float
+    sql_pp: int  # recalculated from sql
+    sql_acc: float
+
+
+def _redis_key(player_id: int, mode: int) -> str:
+    return f"bancho:user_stats:{player_id}:{mode}"
+
+
+def _cache_put(key: UserStatsKey, user_stats: UserStats) -> None:
+    if app.settings.USER_STATS_CACHE_SIZE == 0:
+        return
+
+    _cache[key] = user_stats
+    _cache.move_to_end(key)
+    while len(_cache) > app.settings.USER_STATS_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def _load_from_sql(player_id: int, mode: int) -> UserStats:
+    """Build a player's stats in a mode from their scores."""
+    params = {"user_id": player_id, "mode": mode}
+
+    top_scores = await app.state.services.database.fetch_all(
+        "SELECT s.id, s.pp, s.acc, COUNT(*) OVER () AS ranked_count "
+        "FROM scores s "
+        "INNER JOIN maps m ON m.md5 = s.map_md5 "
+        "WHERE s.userid = :user_id AND s.mode = :mode "
+        "AND s.status = 2 AND m.status IN (2, 3) AND s.pp > 0 "
+        "ORDER BY s.pp DESC, s.acc DESC, s.id DESC "
+        "LIMIT :limit",
+        params | {"limit": TOP_SCORES_KEPT},
+    )
+
+    totals = await app.state.services.database.fetch_one(
+        "SELECT COUNT(*) AS plays, SUM(s.score) AS tscore, "
+        "SUM(IF(m.status IN (2, 3) AND s.status = 2, s.score, 0)) AS rscore, "
+        "SUM(s.n300 + s.n100 + s.n50 + "
+        "IF(s.mode IN (1, 3, 5), s.ngeki + s.nkatu, 0)) AS total_hits, "
+        "SUM(s.time_elapsed) AS playtime_ms, MAX(s.max_combo) AS max_combo, "
+        + ", ".join(
+            f"SUM(s.grade = '{grade}') AS {grade.lower()}_count"
+            for grade in COUNTED_GRADES
+        )
+        + " FROM scores s "
+        "LEFT JOIN maps m ON m.md5 = s.map_md5 "
+        "WHERE s.userid = :user_id AND s.mode = :mode",
+        params,
+    )
+    assert totals is not None
+
+    user_stats = UserStats(
+        tscore=int(totals["tscore"] or 0),
+        rscore=int(totals["rscore"] or 0),
+        plays=totals["plays"],
+        playtime_ms=int(totals["playtime_ms"] or 0),
+        max_combo=totals["max_combo"] or 0,
+        total_hits=int(totals["total_hits"] or 0),
+        grades={
+            grade: int(totals[f"{grade.lower()}_count"] or 0)
+            for grade in COUNTED_GRADES
+        },
+        ranked_count=top_scores[0]["ranked_count"] if top_scores else 0,
+    )
+    for row in top_scores:
+        user_stats.top_scores.append(
+            (-round(row["pp"], 3), -round(row["acc"], 3), -row["id"]),
+        )
+
+    return user_stats
+
+
+async def _load(key: UserStatsKey) -> UserStats:
+    player_id, mode = key
+
+    data = await app.state.services.redis.get(_redis_key(player_id, mode))
+    if data is not None:
+        user_stats = UserStats.from_dict(json.loads(data))
+    else:
+        user_stats = await _load_from_sql(player_id, mode)
+        await _store(key, user_stats)
+
+    _cache_put(key, user_stats)
+    return user_stats
+
+
+async def fetch(player_id: int, mode: int) -> UserStats:
+    """Fetch a player's stats in a mode, from the cache if possible."""
+    key = (player_id, mode)
+
+    user_stats = _cache.get(key)
+    if user_stats is not None:
+        _cache.move_to_end(key)
+        return user_stats
+
+    # concurrent misses for the same stats share a single load
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_load(key))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+
+    return await asyncio.shield(future)
+
+
+async def _store(key: UserStatsKey, user_stats: UserStats) -> None:
+    player_id, mode = key
+
+    # kept for long enough to be reconciled, should this process stop.
+    await app.state.services.redis.set(
+        _redis_key(player_id, mode),
+        json.dumps(user_stats.to_dict()),
+        ex=app.settings.USER_STATS_RECONCILE_INTERVAL * 2,
+    )
+
+
+async def submit_score(score: Score, user_stats: UserStats) -> UserStats:
+    """\
+    Update a player's stats with a newly submitted score, persisting
+    them to sql, rather than recalculating them from all of their scores.
+
+    `user_stats` must be fetched before the score is inserted (& its
+    previous best's status updated); stats loaded from sql afterwards
+    would already count it.
+    """
+    assert score.player is not None
+    assert score.bmap is not None
+    assert score.id is not None
+
+    key = (score.player.id, score.mode.value)
+
+    total_hits = score.n300 + score.n100 + score.n50
+    if score.mode.value in (1, 3, 5):
+        total_hits += score.ngeki + score.nkatu
+
+    user_stats.add_play(
+        score=score.score,
+        max_combo=score.max_combo,
+        total_hits=total_hits,
+        time_elapsed=score.time_elapsed,
+        grade=score.grade.name,
+    )
+
+    # NOTE: a new best score replaces the previous one, on the same map.
+    if score.status == SubmissionStatus.BEST and score.bmap.status in RANKED_STATUSES:
+        if score.prev_best is not None:
+            user_stats.rscore -= score.prev_best.score
+            if score.prev_best.pp > 0:
+                assert score.prev_best.id is not None
+                user_stats.remove_best(
+                    score.prev_best.id,
+                    score.prev_best.pp,
+                    score.prev_best.acc,
+                )
+
+        user_stats.rscore += score.score
+        if score.pp > 0:
+            user_stats.add_best(score.id, score.pp, score.acc)
+
+    # it may have been evicted (or reconciled) since being fetched
+    _cache_put(key, user_stats)
+    await _store(key, user_stats)
+    await stats_repo.partial_update(
+        score.player.id,
+        score.mode.value,
+        tscore=user_stats.tscore,
+        rscore=user_stats.rscore,
+        pp=user_stats.pp,
+        acc=user_stats.acc,
+        plays=user_stats.plays,
+        playtime=user_stats.playtime,
+        max_combo=user_stats.max_combo,
+        total_hits=user_stats.total_hits,
+        xh_count=user_stats.grades.get("XH", 0),
+        x_count=user_stats.grades.get("X", 0),
+        sh_count=user_stats.grades.get("SH", 0),
+        s_count=user_stats.grades.get("S", 0),
+        a_count=user_stats.grades.get("A", 0),
+    )
+
+    return user_stats
+
+
+async def invalidate_all() -> None:
+    """\
+    Drop all incrementally updated stats, such as when maps' statuses
+    change; they'll be rebuilt from sql when next needed.
+    """
+    _cache.clear()
+
+    redis = app.state.services.redis
+    keys = [key async for key in redis.scan_iter(match="bancho:user_stats:*")]
+    if keys:
+        await redis.delete(*keys)
+
+
+async def reconcile(max_age: float) -> list[StatsMismatch]:
+    """\
+    Recalculate the stats (from sql) of each player whose stats have been
+    updated incrementally for at least `max_age` seconds, and drop them,
+    so they'll be rebuilt from sql. Returns those which had drifted.
+    """
+    redis = app.state.services.redis
+    mismatches: list[StatsMismatch] = []
+
+    async for redis_key in redis.scan_iter(match="bancho:user_stats:*"):
+        data = await redis.get(redis_key)
+        if data is None:
+            continue  # expired
+
+        user_stats = UserStats.from_dict(json.loads(data))
+        if time.time() - user_stats.loaded_at < max_age:
+            continue
+
+        _, _, player_id_str, mode_str = redis_key.decode().split(":")
+        player_id, mode = int(player_id_str), int(mode_str)
+
+        await redis.delete(redis_key)
+        _cache.pop((player_id, mode), None)
+
+        if not user_stats.modified:
+            continue
+
+        player = app.state.sessions.players.get(id=player_id)
+        if player is not None:
+            mode_data = await player.recalc_stats_sql(GameMode(mode))
+            sql_pp, sql_acc = mode_data.pp, mode_data.acc
+        else:
+            await stats_repo.sql_recalculate_mode(player_id, mode)
+            row = await stats_repo.fetch_one(player_id, mode)
+            if row is None:
+                continue
+            sql_pp, sql_acc = row["pp"], row["acc"]
+
+        # acc is stored with 3 decimal places
+        if user_stats.pp != sql_pp or abs(user_stats.acc - sql_acc) >= 0.001:
+            mismatches.append(
+                StatsMismatch(
+                    player_id=player_id,
+                    mode=mode,
+                    pp=user_stats.pp,
+                    acc=user_stats.acc,
+                    sql_pp=sql_pp,
+                    sql_acc=sql_acc,
+                ),
+            )
+
+    return mismatches
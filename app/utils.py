@@ -5,10 +5,13 @@ import inspect
 import os
 import socket
 import sys
+import time
+from collections import OrderedDict
 from collections.abc import Callable
 from pathlib import Path
 from typing import TYPE_CHECKING
 from typing import Any
+from typing import Generic
 from typing import TypedDict
 from typing import TypeVar
 
@@ -23,6 +26,8 @@ if TYPE_CHECKING:
     from app.repositories.users import User
 
 T = TypeVar("T")
+K = TypeVar("K")
+V = TypeVar("V")
 
 
 DATA_PATH = Path.cwd() / ".data"
@@ -187,7 +192,7 @@ def ensure_persistent_volumes_are_available() -> None:
     DATA_PATH.mkdir(exist_ok=True)
 
     # create /.data/... subdirectories
-    for sub_dir in ("avatars", "logs", "osu", "osr", "ss"):
+    for sub_dir in ("avatars", "logs", "osu", "osr", "replays", "ss"):
         subdir = DATA_PATH / sub_dir
         subdir.mkdir(exist_ok=True)
 
@@ -248,3 +253,40 @@ def has_png_headers_and_trailers(data_view: memoryview) -> bool:
         data_view[:8] == b"\x89PNG\r\n\x1a\n"
         and data_view[-8:] == b"\x49END\xae\x42\x60\x82"
     )
+
+
+class TTLCache(Generic[K, V]):
+    """A size-bounded lru cache, whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        """Return the value for `key`, if it's cached & hasn't expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        """Cache `value` for `key`, evicting the least recently used entry if full."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -54,4 +54,55 @@ async def http_client(app: ASGIApp) -> AsyncIterator[httpx.AsyncClient]:
         yield client
 
 
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        help="run the benchmarks (tests marked with `benchmark`)",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers",
+        "benchmark: a benchmark; only run with --benchmark",
+    )
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config,
+    items: list[pytest.Item],
+) -> None:
+    if config.getoption("--benchmark"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
+def pytest_terminal_summary(
+    terminalreporter: pytest.TerminalReporter,
+    exitstatus: int,
+    config: pytest.Config,
+) -> None:
+    if not config.getoption("--benchmark"):
+        return
+
+    # benchmarks report their timings with `record_property`
+    reports = [
+        report
+        for report in terminalreporter.stats.get("passed", [])
+        if report.user_properties
+    ]
+    if not reports:
+        return
+
+    terminalreporter.section("benchmarks")
+    for report in reports:
+        timings = ", ".join(f"{name} {value}" for name, value in report.user_properties)
+        terminalreporter.write_line(f"{report.nodeid}: {timings}")
+
+
 pytest_plugins = []
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import app.usecases.anticheat.multiprocess
+from app.usecases.anticheat.analysis import ReplayAnalysis
+from app.usecases.anticheat.multiprocess import AnalysisDeferred
+from app.usecases.anticheat.multiprocess import AnticheatProcessPool
+from app.usecases.anticheat.multiprocess import AnticheatWorkerError
+
+# the workers inherit the patched analysis when forked.
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="requires forked workers",
+)
+
+
+def _fake_analyze_replay(
+    replay_data: bytes,
+    beatmap_file: str,
+    has_relax: bool,
+) -> ReplayAnalysis:
+    if replay_data == b"block":
+        time.sleep(0.3)
+    elif replay_data == b"hang":
+        time.sleep(30)
+    elif replay_data == b"crash":
+        os._exit(1)
+    elif replay_data == b"crash once" and not os.path.exists(beatmap_file):
+        open(beatmap_file, "w").close()
+        os._exit(1)
+    elif replay_data == b"error":
+        raise ValueError("invalid replay")
+
+    # when the analysis ran, to check the order of analyses
+    return ReplayAnalysis(frametime=time.monotonic(), ur=0, snaps=len(replay_data))
+
+
+@pytest.fixture(autouse=True)
+def fake_analysis(monkeypatch):
+    monkeypatch.setattr(
+        app.usecases.anticheat.multiprocess,
+        "analyze_replay",
+        _fake_analyze_replay,
+    )
+    monkeypatch.setattr(app.usecases.anticheat.multiprocess, "SUPERVISE_INTERVAL", 0.1)
+
+
+def test_analyze():
+    async def run() -> None:
+        pool = AnticheatProcessPool()
+        pool.start(workers=2, queue_size=10, timeout=10)
+        try:
+            analyses = await asyncio.gather(
+                *(
+                    pool.analyze(b"x" * size, "1.osu", False, priority=0)
+                    for size in range(1, 6)
+                ),
+            )
+            assert [analysis.snaps for analysis in analyses] == [1, 2, 3, 4, 5]
+
+            with pytest.raises(AnticheatWorkerError):
+                await pool.analyze(b"error", "1.osu", False, priority=0)
+        finally:
+            await pool.stop()
+
+        with pytest.raises(RuntimeError):
+            pool.analyze(b"x", "1.osu", False, priority=0)
+
+    asyncio.run(run())
+
+
+def test_highest_priority_first():
+    async def run() -> None:
+        pool = AnticheatProcessPool()
+        pool.start(workers=1, queue_size=10, timeout=10)
+        try:
+            blocking = pool.analyze(b"block", "1.osu", False, priority=0)
+            futures = {
+                priority: pool.analyze(b"x", "1.osu", False, priority=priority)
+                for priority in (1, 100_050, 5, 3)
+            }
+            assert pool.queue_depth == 4
+            assert pool.spare_capacity == 0
+
+            await blocking
+            analyses = {priority: await future for priority, future in futures.items()}
+        finally:
+            await pool.stop()
+
+        ran_at = sorted(analyses, key=lambda priority: analyses[priority].frametime)
+        assert ran_at == [100_050, 5, 3, 1]
+
+    asyncio.run(run())
+
+
+def test_deferred_when_queue_full():
+    async def run() -> None:
+        pool = AnticheatProcessPool()
+        pool.start(workers=1, queue_size=2, timeout=10)
+        try:
+            blocking = pool.analyze(b"block", "1.osu", False, priority=0)
+            low = pool.analyze(b"x", "1.osu", False, priority=1)
+            high = pool.analyze(b"x", "1.osu", False, priority=3)
+
+            # the lowest priority queued analysis makes room for a higher one
+            higher = pool.analyze(b"x", "1.osu", False, priority=2)
+            with pytest.raises(AnalysisDeferred):
+                await low
+
+            # & a new one is deferred if it's the lowest
+            lowest = pool.analyze(b"x", "1.osu", False, priority=0)
+            with pytest.raises(AnalysisDeferred):
+                await lowest
+
+            assert pool.queue_depth == 2
+            await asyncio.gather(blocking, high, higher)
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    ("replay_data", "error"),
+    [(b"hang", TimeoutError), (b"crash", AnticheatWorkerError)],
+)
+def test_worker_restarted(replay_data, error):
+    async def run() -> None:
+        pool = AnticheatProcessPool()
+        pool.start(workers=1, queue_size=10, timeout=0.5)
+        try:
+            failing = pool.analyze(replay_data, "1.osu", False, priority=1)
+            queued = pool.analyze(b"x", "1.osu", False, priority=0)
+
+            with pytest.raises(error):
+                await asyncio.wait_for(failing, timeout=5)
+
+            # submitted while the failed worker is being stopped
+            submitted = pool.analyze(b"xx", "1.osu", False, priority=0)
+
+            # both run on the worker's replacement
+            assert (await asyncio.wait_for(queued, timeout=5)).snaps == 1
+            assert (await asyncio.wait_for(submitted, timeout=5)).snaps == 2
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_analysis_retried_once_after_worker_exits(tmp_path):
+    async def run() -> None:
+        pool = AnticheatProcessPool()
+        pool.start(workers=1, queue_size=10, timeout=10)
+        try:
+            marker = str(tmp_path / "crashed")
+            analysis = pool.analyze(b"crash once", marker, False, priority=0)
+            assert (await asyncio.wait_for(analysis, timeout=5)).snaps == 10
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+import app.bg_loops
+import app.settings
+import app.state
+from app.objects.player import OsuStream
+
+
+class _StopLoop(Exception): ...
+
+
+async def test_update_allowed_client_versions_keeps_last_good_set(monkeypatch):
+    stale_versions = {date(2024, 1, 1)}
+    fresh_versions = {date(2024, 2, 1)}
+
+    async def fetch(osu_stream: OsuStream) -> set[date]:
+        if osu_stream is OsuStream.BETA:
+            raise ConnectionError("osu! api unavailable")
+        return fresh_versions
+
+    monkeypatch.setattr(app.bg_loops, "_fetch_allowed_client_versions", fetch)
+    monkeypatch.setattr(
+        app.state.cache,
+        "allowed_client_versions",
+        {OsuStream.BETA: stale_versions},
+    )
+
+    await app.bg_loops._update_allowed_client_versions()
+
+    allowed_client_versions = app.state.cache.allowed_client_versions
+    assert allowed_client_versions[OsuStream.STABLE] == fresh_versions
+    assert allowed_client_versions[OsuStream.BETA] == stale_versions
+    assert OsuStream.PPYSB not in allowed_client_versions
+
+
+async def test_refresh_allowed_client_versions_after_startup(monkeypatch):
+    updates = []
+    sleeps = []
+
+    async def update() -> None:
+        updates.append(len(sleeps))
+
+    async def sleep(interval: float) -> None:
+        sleeps.append(interval)
+        if len(sleeps) == 3:
+            raise _StopLoop
+
+    monkeypatch.setattr(app.settings, "DISALLOW_OLD_CLIENTS", True)
+    monkeypatch.setattr(app.bg_loops, "_update_allowed_client_versions", update)
+    monkeypatch.setattr(app.bg_loops.asyncio, "sleep", sleep)
+
+    with pytest.raises(_StopLoop):
+        await app.bg_loops._refresh_allowed_client_versions(interval=60)
+
+    # the first fetch is made on startup, so the loop waits first
+    assert updates == [1, 2]
+    assert sleeps == [60, 60, 60]
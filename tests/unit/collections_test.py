@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import app.packets
+from app.constants.gamemodes import GameMode
+from app.constants.privileges import Privileges
+from app.objects.collections import Players
+from app.objects.collections import Roster
+from app.objects.collections import StatsBroadcaster
+from app.objects.collections import TimeoutWheel
+from app.objects.player import ModeData
+from app.objects.player import Player
+
+
+def _make_player(
+    id: int,
+    name: str,
+    priv: Privileges,
+    token: str = "",
+) -> Player:
+    player = Player(id=id, name=name, priv=priv, pw_bcrypt=None, token=token)
+    player.stats[GameMode.VANILLA_OSU] = ModeData(
+        tscore=0,
+        rscore=0,
+        pp=0,
+        acc=0.0,
+        plays=0,
+        playtime=0,
+        max_combo=0,
+        total_hits=0,
+        rank=0,
+        grades={},
+    )
+    return player
+
+
+def test_roster_serialize():
+    roster = Roster()
+    cmyui = _make_player(1001, "cmyui", Privileges.UNRESTRICTED)
+    jacobian = _make_player(1002, "jacobian", Privileges.UNRESTRICTED)
+
+    assert roster.serialize() == b""
+
+    roster.add(cmyui)
+    roster.add(jacobian)
+    assert roster.serialize() == (
+        app.packets.user_presence(cmyui)
+        + app.packets.user_stats(cmyui)
+        + app.packets.user_presence(jacobian)
+        + app.packets.user_stats(jacobian)
+    )
+
+    # the joined roster is reused until something changes
+    assert roster.serialize() is roster.serialize()
+
+    cmyui.gm_stats.pp = 727
+    cmyui.bump_presence_version()
+    roster.invalidate(cmyui)
+    assert app.packets.user_stats(cmyui) in roster.serialize()
+
+    roster.remove(jacobian)
+    assert roster.serialize() == (
+        app.packets.user_presence(cmyui) + app.packets.user_stats(cmyui)
+    )
+
+
+def test_roster_drops_restricted_players():
+    roster = Roster()
+    cmyui = _make_player(1001, "cmyui", Privileges.UNRESTRICTED)
+
+    roster.add(cmyui)
+    cmyui.priv &= ~Privileges.UNRESTRICTED
+    roster.invalidate(cmyui)
+
+    assert cmyui not in roster
+    assert roster.serialize() == b""
+
+
+def test_players_indexed_lookups():
+    players = Players()
+    cmyui = _make_player(1001, "cmyui", Privileges.UNRESTRICTED, token="a")
+    tourney = _make_player(1001, "cmyui", Privileges.UNRESTRICTED, token="b")
+    jacobian = _make_player(1002, "Jacobian", Privileges.UNRESTRICTED, token="c")
+
+    for player in (cmyui, tourney, jacobian):
+        players.append(player)
+
+    assert players.get(token="b") is tourney
+    assert players.get(id=1001) is cmyui
+    assert players.get(name="JACOBIAN") is jacobian
+    assert players.get(token="b", id=1002) is tourney
+    assert players.get(id=1003) is None
+    assert players.get() is None
+
+    assert "Jacobian" in players
+    assert "jacobian" not in players
+    assert jacobian in players
+    assert players.ids == {1001, 1002}
+
+    # the earliest remaining session takes over the id & name
+    cmyui.token = ""  # cleared by logout before removal
+    players.remove(cmyui)
+    assert players.get(id=1001) is tourney
+    assert players.get(name="cmyui") is tourney
+    assert players.get(token="a") is None
+
+    jacobian.name = "jacobian2"
+    jacobian.token = "d"
+    players.reindex(jacobian)
+    assert players.get(name="Jacobian") is None
+    assert players.get(name="jacobian2") is jacobian
+    assert players.get(token="d") is jacobian
+
+    players.remove(tourney)
+    players.remove(jacobian)
+    assert players.ids == set()
+    assert list(players) == []
+
+
+def test_players_privilege_partitions():
+    players = Players()
+    cmyui = _make_player(
+        1001,
+        "cmyui",
+        Privileges.UNRESTRICTED | Privileges.ADMINISTRATOR,
+    )
+    jacobian = _make_player(1002, "jacobian", Privileges.UNRESTRICTED)
+    restricted = _make_player(1003, "restricted", Privileges.VERIFIED)
+
+    staff = players.staff
+    for player in (cmyui, jacobian, restricted):
+        players.append(player)
+
+    # the views reflect later changes without being re-read
+    assert list(staff) == [cmyui]
+    assert list(players.unrestricted) == [cmyui, jacobian]
+    assert list(players.restricted) == [restricted]
+
+    jacobian.priv &= ~Privileges.UNRESTRICTED
+    players.repartition(jacobian)
+    assert list(players.unrestricted) == [cmyui]
+    assert list(players.restricted) == [restricted, jacobian]
+
+    players.remove(cmyui)
+    assert not staff
+    assert list(players.unrestricted) == []
+
+    players.remove(jacobian)
+    players.remove(restricted)
+    assert not players.restricted
+
+
+def test_stats_broadcaster_coalesces_changes(monkeypatch):
+    import app.state
+
+    players = Players()
+    monkeypatch.setattr(app.state.sessions, "players", players)
+
+    broadcaster = StatsBroadcaster()
+    cmyui = _make_player(1001, "cmyui", Privileges.UNRESTRICTED, token="a")
+    jacobian = _make_player(1002, "jacobian", Privileges.UNRESTRICTED, token="b")
+    offline = _make_player(1003, "offline", Privileges.UNRESTRICTED, token="c")
+    players.append(cmyui)
+    players.append(jacobian)
+
+    broadcaster.flush()
+    assert cmyui.dequeue() is None
+
+    for pp in (100, 200, 300):
+        cmyui.gm_stats.pp = pp
+        cmyui.bump_presence_version()
+        broadcaster.schedule(cmyui)
+    broadcaster.schedule(offline)
+
+    assert cmyui in broadcaster
+    assert len(broadcaster) == 2
+
+    # only the final state is sent, once, to everyone online
+    broadcaster.flush()
+    expected = app.packets.user_stats(cmyui)
+    assert cmyui.dequeue() == expected
+    assert jacobian.dequeue() == expected
+    assert not broadcaster
+
+    players.remove(cmyui)
+    players.remove(jacobian)
+
+
+def test_timeout_wheel_expires_due_players():
+    wheel = TimeoutWheel()
+    now = float(wheel._cursor)
+    cmyui = _make_player(1001, "cmyui", Privileges.UNRESTRICTED)
+    jacobian = _make_player(1002, "jacobian", Privileges.UNRESTRICTED)
+    bot = _make_player(1, "BanchoBot", Privileges.UNRESTRICTED)
+
+    wheel.schedule(cmyui, now + 300.5)
+    wheel.schedule(jacobian, now + 300.5)
+    wheel.schedule(bot, now + 10_000)  # beyond a full turn of the wheel
+
+    # polling pushes the deadline back
+    wheel.schedule(jacobian, now + 310.5)
+
+    assert wheel.expire(now + 300) == []
+    assert wheel.expire(now + 301) == [cmyui]
+    assert cmyui not in wheel
+
+    wheel.cancel(jacobian)
+    assert wheel.expire(now + 9_999) == []
+    assert wheel.expire(now + 10_001) == [bot]
+
+    assert len(wheel) == 0
+    assert wheel.expired_count == 2
+    assert wheel.expiry_delay_ms.count == 2
+    assert wheel.expiry_delay_ms.total == 500 + 1000
+
+
+def test_timeout_wheel_past_deadline():
+    wheel = TimeoutWheel()
+    now = float(wheel._cursor)
+    cmyui = _make_player(1001, "cmyui", Privileges.UNRESTRICTED)
+
+    wheel.schedule(cmyui, now - 60)
+    assert wheel.expire(now + 1) == [cmyui]
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import ipaddress
+
+import pytest
+
+from app.adapters.geolocation import IPLocation
+from app.adapters.geolocation import IPRangeDatabase
+from app.utils import TTLCache
+
+CSV_DATA = """\
+start,end,country,latitude,longitude
+1.0.0.0,1.0.0.255,AU,-33.494,143.2104
+1.0.1.0,1.0.3.255,CN,34.7732,113.722
+16777216,16777471,AU,-33.494,143.2104
+2.0.0.0,2.0.0.255,-,0,0
+2001:200::,2001:200:ffff:ffff:ffff:ffff:ffff:ffff,JP,35.69,139.69
+"""
+
+
+def test_ip_range_database_lookup(tmp_path):
+    csv_path = tmp_path / "ip_ranges.csv"
+    csv_path.write_text(CSV_DATA)
+
+    database = IPRangeDatabase.from_csv(csv_path)
+    assert len(database) == 4
+
+    lookup = lambda ip: database.lookup(ipaddress.ip_address(ip))
+
+    assert lookup("1.0.0.0") == IPLocation("au", -33.494, 143.2104)
+    assert lookup("1.0.2.7") == IPLocation("cn", 34.7732, 113.722)
+    assert lookup("1.0.3.255") == IPLocation("cn", 34.7732, 113.722)
+    assert lookup("1.0.4.0") is None
+    assert lookup("0.255.255.255") is None
+    assert lookup("2.0.0.1") is None  # unallocated
+    assert lookup("2001:200::1") == IPLocation("jp", 35.69, 139.69)
+    assert lookup("2001:201::") is None
+
+
+# samples of the vendors' lite csvs, as downloaded
+DBIP_COUNTRY_CSV_DATA = """\
+1.0.0.0,1.0.0.255,AU
+1.0.1.0,1.0.3.255,CN
+2001:200::,2001:200:ffff:ffff:ffff:ffff:ffff:ffff,JP
+"""
+
+DBIP_CITY_CSV_DATA = """\
+1.0.0.0,1.0.0.255,OC,AU,Queensland,"South Brisbane",-27.4767,153.017
+1.0.1.0,1.0.3.255,AS,CN,Fujian,Fuzhou,26.0614,119.306
+2001:200::,2001:200:ffff:ffff:ffff:ffff:ffff:ffff,AS,JP,Tokyo,Tokyo,35.6895,139.692
+"""
+
+IP2LOCATION_DB1_CSV_DATA = """\
+"0","16777215","-","-"
+"16777216","16777471","US","United States of America"
+"16777472","16778239","CN","China"
+"""
+
+IP2LOCATION_DB5_CSV_DATA = """\
+"0","16777215","-","-","-","-","0.000000","0.000000"
+"16777216","16777471","US","United States of America","California","Los Angeles","34.052230","-118.243680"
+"16777472","16778239","CN","China","Fujian","Fuzhou","26.061390","119.306110"
+"""
+
+
+@pytest.mark.parametrize(
+    ("csv_data", "expected"),
+    [
+        (
+            DBIP_COUNTRY_CSV_DATA,
+            {
+                "1.0.0.1": IPLocation("au", 0.0, 0.0),
+                "1.0.2.7": IPLocation("cn", 0.0, 0.0),
+                "2001:200::1": IPLocation("jp", 0.0, 0.0),
+            },
+        ),
+        (
+            DBIP_CITY_CSV_DATA,
+            {
+                "1.0.0.1": IPLocation("au", -27.4767, 153.017),
+                "1.0.2.7": IPLocation("cn", 26.0614, 119.306),
+                "2001:200::1": IPLocation("jp", 35.6895, 139.692),
+            },
+        ),
+        (
+            IP2LOCATION_DB1_CSV_DATA,
+            {
+                "0.0.0.1": None,  # unallocated
+                "1.0.0.1": IPLocation("us", 0.0, 0.0),
+                "1.0.2.7": IPLocation("cn", 0.0, 0.0),
+            },
+        ),
+        (
+            IP2LOCATION_DB5_CSV_DATA,
+            {
+                "0.0.0.1": None,  # unallocated
+                "1.0.0.1": IPLocation("us", 34.05223, -118.24368),
+                "1.0.2.7": IPLocation("cn", 26.06139, 119.30611),
+            },
+        ),
+    ],
+    ids=["dbip-country", "dbip-city", "ip2location-db1", "ip2location-db5"],
+)
+def test_ip_range_database_vendor_layouts(tmp_path, csv_data, expected):
+    csv_path = tmp_path / "ip_ranges.csv"
+    csv_path.write_text(csv_data)
+
+    database = IPRangeDatabase.from_csv(csv_path)
+    for ip, location in expected.items():
+        assert database.lookup(ipaddress.ip_address(ip)) == location
+
+
+def test_ip_range_database_unrecognized_layout(tmp_path):
+    csv_path = tmp_path / "ip_ranges.csv"
+    csv_path.write_text("1.0.0.0,1.0.0.255,OC,AU,Queensland,Brisbane\n")
+
+    with pytest.raises(ValueError):
+        IPRangeDatabase.from_csv(csv_path)
+
+    # a row which doesn't match the detected layout
+    csv_path.write_text(
+        "1.0.0.0,1.0.0.255,AU,-33.494,143.2104\n1.0.1.0,1.0.3.255,CN,x,y\n"
+    )
+
+    with pytest.raises(ValueError):
+        IPRangeDatabase.from_csv(csv_path)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    import app.utils
+
+    now = 1000.0
+    monkeypatch.setattr(app.utils.time, "monotonic", lambda: now)
+
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+
+    now += 59
+    assert cache.get("a") == 1
+
+    now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
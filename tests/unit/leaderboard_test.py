@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import app.state
+from app.constants.gamemodes import GameMode
+from app.objects.leaderboard import SCORE_SIZE_ESTIMATE
+from app.objects.leaderboard import Leaderboard
+from app.objects.leaderboard import LeaderboardCache
+from app.objects.leaderboard import LeaderboardScore
+from app.objects.leaderboard import RenderedScores
+from app.objects.score import Score
+
+
+def _make_score(
+    id: int,
+    userid: int,
+    score: float,
+    mods: int = 0,
+    country: str = "ca",
+) -> LeaderboardScore:
+    return LeaderboardScore(
+        id=id,
+        score=score,
+        max_combo=100,
+        n50=0,
+        n100=0,
+        n300=100,
+        nmiss=0,
+        nkatu=0,
+        ngeki=0,
+        perfect=1,
+        mods=mods,
+        time=1700000000,
+        userid=userid,
+        name=f"player {userid}",
+        clan_tag=None,
+        country=country,
+    )
+
+
+def _user_ids(scores: list[LeaderboardScore]) -> list[int]:
+    return [score.userid for score in scores]
+
+
+def test_leaderboard_ordering_and_placement():
+    leaderboard = Leaderboard(
+        [
+            _make_score(1, userid=10, score=500),
+            _make_score(2, userid=11, score=700),
+            _make_score(3, userid=12, score=500),  # tie, submitted later
+            _make_score(4, userid=13, score=900),
+        ],
+        restricted_user_ids=[13],
+    )
+
+    assert _user_ids(leaderboard.top(50, user_id=10)) == [11, 10, 12]
+    assert _user_ids(leaderboard.top(2, user_id=10)) == [11, 10]
+
+    # restricted players only see their own scores
+    assert _user_ids(leaderboard.top(50, user_id=13)) == [13, 11, 10, 12]
+    assert _user_ids(leaderboard.top(2, user_id=13)) == [13, 11]
+
+    # restricted scores don't affect placement
+    assert leaderboard.placement(900) == 1
+    assert leaderboard.placement(700) == 1
+    assert leaderboard.placement(500) == 2
+    assert leaderboard.placement(600) == 2
+    assert leaderboard.placement(0) == 4
+
+
+def test_leaderboard_filters():
+    leaderboard = Leaderboard(
+        [
+            _make_score(1, userid=10, score=500, mods=8),
+            _make_score(2, userid=11, score=700, country="us"),
+            _make_score(3, userid=12, score=600, mods=8, country="us"),
+        ],
+    )
+
+    assert _user_ids(leaderboard.top(50, 10, lambda s: s.mods == 8)) == [12, 10]
+    assert _user_ids(leaderboard.top(50, 10, lambda s: s.country == "us")) == [11, 12]
+    assert _user_ids(leaderboard.top(1, 10, lambda s: s.country == "us")) == [11]
+
+
+def test_leaderboard_updates():
+    leaderboard = Leaderboard(
+        [
+            _make_score(1, userid=10, score=500),
+            _make_score(2, userid=11, score=700),
+        ],
+    )
+
+    # a new best replaces the player's previous one
+    leaderboard.upsert(_make_score(3, userid=10, score=800), restricted=False)
+    assert _user_ids(leaderboard.top(50, user_id=11)) == [10, 11]
+    assert leaderboard.personal_best(10) == _make_score(3, userid=10, score=800)
+    assert len(leaderboard) == 2
+
+    leaderboard.set_restricted(10, True)
+    assert _user_ids(leaderboard.top(50, user_id=11)) == [11]
+    assert leaderboard.placement(700) == 1
+
+    # new bests of restricted players stay hidden
+    leaderboard.upsert(_make_score(4, userid=10, score=900), restricted=True)
+    assert _user_ids(leaderboard.top(50, user_id=11)) == [11]
+
+    leaderboard.set_restricted(10, False)
+    assert _user_ids(leaderboard.top(50, user_id=11)) == [10, 11]
+
+    leaderboard.remove_user(11)
+    assert _user_ids(leaderboard.top(50, user_id=10)) == [10]
+
+
+def test_leaderboard_upsert_restricted_since_loaded():
+    leaderboard = Leaderboard([_make_score(1, userid=11, score=700)])
+
+    # restricted after the leaderboard was loaded, setting their first best
+    leaderboard.upsert(_make_score(2, userid=10, score=900), restricted=True)
+    assert _user_ids(leaderboard.top(50, user_id=11)) == [11]
+    assert _user_ids(leaderboard.top(50, user_id=10)) == [10, 11]
+    assert leaderboard.placement(700) == 1
+
+    # & unrestricted since
+    leaderboard.upsert(_make_score(3, userid=10, score=950), restricted=False)
+    assert _user_ids(leaderboard.top(50, user_id=11)) == [10, 11]
+    assert leaderboard.placement(700) == 2
+
+
+def test_leaderboard_cache_lru_eviction():
+    cache = LeaderboardCache(max_bytes=3 * SCORE_SIZE_ESTIMATE, ttl=60)
+
+    for map_md5 in ("a", "b"):
+        cache.begin_load((map_md5, 0, "score"))
+        cache.finish_load((map_md5, 0, "score"), Leaderboard([_make_score(1, 10, 5)]))
+
+    assert cache.get(("a", 0, "score")) is not None  # "b" is now least recent
+
+    cache.begin_load(("c", 0, "score"))
+    cache.finish_load(
+        ("c", 0, "score"),
+        Leaderboard([_make_score(2, 10, 5), _make_score(3, 11, 5)]),
+    )
+
+    assert cache.get(("b", 0, "score")) is None
+    assert cache.get(("a", 0, "score")) is not None
+    assert cache.evictions == 1
+    assert cache.size_bytes == 3 * SCORE_SIZE_ESTIMATE
+
+    # growing a leaderboard may evict it, or others
+    cache.upsert(
+        "c",
+        0,
+        {"pp": _make_score(4, 12, 5), "score": _make_score(4, 12, 5)},
+        restricted=False,
+    )
+    assert cache.get(("c", 0, "score")) is None
+    assert cache.get(("a", 0, "score")) is not None
+    assert cache.size_bytes == SCORE_SIZE_ESTIMATE
+
+
+def test_leaderboard_cache_expiry():
+    cache = LeaderboardCache(max_bytes=1 << 20, ttl=60)
+    leaderboard = Leaderboard([_make_score(1, 10, 5)])
+    leaderboard.loaded_at -= 61
+
+    cache.begin_load(("a", 0, "score"))
+    cache.finish_load(("a", 0, "score"), leaderboard)
+
+    assert cache.get(("a", 0, "score")) is None
+    assert cache.size_bytes == 0
+
+
+def test_leaderboard_cache_discards_loads_modified_in_progress():
+    cache = LeaderboardCache(max_bytes=1 << 20, ttl=60)
+
+    cache.begin_load(("a", 0, "pp"))
+    cache.begin_load(("b", 0, "pp"))
+    cache.mark_modified("a")
+
+    assert not cache.finish_load(("a", 0, "pp"), Leaderboard())
+    assert cache.finish_load(("b", 0, "pp"), Leaderboard())
+    assert cache.get(("a", 0, "pp")) is None
+
+
+def test_leaderboard_cache_player_updates():
+    cache = LeaderboardCache(max_bytes=1 << 20, ttl=60)
+    for mode in (0, 1):
+        cache.begin_load(("a", mode, "score"))
+        cache.finish_load(
+            ("a", mode, "score"),
+            Leaderboard([_make_score(mode, 10, 5), _make_score(mode + 2, 11, 3)]),
+        )
+
+    cache.set_name(10, "renamed")
+    cache.set_clan_tag(10, "TAG")
+    cache.set_restricted(11, True)
+
+    for mode in (0, 1):
+        leaderboard = cache.get(("a", mode, "score"))
+        assert leaderboard is not None
+        assert [s.display_name for s in leaderboard.top(50, 10)] == ["[TAG] renamed"]
+
+    cache.invalidate("a")
+    assert len(cache) == 0
+
+
+async def test_score_placement_uses_the_cached_leaderboard(monkeypatch):
+    cache = LeaderboardCache(max_bytes=1 << 20, ttl=60)
+    cache.begin_load(("a" * 32, GameMode.RELAX_OSU, "pp"))
+    cache.finish_load(
+        ("a" * 32, GameMode.RELAX_OSU, "pp"),
+        Leaderboard([_make_score(1, 10, 300.0), _make_score(2, 11, 200.0)]),
+    )
+    monkeypatch.setattr(app.state.cache, "leaderboards", cache)
+
+    score = Score()
+    score.bmap = SimpleNamespace(md5="a" * 32)  # type: ignore[assignment]
+    score.mode = GameMode.RELAX_OSU
+    score.pp = 250.0
+    score.score = 1_000_000
+
+    assert await score.calculate_placement() == 2
+    assert cache.hits == 1
+
+
+def test_rendered_views_are_cleared_with_the_scores():
+    cache = LeaderboardCache(max_bytes=1 << 20, ttl=60)
+    leaderboard = Leaderboard([_make_score(1, 10, 5), _make_score(2, 11, 3)])
+    cache.begin_load(("a", 0, "score"))
+    cache.finish_load(("a", 0, "score"), leaderboard)
+
+    rendered = RenderedScores(score_count=2, body=b"x" * 100)
+    for view in (("top", None), ("country", "ca")):
+        cache.store_rendered(("a", 0, "score"), leaderboard, view, rendered)
+
+    assert leaderboard.rendered(("top", None)) == rendered
+    assert cache.size_bytes == 2 * SCORE_SIZE_ESTIMATE + 200
+
+    # renaming players without scores on the map changes nothing
+    cache.set_name(12, "renamed")
+    assert leaderboard.rendered(("top", None)) == rendered
+
+    for update in (
+        lambda: cache.set_name(10, "renamed"),
+        lambda: cache.set_clan_tag(10, "TAG"),
+        lambda: cache.set_restricted(11, True),
+        lambda: cache.upsert(
+            "a",
+            0,
+            {"pp": _make_score(3, 12, 1), "score": _make_score(3, 12, 1)},
+            restricted=False,
+        ),
+    ):
+        cache.store_rendered(("a", 0, "score"), leaderboard, ("top", None), rendered)
+        update()
+        assert leaderboard.rendered(("top", None)) is None
+        assert leaderboard.rendered(("country", "ca")) is None
+        assert cache.size_bytes == leaderboard.size_bytes
+
+    # views of leaderboards which are no longer cached aren't stored
+    stale_leaderboard = Leaderboard()
+    cache.store_rendered(("a", 0, "score"), stale_leaderboard, ("top", None), rendered)
+    assert stale_leaderboard.rendered(("top", None)) is None
+
+
+def test_cached_ratings_are_invalidated():
+    cache = LeaderboardCache(max_bytes=1 << 20, ttl=60)
+    for map_md5 in ("a", "b"):
+        leaderboard = Leaderboard()
+        leaderboard.rating = 7.5
+        cache.begin_load((map_md5, 0, "score"))
+        cache.finish_load((map_md5, 0, "score"), leaderboard)
+
+    cache.invalidate_rating("a")
+
+    leaderboard_a = cache.get(("a", 0, "score"))
+    leaderboard_b = cache.get(("b", 0, "score"))
+    assert leaderboard_a is not None and leaderboard_a.rating is None
+    assert leaderboard_b is not None and leaderboard_b.rating == 7.5
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import pytest
+
+from app.metrics import Histogram
+from app.metrics import PacketStats
+
+
+@pytest.mark.parametrize("value", [0, 1, 15, 16, 17, 31, 32, 1000, 123_456_789])
+def test_histogram_relative_error(value):
+    histogram = Histogram()
+    histogram.record(value)
+    histogram.record(2**62)  # keep max from bounding the result
+
+    assert value <= histogram.percentile(50) <= value * 17 / 16 + 1
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+
+    assert histogram.count == 1000
+    assert histogram.mean == 500.5
+    assert histogram.max == 1000
+    assert 500 <= histogram.percentile(50) <= 532
+    assert 990 <= histogram.percentile(99) <= 1000
+    assert histogram.percentile(100) == 1000
+    assert Histogram().percentile(50) == 0
+
+
+def test_histogram_since():
+    histogram = Histogram()
+    for value in range(100):
+        histogram.record(value)
+
+    earlier = histogram.copy()
+    histogram.record(5000)
+    histogram.record(5000)
+
+    interval = histogram.since(earlier)
+    assert interval.count == 2
+    assert interval.total == 10000
+    assert interval.percentile(50) == interval.max == 5000
+
+
+def test_packet_stats():
+    stats = PacketStats()
+    stats.record_packet(4, 0)
+    stats.record_packet(4, 0)
+    stats.record_packet(1, 12)
+    stats.record_handle_time(1, 2500)
+    stats.record_request(3, 128)
+
+    assert stats.packets[4].count == 2
+    assert stats.packets[1].bytes == 12
+    assert stats.packets[1].handle_time_ns.max == 2500
+    assert stats.response_bytes.total == 128
+
+    snapshot = stats.copy()
+    stats.record_packet(4, 0)
+    assert snapshot.packets[4].count == 2
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import timeit
+from types import SimpleNamespace
+
 import pytest
 
 import app.packets
+import app.settings
+import app.state
 
 
 @pytest.mark.parametrize(
@@ -667,3 +672,437 @@ def test_write_match_abort():
 )
 def test_write_switch_tournament_server(test_input, expected):
     assert app.packets.switch_tournament_server(test_input) == expected
+
+
+def _read_packets(body: bytes, packet_map) -> list:
+    with memoryview(body) as body_view:
+        return list(app.packets.BanchoPacketReader(body_view, packet_map))
+
+
+class _ReadMessage(app.packets.BasePacket):
+    def __init__(self, reader: app.packets.BanchoPacketReader) -> None:
+        self.msg = reader.read_message()
+
+    async def handle(self, player) -> None: ...
+
+
+class _ReadI32List(app.packets.BasePacket):
+    def __init__(self, reader: app.packets.BanchoPacketReader) -> None:
+        self.user_ids = reader.read_i32_list_i16l()
+
+    async def handle(self, player) -> None: ...
+
+
+class _ReadReplayFrameBundle(app.packets.BasePacket):
+    def __init__(self, reader: app.packets.BanchoPacketReader) -> None:
+        self.frame_bundle = reader.read_replayframe_bundle()
+
+    async def handle(self, player) -> None: ...
+
+
+def test_read_packets_skips_unhandled():
+    body = (
+        # ping (unhandled), followed by a public message
+        b"\x04\x00\x00\x00\x00\x00\x00"
+        b"\x01\x00\x00\x1c\x00\x00\x00\x00\x0b\x0fhello osu world\x0b\x04#osu\x00\x00\x00\x00"
+        # user stats request (unhandled) with body
+        b"\x55\x00\x00\x06\x00\x00\x00\x01\x00\xe9\x03\x00\x00"
+        # user presence request
+        b"\x61\x00\x00\x0a\x00\x00\x00\x02\x00\xe9\x03\x00\x00\x03\x00\x00\x00"
+    )
+    packets = _read_packets(
+        body,
+        {
+            app.packets.ClientPackets.SEND_PUBLIC_MESSAGE: _ReadMessage,
+            app.packets.ClientPackets.USER_PRESENCE_REQUEST: _ReadI32List,
+        },
+    )
+
+    assert len(packets) == 2
+    assert packets[0].msg == app.packets.Message(
+        sender="",
+        text="hello osu world",
+        recipient="#osu",
+        sender_id=0,
+    )
+    assert packets[1].user_ids == (1001, 3)
+
+
+def test_read_i32_list_format_cache_bounded():
+    # each distinct (client provided) list length has its own format
+    for length in range(1, 1001):
+        body = b"\x61\x00\x00" + (2 + length * 4).to_bytes(4, "little")
+        body += length.to_bytes(2, "little") + b"\x01\x00\x00\x00" * length
+        (packet,) = _read_packets(
+            body,
+            {app.packets.ClientPackets.USER_PRESENCE_REQUEST: _ReadI32List},
+        )
+        assert packet.user_ids == (1,) * length
+
+    cache_info = app.packets._u32_array_fmt.cache_info()
+    assert cache_info.currsize <= cache_info.maxsize
+
+
+def test_read_packets_records_stats():
+    from app.metrics import PacketStats
+
+    body = (
+        b"\x04\x00\x00\x00\x00\x00\x00"
+        b"\x55\x00\x00\x06\x00\x00\x00\x01\x00\xe9\x03\x00\x00"
+        b"\x61\x00\x00\x0a\x00\x00\x00\x02\x00\xe9\x03\x00\x00\x03\x00\x00\x00"
+        b"\x04\x00\x00\x00\x00\x00\x00"
+    )
+    stats = PacketStats()
+
+    with memoryview(body) as body_view:
+        reader = app.packets.BanchoPacketReader(
+            body_view,
+            {app.packets.ClientPackets.USER_PRESENCE_REQUEST: _ReadI32List},
+            stats,
+        )
+        assert len(list(reader)) == 1
+
+    # unhandled packets are counted too
+    assert {
+        app.packets.ClientPackets(packet_id): (packet_stats.count, packet_stats.bytes)
+        for packet_id, packet_stats in stats.packets.items()
+    } == {
+        app.packets.ClientPackets.PING: (2, 0),
+        app.packets.ClientPackets.USER_STATS_REQUEST: (1, 6),
+        app.packets.ClientPackets.USER_PRESENCE_REQUEST: (1, 10),
+    }
+
+
+def test_read_replayframe_bundle():
+    frames = (
+        b"\x01\x00\x00\x00\x80?\x00\x00\x00@\x0a\x00\x00\x00"
+        b"\x02\x00\x00\x00@@\x00\x00\x80@\x14\x00\x00\x00"
+    )
+    scoreframe = app.packets.write_scoreframe(
+        app.packets.ScoreFrame(
+            time=20,
+            id=0,
+            num300=1,
+            num100=0,
+            num50=0,
+            num_geki=0,
+            num_katu=0,
+            num_miss=0,
+            total_score=300,
+            max_combo=1,
+            current_combo=1,
+            perfect=True,
+            current_hp=200,
+            tag_byte=0,
+            score_v2=False,
+        ),
+    )
+    data = b"\x00\x00\x00\x00\x02\x00" + frames + b"\x00" + scoreframe + b"\x07\x00"
+    body = b"\x12\x00\x00" + len(data).to_bytes(4, "little") + data
+
+    (packet,) = _read_packets(
+        body,
+        {app.packets.ClientPackets.SPECTATE_FRAMES: _ReadReplayFrameBundle},
+    )
+
+    bundle = packet.frame_bundle
+    assert bundle.frame_count == 2
+    assert "replay_frames" not in vars(bundle)  # decoded lazily
+    assert bundle.replay_frames == [
+        app.packets.ReplayFrame(button_state=1, taiko_byte=0, x=1.0, y=2.0, time=10),
+        app.packets.ReplayFrame(button_state=2, taiko_byte=0, x=3.0, y=4.0, time=20),
+    ]
+    assert bundle.action == app.packets.ReplayAction.Standard
+    assert bundle.score_frame.total_score == 300
+    assert bundle.sequence == 7
+    assert bytes(bundle.raw_data) == data
+
+
+def _make_match(freemods: bool) -> SimpleNamespace:
+    host = SimpleNamespace(id=1001)
+    slots = [
+        SimpleNamespace(status=4, team=1, player=host, mods=64),
+        SimpleNamespace(status=4, team=2, player=SimpleNamespace(id=3), mods=0),
+    ] + [SimpleNamespace(status=1, team=0, player=None, mods=0) for _ in range(14)]
+    return SimpleNamespace(
+        id=5,
+        in_progress=False,
+        mods=64,
+        name="cmyui's game",
+        passwd="secret",
+        map_name="xi - Blue Zenith [FOUR DIMENSIONS]",
+        map_id=658127,
+        map_md5="a5b99395a42bd55bc5eb1d2411cbdf8b",
+        slots=slots,
+        host=host,
+        mode=0,
+        win_condition=0,
+        team_type=0,
+        freemods=freemods,
+        seed=1234,
+    )
+
+
+_SERIALIZER_CASES = [
+    (
+        app.packets.ServerPackets.USER_STATS,
+        (
+            (1001, app.packets.osuTypes.i32),
+            (2, app.packets.osuTypes.u8),
+            ("gaming", app.packets.osuTypes.string),
+            ("60b725f10c9c85c70d97880dfe8191b3", app.packets.osuTypes.string),
+            (64, app.packets.osuTypes.i32),
+            (0, app.packets.osuTypes.u8),
+            (1723723, app.packets.osuTypes.i32),
+            (1_238_917_112, app.packets.osuTypes.i64),
+            (0.9232, app.packets.osuTypes.f32),
+            (3821, app.packets.osuTypes.i32),
+            (3_812_428_392, app.packets.osuTypes.i64),
+            (42, app.packets.osuTypes.i32),
+            (8291, app.packets.osuTypes.u16),
+        ),
+    ),
+    (
+        app.packets.ServerPackets.USER_PRESENCE,
+        (
+            (1001, app.packets.osuTypes.i32),
+            ("cmyui", app.packets.osuTypes.string),
+            (-5 + 24, app.packets.osuTypes.u8),
+            (38, app.packets.osuTypes.u8),
+            (31, app.packets.osuTypes.u8),
+            (43.6532, app.packets.osuTypes.f32),
+            (-79.3832, app.packets.osuTypes.f32),
+            (42, app.packets.osuTypes.i32),
+        ),
+    ),
+    (
+        app.packets.ServerPackets.SEND_MESSAGE,
+        (
+            (
+                ("cmyui", "woah woah crazy!!", "jacobian", 32),
+                app.packets.osuTypes.message,
+            ),
+        ),
+    ),
+    (
+        app.packets.ServerPackets.UPDATE_MATCH,
+        (((_make_match(freemods=False), True), app.packets.osuTypes.match),),
+    ),
+    (
+        app.packets.ServerPackets.UPDATE_MATCH,
+        (((_make_match(freemods=True), False), app.packets.osuTypes.match),),
+    ),
+    (app.packets.ServerPackets.PONG, ()),
+    (
+        app.packets.ServerPackets.USER_LOGOUT,
+        ((1001, app.packets.osuTypes.i32), (0, app.packets.osuTypes.u8)),
+    ),
+    (
+        app.packets.ServerPackets.FRIENDS_LIST,
+        (([1, 4, 1001], app.packets.osuTypes.i32_list),),
+    ),
+]
+
+
+def _flatten_args(args) -> list:
+    flat_args = []
+    for value, osu_type in args:
+        if osu_type in (app.packets.osuTypes.message, app.packets.osuTypes.match):
+            flat_args.extend(value)
+        else:
+            flat_args.append(value)
+    return flat_args
+
+
+@pytest.mark.parametrize(("packid", "args"), _SERIALIZER_CASES)
+def test_compiled_serializer_matches_generic_writer(packid, args):
+    serializer = app.packets._serializers[packid]
+    assert serializer(*_flatten_args(args)) == app.packets.write(packid, *args)
+
+
+# as written by `write_match` before it was specialized.
+@pytest.mark.parametrize(
+    ("freemods", "send_pw", "expected"),
+    [
+        (
+            False,
+            True,
+            b"\x1a\x00\x00\x9c\x00\x00\x00\x05\x00\x00\x00@\x00\x00\x00"
+            b"\x0b\x0ccmyui's game"
+            b'\x0b\x06secret\x0b"xi - Blue Zenith [FOUR DIMENSIONS]\xcf\n\n\x00'
+            b"\x0b a5b99395a42bd55bc5eb1d2411cbdf8b"
+            b"\x04\x04\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01"
+            b"\x01\x02\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+            b"\xe9\x03\x00\x00\x03\x00\x00\x00\xe9\x03\x00\x00\x00\x00\x00\x00"
+            b"\xd2\x04\x00\x00",
+        ),
+        (
+            True,
+            False,
+            b"\x1a\x00\x00\xd6\x00\x00\x00\x05\x00\x00\x00@\x00\x00\x00"
+            b"\x0b\x0ccmyui's game"
+            b'\x0b\x00\x0b"xi - Blue Zenith [FOUR DIMENSIONS]\xcf\n\n\x00'
+            b"\x0b a5b99395a42bd55bc5eb1d2411cbdf8b"
+            b"\x04\x04\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01"
+            b"\x01\x02\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+            b"\xe9\x03\x00\x00\x03\x00\x00\x00\xe9\x03\x00\x00\x00\x00\x00\x01"
+            b"@\x00\x00\x00" + b"\x00" * 60 + b"\xd2\x04\x00\x00",
+        ),
+    ],
+)
+def test_compiled_match_serializer(freemods, send_pw, expected):
+    serializer = app.packets._serializers[app.packets.ServerPackets.UPDATE_MATCH]
+    assert serializer(_make_match(freemods), send_pw) == expected
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize(("packid", "args"), _SERIALIZER_CASES)
+def test_benchmark_compiled_serializer(packid, args, record_property):
+    serializer = app.packets._serializers[packid]
+    flat_args = _flatten_args(args)
+
+    generic_time = min(
+        timeit.repeat(lambda: app.packets.write(packid, *args), number=2000, repeat=3),
+    )
+    compiled_time = min(
+        timeit.repeat(lambda: serializer(*flat_args), number=2000, repeat=3),
+    )
+
+    record_property("generic", f"{generic_time * 500:.2f}µs/op")
+    record_property("compiled", f"{compiled_time * 500:.2f}µs/op")
+
+
+def test_user_stats_memoized_against_presence_version():
+    from app.constants.gamemodes import GameMode
+    from app.constants.privileges import Privileges
+    from app.objects.player import ModeData
+    from app.objects.player import Player
+
+    player = Player(
+        id=1001,
+        name="cmyui",
+        priv=Privileges.UNRESTRICTED,
+        pw_bcrypt=None,
+        token="",
+    )
+    player.stats[GameMode.VANILLA_OSU] = ModeData(
+        tscore=0,
+        rscore=0,
+        pp=100,
+        acc=90.0,
+        plays=1,
+        playtime=0,
+        max_combo=0,
+        total_hits=0,
+        rank=1,
+        grades={},
+    )
+
+    stats_packet = app.packets.user_stats(player)
+    presence_packet = app.packets.user_presence(player)
+    assert app.packets.user_stats(player) is stats_packet
+    assert app.packets.user_presence(player) is presence_packet
+
+    player.gm_stats.pp = 200
+    player.bump_presence_version()
+
+    assert app.packets.user_stats(player) != stats_packet
+    assert app.packets.user_stats(player) == app.packets._user_stats(
+        user_id=1001,
+        action=0,
+        info_text="",
+        map_md5="",
+        mods=0,
+        mode=0,
+        map_id=0,
+        ranked_score=0,
+        accuracy=90.0,
+        plays=1,
+        total_score=0,
+        global_rank=1,
+        pp=200,
+    )
+
+
+def test_coalesce_packets():
+    def stats(user_id: int, pp: int) -> bytes:
+        return app.packets._user_stats(
+            user_id=user_id,
+            action=0,
+            info_text="",
+            map_md5="",
+            mods=0,
+            mode=0,
+            map_id=0,
+            ranked_score=0,
+            accuracy=0.0,
+            plays=0,
+            total_score=0,
+            global_rank=0,
+            pp=pp,
+        )
+
+    message = app.packets.send_message("cmyui", "hello", "#osu", 1001)
+    chunks = [
+        stats(1001, 100) + stats(1002, 100),
+        message,
+        stats(1001, 200),
+        app.packets.logout(1002),
+        stats(1001, 300),
+    ]
+
+    assert app.packets.coalesce_packets(chunks) == [
+        stats(1002, 100),
+        message,
+        app.packets.logout(1002),
+        stats(1001, 300),
+    ]
+
+
+def test_drop_packets():
+    message = app.packets.send_message("cmyui", "hello", "#osu", 1001)
+    frames = app.packets.spectate_frames(b"frames")
+    chunks = [message + frames, frames, app.packets.logout(1002)]
+
+    assert app.packets.drop_packets(chunks, app.packets.DROPPABLE_PACKETS) == [
+        message,
+        app.packets.logout(1002),
+    ]
+
+
+def test_packet_queue_bounded(monkeypatch):
+    from app.constants.privileges import Privileges
+    from app.objects.player import Player
+
+    monkeypatch.setattr(app.settings, "PACKET_QUEUE_MAX_BYTES", 1000)
+    disconnects = []
+    monkeypatch.setattr(
+        app.state,
+        "loop",
+        SimpleNamespace(call_soon=disconnects.append),
+        raising=False,
+    )
+
+    player = Player(
+        id=1001,
+        name="cmyui",
+        priv=Privileges.UNRESTRICTED,
+        pw_bcrypt=None,
+        token="token",
+    )
+
+    # spectator frames are dropped to make room for other packets
+    message = app.packets.send_message("cmyui", "hello", "#osu", 1001)
+    for _ in range(100):
+        player.enqueue(app.packets.spectate_frames(b"x" * 50))
+    player.enqueue(message)
+    assert player._packet_queue_size <= 2 * 1000
+    assert not disconnects
+
+    # a client which still isn't keeping up is disconnected
+    for _ in range(100):
+        player.enqueue(message)
+        assert player._packet_queue_size <= 2 * 1000
+
+    assert disconnects == [player._disconnect_overflowed]
+    assert player.dequeue() is None
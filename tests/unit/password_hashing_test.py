@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import asyncio
+
+import bcrypt
+import pytest
+
+from app.usecases.password_hashing import BcryptPool
+
+PASSWORD = b"5f4dcc3b5aa765d61d8327deb882cf99"
+
+
+async def test_hashpw_and_checkpw():
+    pool = BcryptPool()
+    pool.start(workers=2)
+
+    hashed_password = await pool.hashpw(PASSWORD)
+
+    assert bcrypt.checkpw(PASSWORD, hashed_password)
+    assert await pool.checkpw(PASSWORD, hashed_password)
+    assert not await pool.checkpw(b"wrong", hashed_password)
+    assert pool.pending == 0
+    assert pool.run_time_ms.count == 3
+
+    await pool.stop()
+
+
+async def test_concurrent_checks_share_a_call():
+    pool = BcryptPool()
+    pool.start(workers=2)
+
+    hashed_password = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds=4))
+
+    results = await asyncio.gather(
+        *(pool.checkpw(PASSWORD, hashed_password) for _ in range(8)),
+    )
+
+    assert results == [True] * 8
+    assert pool.run_time_ms.count == 1
+
+    await pool.stop()
+
+
+async def test_stopped_pool_raises():
+    with pytest.raises(RuntimeError):
+        await BcryptPool().hashpw(PASSWORD)
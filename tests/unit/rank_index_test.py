@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import random
+
+from app.objects.rank_index import RankedSet
+from app.objects.rank_index import RankIndex
+
+
+def _expected_reverse_ranks(scores: dict[str, float]) -> dict[str, int]:
+    # redis orders by (score, member), ties broken lexicographically
+    ordered = sorted(scores, key=lambda member: (scores[member], member), reverse=True)
+    return {member: rank for rank, member in enumerate(ordered)}
+
+
+def test_ranked_set_matches_redis_ordering():
+    rng = random.Random(1)
+    ranked_set = RankedSet()
+    scores: dict[str, float] = {}
+
+    for _ in range(3000):
+        member = str(rng.randrange(500))
+        if rng.random() < 0.2:
+            assert ranked_set.remove(member) is (scores.pop(member, None) is not None)
+        else:
+            # few distinct scores, so there are plenty of ties
+            score = float(rng.randrange(50))
+            ranked_set.add(member, score)
+            scores[member] = score
+
+    assert len(ranked_set) == len(scores)
+    assert list(ranked_set) == sorted(
+        scores.items(),
+        key=lambda item: (item[1], item[0]),
+    )
+
+    expected = _expected_reverse_ranks(scores)
+    for member in map(str, range(500)):
+        assert ranked_set.reverse_rank(member) == expected.get(member)
+        assert ranked_set.score(member) == scores.get(member)
+
+
+def test_rank_index_global_and_country_ranks():
+    rank_index = RankIndex()
+    rank_index.update(3, "ca", 0, 500)
+    rank_index.update(4, "us", 0, 700)
+    rank_index.update(5, "ca", 0, 600)
+
+    assert rank_index.global_rank(3, 0) == 3
+    assert rank_index.country_rank(3, 0, "ca") == 2
+    assert rank_index.country_rank(4, 0, "us") == 1
+
+    # re-adding replaces the previous score
+    rank_index.update(3, "ca", 0, 800)
+    assert rank_index.global_rank(3, 0) == 1
+    assert rank_index.country_rank(3, 0, "ca") == 1
+
+    rank_index.remove(3, "ca", 0)
+    assert rank_index.global_rank(3, 0) == 0
+    assert rank_index.country_rank(3, 0, "ca") == 0
+    assert rank_index.global_rank(5, 0) == 2
+
+    # unknown modes & countries are unranked
+    assert rank_index.global_rank(4, 1) == 0
+    assert rank_index.country_rank(4, 0, "ca") == 0
+
+    assert dict(rank_index.items()).keys() == {
+        "bancho:leaderboard:0",
+        "bancho:leaderboard:0:ca",
+        "bancho:leaderboard:0:us",
+    }
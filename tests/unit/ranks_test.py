@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+from fnmatch import fnmatch
+from typing import Any
+
+import app.state
+import app.usecases.ranks
+from app.constants.gamemodes import GameMode
+from app.objects.rank_index import RankIndex
+
+
+class _FakeRedis:
+    """Sorted sets in memory, recording each pipeline's commands."""
+
+    def __init__(self) -> None:
+        self.sorted_sets: dict[str, dict[str, float]] = {}
+        self.executed: list[list[str]] = []
+
+    def pipeline(self, transaction: bool = True) -> _FakePipeline:
+        return _FakePipeline(self)
+
+    def zrevrank(self, key: str, member: str) -> int | None:
+        scores = self.sorted_sets.get(key, {})
+        if member not in scores:
+            return None
+        return sorted(scores, key=lambda m: (scores[m], m), reverse=True).index(member)
+
+    async def scan_iter(self, match: str) -> AsyncIterator[bytes]:
+        for key in list(self.sorted_sets):
+            if fnmatch(key, match):
+                yield key.encode()
+
+    async def zrange(
+        self,
+        key: str,
+        start: int,
+        end: int,
+        withscores: bool,
+    ) -> list[tuple[bytes, float]]:
+        scores = self.sorted_sets.get(key, {})
+        return [
+            (member.encode(), float(score))
+            for member, score in sorted(scores.items(), key=lambda i: (i[1], i[0]))
+        ]
+
+
+class _FakePipeline:
+    def __init__(self, redis: _FakeRedis) -> None:
+        self.redis = redis
+        self.commands: list[tuple[str, tuple[Any, ...]]] = []
+
+    async def __aenter__(self) -> _FakePipeline:
+        return self
+
+    async def __aexit__(self, *args: object) -> None: ...
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+    def zadd(self, key: str, mapping: dict[str, float]) -> _FakePipeline:
+        self.commands.append(("zadd", (key, mapping)))
+        return self
+
+    def zrem(self, key: str, member: str) -> _FakePipeline:
+        self.commands.append(("zrem", (key, member)))
+        return self
+
+    def zrevrank(self, key: str, member: str) -> _FakePipeline:
+        self.commands.append(("zrevrank", (key, member)))
+        return self
+
+    async def execute(self) -> list[Any]:
+        self.redis.executed.append([name for name, _ in self.commands])
+        results: list[Any] = []
+        for name, args in self.commands:
+            if name == "zadd":
+                key, mapping = args
+                self.redis.sorted_sets.setdefault(key, {}).update(mapping)
+                results.append(len(mapping))
+            elif name == "zrem":
+                key, member = args
+                results.append(
+                    int(
+                        self.redis.sorted_sets.get(key, {}).pop(member, None)
+                        is not None
+                    )
+                )
+            else:
+                results.append(self.redis.zrevrank(*args))
+        return results
+
+
+def _use_fake_redis(monkeypatch) -> _FakeRedis:
+    redis = _FakeRedis()
+    monkeypatch.setattr(app.state.services, "redis", redis)
+    monkeypatch.setattr(app.state.services, "datadog", None)
+    monkeypatch.setattr(app.state, "redis_stats", app.state.redis_stats.__class__())
+    monkeypatch.setattr(app.usecases.ranks, "index", None)
+    return redis
+
+
+async def test_update_is_a_single_round_trip(monkeypatch):
+    redis = _use_fake_redis(monkeypatch)
+
+    assert await app.usecases.ranks.update(3, "ca", GameMode.VANILLA_OSU, 500) == 1
+    assert await app.usecases.ranks.update(4, "ca", GameMode.VANILLA_OSU, 700) == 1
+
+    assert redis.executed == [["zadd", "zadd", "zrevrank"]] * 2
+    assert redis.sorted_sets["bancho:leaderboard:0:ca"] == {"3": 500, "4": 700}
+    assert app.state.redis_stats.round_trips == {"update_rank": 2}
+    assert app.state.redis_stats.commands == {"update_rank": 6}
+
+
+async def test_fetch_many_ranks(monkeypatch):
+    redis = _use_fake_redis(monkeypatch)
+    await app.usecases.ranks.add(3, "ca", {GameMode.VANILLA_OSU: 500})
+    await app.usecases.ranks.add(
+        4, "us", {GameMode.VANILLA_OSU: 700, GameMode.VANILLA_TAIKO: 10}
+    )
+    redis.executed.clear()
+
+    ranks = await app.usecases.ranks.fetch_many(3, modes=[0, 1], country="ca")
+
+    assert ranks == {
+        0: app.usecases.ranks.Ranks(global_rank=2, country_rank=1),
+        1: app.usecases.ranks.Ranks(global_rank=0, country_rank=0),
+    }
+    assert redis.executed == [["zrevrank"] * 4]
+
+    global_ranks = await app.usecases.ranks.fetch_many(4, modes=[0, 1])
+    assert global_ranks == {
+        0: app.usecases.ranks.Ranks(global_rank=1, country_rank=0),
+        1: app.usecases.ranks.Ranks(global_rank=1, country_rank=0),
+    }
+
+
+async def test_remove_from_all_leaderboards(monkeypatch):
+    redis = _use_fake_redis(monkeypatch)
+    await app.usecases.ranks.add(
+        3, "ca", {GameMode.VANILLA_OSU: 500, GameMode.RELAX_OSU: 900}
+    )
+
+    await app.usecases.ranks.remove(3, "ca")
+
+    assert all(not scores for scores in redis.sorted_sets.values())
+    assert len(redis.executed) == 2
+    assert len(redis.executed[1]) == 2 * len(app.usecases.ranks.LEADERBOARD_MODES)
+
+
+async def test_empty_pipelines_are_not_sent(monkeypatch):
+    redis = _use_fake_redis(monkeypatch)
+
+    assert await app.usecases.ranks.fetch_many(3, modes=[]) == {}
+    assert redis.executed == []
+    assert app.state.redis_stats.round_trips == {}
+
+
+async def test_ranks_are_read_from_the_index(monkeypatch):
+    redis = _use_fake_redis(monkeypatch)
+    monkeypatch.setattr(app.usecases.ranks, "index", RankIndex())
+
+    await app.usecases.ranks.update(3, "ca", GameMode.VANILLA_OSU, 500)
+    assert await app.usecases.ranks.update(4, "us", GameMode.VANILLA_OSU, 400) == 2
+
+    # the index is written through to redis, but never read from it
+    assert redis.executed == [["zadd", "zadd"]] * 2
+    assert await app.usecases.ranks.fetch_many(4, modes=[0], country="us") == {
+        0: app.usecases.ranks.Ranks(global_rank=2, country_rank=1),
+    }
+    assert len(redis.executed) == 2
+
+    await app.usecases.ranks.remove(3, "ca")
+    assert await app.usecases.ranks.fetch_many(4, modes=[0]) == {
+        0: app.usecases.ranks.Ranks(global_rank=1, country_rank=0),
+    }
+
+
+async def test_check_index_consistency(monkeypatch):
+    redis = _use_fake_redis(monkeypatch)
+    await app.usecases.ranks.add(3, "ca", {GameMode.VANILLA_OSU: 500})
+    await app.usecases.ranks.add(4, "us", {GameMode.VANILLA_OSU: 700})
+
+    rank_index = RankIndex()
+    rank_index.update(3, "ca", 0, 500)
+    rank_index.update(4, "us", 0, 650)  # stale score
+    rank_index.update(5, "de", 0, 100)  # missing from redis
+
+    mismatches = await app.usecases.ranks.check_index_consistency(rank_index)
+
+    RankMismatch = app.usecases.ranks.RankMismatch
+    assert mismatches == [
+        RankMismatch("bancho:leaderboard:0", "4", 700.0, 650.0),
+        RankMismatch("bancho:leaderboard:0", "5", None, 100.0),
+        RankMismatch("bancho:leaderboard:0:de", "5", None, 100.0),
+        RankMismatch("bancho:leaderboard:0:us", "4", 700.0, 650.0),
+    ]
+
+    redis.sorted_sets["bancho:leaderboard:0"].pop("4")
+    rank_index.update(4, "us", 0, 700)
+    rank_index.remove(5, "de", 0)
+
+    assert await app.usecases.ranks.check_index_consistency(rank_index) == [
+        RankMismatch("bancho:leaderboard:0", "4", None, 700.0),
+    ]
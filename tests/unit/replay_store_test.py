@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import time
+
+import pytest
+
+from app.adapters.replay_store import Codec
+from app.adapters.replay_store import ReplayStore
+from app.usecases.replays import ReplayStorage
+
+
+def _replay(rng: random.Random, size: int = 2000) -> bytes:
+    # like the client's replay frames; (mostly) incompressible lzma data
+    return rng.randbytes(size)
+
+
+def test_put_get(tmp_path):
+    rng = random.Random(1)
+    store = ReplayStore(tmp_path)
+    replays = {score_id: _replay(rng) for score_id in range(1, 51)}
+
+    for score_id, data in replays.items():
+        store.put(score_id, data)
+
+    assert len(store) == 50
+    for score_id, data in replays.items():
+        assert store.get(score_id) == data
+    assert store.get(51) is None
+
+    store.close()
+
+
+def test_reopen(tmp_path):
+    rng = random.Random(2)
+    store = ReplayStore(tmp_path)
+    replays = {score_id: _replay(rng) for score_id in range(1, 21)}
+    for score_id, data in replays.items():
+        store.put(score_id, data)
+    store.put(5, replays[5] + b"replaced")
+    store.close()
+
+    store = ReplayStore(tmp_path)
+    assert len(store) == 20
+    assert store.get(5) == replays[5] + b"replaced"
+    assert store.get(6) == replays[6]
+
+    store.put(21, b"appended after reopening")
+    assert store.get(21) == b"appended after reopening"
+    store.close()
+
+
+def test_opened_by_one_process_at_a_time(tmp_path):
+    store = ReplayStore(tmp_path)
+    with pytest.raises(RuntimeError):
+        ReplayStore(tmp_path)
+
+    store.close()
+    ReplayStore(tmp_path).close()
+
+
+def test_identical_replays_stored_once(tmp_path):
+    store = ReplayStore(tmp_path)
+    data = _replay(random.Random(3))
+
+    first = store.put(1, data)
+    second = store.put(2, data)
+
+    assert first == second
+    assert store.get(1) == store.get(2) == data
+    assert sum(p.stat().st_size for p in tmp_path.glob("*.seg")) == len(data)
+    store.close()
+
+
+def test_torn_index_record(tmp_path):
+    store = ReplayStore(tmp_path)
+    store.put(1, b"a" * 100)
+    store.put(2, b"b" * 100)
+    store.close()
+
+    # a record partially written, & a record whose data was lost
+    index_path = tmp_path / "index.bin"
+    index_data = index_path.read_bytes()
+    record_size = len(index_data) // 2
+    index_path.write_bytes(index_data + index_data[record_size:][:10])
+    segment_path = next(tmp_path.glob("*.seg"))
+    segment_path.write_bytes(segment_path.read_bytes()[:150])
+
+    store = ReplayStore(tmp_path)
+    assert store.get(1) == b"a" * 100
+    assert 2 not in store
+    assert index_path.stat().st_size == record_size * 2
+
+    store.put(3, b"c" * 100)
+    store.close()
+
+    store = ReplayStore(tmp_path)
+    assert store.get(3) == b"c" * 100
+    store.close()
+
+
+def test_segment_rollover(tmp_path):
+    rng = random.Random(4)
+    store = ReplayStore(tmp_path, segment_max_bytes=5000)
+    replays = {score_id: _replay(rng) for score_id in range(1, 11)}
+    for score_id, data in replays.items():
+        store.put(score_id, data)
+
+    assert len(list(tmp_path.glob("*.seg"))) == 5
+    for score_id, data in replays.items():
+        assert store.get(score_id) == data
+    store.close()
+
+
+def test_lzma_compression(tmp_path):
+    store = ReplayStore(tmp_path, compression=Codec.LZMA)
+
+    compressible = b"frame|" * 50_000
+    location = store.put(1, compressible)
+    assert location.codec is Codec.LZMA
+    assert location.stored_length < location.raw_length
+
+    # kept as is, when compressing it doesn't help
+    incompressible = _replay(random.Random(5))
+    assert store.put(2, incompressible).codec is Codec.NONE
+
+    # streamed in (decompressed) chunks
+    chunks = list(store.iter_chunks(location, chunk_size=128))
+    assert len(chunks) > 1
+    assert b"".join(chunks) == compressible
+
+    assert store.get(2) == incompressible
+    store.close()
+
+
+def test_zstd_compression_requires_zstandard(tmp_path):
+    try:
+        import zstandard  # noqa: F401
+    except ModuleNotFoundError:
+        with pytest.raises(RuntimeError):
+            ReplayStore(tmp_path, compression=Codec.ZSTD)
+    else:
+        store = ReplayStore(tmp_path, compression=Codec.ZSTD)
+        assert store.put(1, b"frame|" * 50_000).codec is Codec.ZSTD
+        assert store.get(1) == b"frame|" * 50_000
+        store.close()
+
+
+def test_storage_streams_with_legacy_fallback(tmp_path):
+    legacy_path = tmp_path / "osr"
+    legacy_path.mkdir()
+    (legacy_path / "1.osr").write_bytes(b"legacy" * 50_000)
+
+    async def run() -> None:
+        storage = ReplayStorage(legacy_path=legacy_path)
+        storage.start(tmp_path / "replays", workers=2)
+
+        await storage.save(2, b"stored" * 50_000)
+
+        for score_id, expected in ((1, b"legacy"), (2, b"stored")):
+            stream = await storage.open(score_id)
+            assert stream is not None
+            assert stream.size == len(expected) * 50_000
+
+            chunks = [chunk async for chunk in stream]
+            assert len(chunks) > 1
+            assert b"".join(chunks) == expected * 50_000
+
+        assert await storage.read(2) == b"stored" * 50_000
+        assert await storage.open(3) is None
+
+        await storage.stop()
+        with pytest.raises(RuntimeError):
+            await storage.read(2)
+
+    asyncio.run(run())
+
+
+def _dir_stats(path) -> tuple[int, int]:
+    """The number of files in `path` & the space they occupy on disk."""
+    files = [p for p in path.iterdir() if p.is_file()]
+    return len(files), sum(os.stat(p).st_blocks * 512 for p in files)
+
+
+def test_benchmark_replay_store(tmp_path, record_property):
+    rng = random.Random(6)
+    replays = [
+        (score_id, _replay(rng, rng.randrange(500, 50_000)))
+        for score_id in range(1, 1001)
+    ]
+
+    # as replays were stored before; a file per score
+    osr_path = tmp_path / "osr"
+    osr_path.mkdir()
+
+    started_at = time.perf_counter()
+    for score_id, data in replays:
+        (osr_path / f"{score_id}.osr").write_bytes(data)
+    osr_write_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for score_id, data in replays:
+        assert (osr_path / f"{score_id}.osr").read_bytes() == data
+    osr_read_time = time.perf_counter() - started_at
+
+    store = ReplayStore(tmp_path / "replays")
+
+    started_at = time.perf_counter()
+    for score_id, data in replays:
+        store.put(score_id, data)
+    store_write_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for score_id, data in replays:
+        assert store.get(score_id) == data
+    store_read_time = time.perf_counter() - started_at
+
+    store.close()
+
+    osr_files, osr_disk_bytes = _dir_stats(osr_path)
+    store_files, store_disk_bytes = _dir_stats(tmp_path / "replays")
+
+    per_op = 1_000_000 / len(replays)
+    record_property("file per score write", f"{osr_write_time * per_op:.0f}µs/op")
+    record_property("file per score read", f"{osr_read_time * per_op:.0f}µs/op")
+    record_property("replay store write", f"{store_write_time * per_op:.0f}µs/op")
+    record_property("replay store read", f"{store_read_time * per_op:.0f}µs/op")
+
+    assert store_files == 3  # a segment, the index & the lock file
+    assert osr_files == len(replays)
+    assert store_disk_bytes < osr_disk_bytes
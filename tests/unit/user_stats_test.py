@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+import app.state
+import app.usecases.user_stats
+from app.constants.gamemodes import GameMode
+from app.objects.beatmap import RankedStatus
+from app.objects.score import Grade
+from app.objects.score import Score
+from app.objects.score import SubmissionStatus
+from app.objects.user_stats import TOP_SCORES_KEPT
+from app.objects.user_stats import UserStats
+from app.repositories import stats as stats_repo
+
+
+def _recalculated(scores: dict[int, tuple[float, float]]) -> tuple[int, float]:
+    """Calculate pp & acc from all best scores, as the sql recalculation does."""
+    ordered = sorted(
+        ((pp, acc, score_id) for score_id, (pp, acc) in scores.items()),
+        reverse=True,
+    )
+    if not ordered:
+        return 0, 0.0
+
+    weights = [0.95**i for i in range(len(ordered))]
+    weighted_pp = sum(w * pp for w, (pp, _, _) in zip(weights, ordered))
+    bonus_pp = (1 - 0.9994 ** len(ordered)) * 416.6667
+    acc = sum(w * acc for w, (_, acc, _) in zip(weights, ordered)) / sum(weights)
+    return int(weighted_pp + bonus_pp + 0.5), acc
+
+
+def test_empty_stats():
+    user_stats = UserStats()
+
+    assert user_stats.pp == 0
+    assert user_stats.acc == 0.0
+    assert user_stats.playtime == 0
+
+
+def test_add_play():
+    user_stats = UserStats()
+    user_stats.add_play(
+        score=1000,
+        max_combo=300,
+        total_hits=500,
+        time_elapsed=1500,
+        grade="S",
+    )
+    user_stats.add_play(
+        score=500,
+        max_combo=100,
+        total_hits=200,
+        time_elapsed=999,
+        grade="F",
+    )
+
+    assert user_stats.tscore == 1500
+    assert user_stats.plays == 2
+    assert user_stats.max_combo == 300
+    assert user_stats.total_hits == 700
+    assert user_stats.playtime == 2  # 2.499s
+    assert user_stats.grades == {"S": 1}
+    assert user_stats.modified
+
+
+def test_best_scores_match_recalculation():
+    rng = random.Random(1)
+    user_stats = UserStats()
+    scores: dict[int, tuple[float, float]] = {}
+
+    for score_id in range(1, 301):
+        if scores and rng.random() < 0.3:
+            # a previous best score is replaced by a better one
+            prev_id = rng.choice(list(scores))
+            prev_pp, prev_acc = scores.pop(prev_id)
+            user_stats.remove_best(prev_id, prev_pp, prev_acc)
+
+            pp = round(prev_pp + rng.uniform(0, 50), 3)
+        else:
+            pp = round(rng.uniform(1, 500), 3)
+
+        acc = round(rng.uniform(80, 100), 3)
+        scores[score_id] = (pp, acc)
+        user_stats.add_best(score_id, pp, acc)
+
+        pp_expected, acc_expected = _recalculated(scores)
+        assert user_stats.pp == pp_expected
+        assert user_stats.acc == pytest.approx(acc_expected)
+
+    assert user_stats.ranked_count == len(scores)
+
+
+def test_only_top_scores_kept():
+    user_stats = UserStats()
+    for score_id in range(1, TOP_SCORES_KEPT + 11):
+        user_stats.add_best(score_id, pp=float(score_id), acc=95.0)
+
+    assert len(user_stats.top_scores) == TOP_SCORES_KEPT
+    assert user_stats.ranked_count == TOP_SCORES_KEPT + 10
+
+    # a score beyond those kept is still uncounted from bonus pp
+    user_stats.remove_best(1, pp=1.0, acc=95.0)
+    assert len(user_stats.top_scores) == TOP_SCORES_KEPT
+    assert user_stats.ranked_count == TOP_SCORES_KEPT + 9
+
+
+def test_serialization_round_trip():
+    user_stats = UserStats()
+    user_stats.add_play(
+        score=1000,
+        max_combo=300,
+        total_hits=500,
+        time_elapsed=1500,
+        grade="XH",
+    )
+    user_stats.add_best(7, pp=123.4567, acc=99.12)
+    user_stats.add_best(8, pp=50.0, acc=97.5)
+
+    loaded = UserStats.from_dict(json.loads(json.dumps(user_stats.to_dict())))
+
+    assert loaded == user_stats
+    assert loaded.pp == user_stats.pp
+
+
+def _stats_from_scores(rows: list[dict[str, Any]]) -> UserStats:
+    """Build stats from a player's scores, as they're loaded from sql."""
+    user_stats = UserStats()
+    for row in rows:
+        user_stats.add_play(
+            score=row["score"],
+            max_combo=row["max_combo"],
+            total_hits=row["total_hits"],
+            time_elapsed=row["time_elapsed"],
+            grade=row["grade"],
+        )
+        if row["status"] == SubmissionStatus.BEST:
+            user_stats.rscore += row["score"]
+            user_stats.add_best(row["id"], row["pp"], row["acc"])
+
+    user_stats.modified = False
+    return user_stats
+
+
+@pytest.mark.parametrize("has_prev_best", [False, True])
+def test_submit_score_after_cache_miss(monkeypatch, has_prev_best):
+    # the player's scores, in sql
+    rows: list[dict[str, Any]] = []
+
+    async def load_from_sql(player_id: int, mode: int) -> UserStats:
+        return _stats_from_scores(rows)
+
+    class FakeRedis:
+        async def get(self, key: str) -> None:
+            return None
+
+    async def noop(*args: Any, **kwargs: Any) -> None:
+        return None
+
+    monkeypatch.setattr(app.usecases.user_stats, "_cache", OrderedDict())
+    monkeypatch.setattr(app.usecases.user_stats, "_load_from_sql", load_from_sql)
+    monkeypatch.setattr(app.usecases.user_stats, "_store", noop)
+    monkeypatch.setattr(app.state.services, "redis", FakeRedis())
+    monkeypatch.setattr(stats_repo, "partial_update", noop)
+
+    def make_score(score_id: int, pp: float) -> Score:
+        score = Score()
+        score.id = score_id
+        score.player = SimpleNamespace(id=1)  # type: ignore[assignment]
+        score.bmap = SimpleNamespace(status=RankedStatus.Ranked)  # type: ignore[assignment]
+        score.mode = GameMode.VANILLA_OSU
+        score.score = score_id * 1000
+        score.max_combo = 100
+        score.n300, score.n100, score.n50 = 90, 5, 5
+        score.ngeki = score.nkatu = 0
+        score.time_elapsed = 60_000
+        score.grade = Grade.S
+        score.pp = pp
+        score.acc = 95.0
+        score.status = SubmissionStatus.BEST
+        return score
+
+    def as_row(score: Score) -> dict[str, Any]:
+        return {
+            "id": score.id,
+            "score": score.score,
+            "max_combo": score.max_combo,
+            "total_hits": score.n300 + score.n100 + score.n50,
+            "time_elapsed": score.time_elapsed,
+            "grade": score.grade.name,
+            "status": score.status,
+            "pp": score.pp,
+            "acc": score.acc,
+        }
+
+    prev_best = make_score(1, pp=100.0)
+    if has_prev_best:
+        rows.append(as_row(prev_best))
+
+    score = make_score(2, pp=150.0)
+    score.prev_best = prev_best if has_prev_best else None
+
+    async def submit() -> UserStats:
+        # as score submission does; fetched before the score is inserted
+        user_stats = await app.usecases.user_stats.fetch(1, score.mode.value)
+
+        for row in rows:
+            row["status"] = SubmissionStatus.SUBMITTED
+        rows.append(as_row(score))
+
+        return await app.usecases.user_stats.submit_score(score, user_stats)
+
+    user_stats = asyncio.run(submit())
+    expected = _stats_from_scores(rows)
+
+    assert user_stats.plays == expected.plays
+    assert user_stats.tscore == expected.tscore
+    assert user_stats.rscore == expected.rscore
+    assert user_stats.total_hits == expected.total_hits
+    assert user_stats.playtime_ms == expected.playtime_ms
+    assert user_stats.grades == expected.grades
+    assert user_stats.top_scores == expected.top_scores
+    assert user_stats.pp == expected.pp
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3.11
+"""\
+Migrate replays stored as a file per score (in .data/osr) into the replay
+store (in .data/replays). bancho.py must be stopped while this runs; the
+store can only be opened by one process at a time.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from collections.abc import Sequence
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.pardir))
+os.chdir(os.path.abspath(os.pardir))
+
+try:
+    import app.settings
+    from app.adapters.replay_store import Codec
+    from app.adapters.replay_store import ReplayStore
+except ModuleNotFoundError:
+    print("\x1b[;91mMust run from tools/ directory\x1b[m")
+    raise
+
+LEGACY_REPLAYS_PATH = Path.cwd() / ".data/osr"
+REPLAY_STORE_PATH = Path.cwd() / ".data/replays"
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    argv = argv if argv is not None else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(
+        description="Migrates replays from .data/osr into the replay store.",
+    )
+    parser.add_argument(
+        "--compression",
+        help="Recompress replays when it makes them smaller",
+        choices=["none", "lzma", "zstd"],
+        default=app.settings.REPLAY_STORE_COMPRESSION,
+    )
+    parser.add_argument(
+        "--delete",
+        help="Delete each replay file once it's been migrated & verified",
+        action="store_true",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        store = ReplayStore(
+            REPLAY_STORE_PATH,
+            compression=Codec[args.compression.upper()],
+            segment_max_bytes=app.settings.REPLAY_STORE_SEGMENT_MAX_BYTES,
+        )
+    except RuntimeError as exc:
+        print(f"\x1b[;91m{exc}; is bancho.py running?\x1b[m")
+        return 1
+
+    migrated = skipped = failed = 0
+    raw_bytes = stored_bytes = 0
+
+    try:
+        for replay_file in sorted(LEGACY_REPLAYS_PATH.glob("*.osr")):
+            if not replay_file.stem.isdigit():
+                print(f"Skipping {replay_file.name} (not named by score id)")
+                skipped += 1
+                continue
+
+            score_id = int(replay_file.stem)
+            replay_data = replay_file.read_bytes()
+
+            if score_id in store:
+                # migrated by a previous run, or since submitted
+                if store.get(score_id) != replay_data:
+                    print(f"Skipping {replay_file.name} (a different replay is stored)")
+                    skipped += 1
+                    continue
+            else:
+                location = store.put(score_id, replay_data)
+                if store.get(score_id) != replay_data:
+                    print(f"Failed to verify {replay_file.name}")
+                    failed += 1
+                    continue
+
+                raw_bytes += location.raw_length
+                stored_bytes += location.stored_length
+                migrated += 1
+
+            if args.delete:
+                replay_file.unlink()
+    finally:
+        store.close()
+
+    print(
+        f"Migrated {migrated} replays ({raw_bytes:,} -> {stored_bytes:,} bytes), "
+        f"skipped {skipped}, failed {failed}.",
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())